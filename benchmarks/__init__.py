@@ -0,0 +1,6 @@
+import statistics
+
+
+def percentile(values: list[float], q: int) -> float:
+    """Перцентиль q (1..99) выборки задержек."""
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else values[0]
@@ -0,0 +1,87 @@
+"""
+Генератор синтетического каталога для бенчмарков.
+
+Заполняет тестовую БД (settings.database_test_url) продавцами и книгами одним INSERT ... SELECT generate_series
+на таблицу, поэтому миллион книг создается за секунды. Данные детерминированы: продавец n имеет email
+seller{n}@bench.local и пароль BENCH_PASSWORD, книги равномерно распределены по продавцам, годам и авторам.
+
+Запуск:
+    python -m benchmarks.generator --sellers 1000 --books 100000
+"""
+
+import argparse
+import asyncio
+import time
+from dataclasses import dataclass
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from src.configurations.migrations import migrate
+from src.configurations.settings import settings
+from src.models import BaseModel
+from src.tools import hash_password
+
+# Пароль всех сгенерированных продавцов. Хэш считается один раз и общий для всех строк.
+BENCH_PASSWORD = 'Bench-pass1'
+AUTHORS_COUNT = 1000
+
+SELLERS_SQL = text(
+    """
+    INSERT INTO sellers_table (first_name, last_name, email, hashed_password)
+    SELECT 'Seller', 'No ' || n, 'seller' || n || '@bench.local', :hashed_password
+    FROM generate_series(1, :sellers) AS n
+    """
+)
+
+BOOKS_SQL = text(
+    """
+    INSERT INTO books_table (title, author, year, count_pages, seller_id)
+    SELECT 'Book ' || n, 'Author ' || n % :authors, 1900 + n % 125, 50 + n % 950, 1 + n % :sellers
+    FROM generate_series(1, :books) AS n
+    """
+)
+
+
+@dataclass
+class Catalog:
+    sellers: int
+    books: int
+
+    def seller_email(self, n: int) -> str:
+        return f'seller{n}@bench.local'
+
+
+async def create_tables(engine: AsyncEngine) -> None:
+    """Пересоздает схему миграциями, как при старте приложения (вместе с триггерами статистики)."""
+    async with engine.begin() as connection:
+        await connection.run_sync(BaseModel.metadata.drop_all)
+        await connection.execute(text('DROP TABLE IF EXISTS schema_version'))
+    await migrate(engine)
+
+
+async def seed_catalog(engine: AsyncEngine, sellers: int, books: int) -> Catalog:
+    """Пересоздает данные каталога. Идентификаторы продавцов и книг — 1..sellers и 1..books."""
+    async with engine.begin() as connection:
+        await connection.execute(text('TRUNCATE books_table, sellers_table RESTART IDENTITY CASCADE'))
+        await connection.execute(SELLERS_SQL, {'sellers': sellers, 'hashed_password': hash_password(BENCH_PASSWORD)})
+        await connection.execute(BOOKS_SQL, {'books': books, 'sellers': sellers, 'authors': AUTHORS_COUNT})
+        await connection.execute(text('ANALYZE books_table, sellers_table'))
+    return Catalog(sellers=sellers, books=books)
+
+
+async def main(sellers: int, books: int) -> None:
+    engine = create_async_engine(settings.database_test_url)
+    await create_tables(engine)
+    started_at = time.perf_counter()
+    await seed_catalog(engine, sellers, books)
+    print(f'{sellers} sellers and {books} books seeded in {time.perf_counter() - started_at:.1f} s')
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sellers', type=int, default=1000)
+    parser.add_argument('--books', type=int, default=100_000)
+    args = parser.parse_args()
+    asyncio.run(main(args.sellers, args.books))
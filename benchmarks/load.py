@@ -0,0 +1,246 @@
+"""
+Нагрузочный бенчмарк основных сценариев API: список книг, книга по id, создание, изменение и выдача токена.
+
+Каталог генерируется в тестовой БД (см. benchmarks.generator), затем каждый сценарий выполняется
+--concurrency параллельными клиентами. По умолчанию запросы идут в приложение через ASGI-транспорт httpx,
+как в тестах; с --base-url — в запущенный uvicorn, который должен смотреть в ту же БД (DB_NAME=<db_test_name>).
+
+Результат (req/s и перцентили задержки по сценариям) пишется в JSON (по умолчанию benchmarks/results.json,
+файл в .gitignore). Если есть сохраненный baseline,
+результаты сравниваются с ним: падение req/s или рост p95 больше чем на --tolerance считается регрессией,
+и процесс завершается с кодом 1.
+
+Запуск:
+    python -m benchmarks.load --save-baseline      # замерить и сохранить baseline
+    python -m benchmarks.load                      # замерить и сравнить с baseline
+    python -m benchmarks.load --base-url http://127.0.0.1:8000 --skip-seed
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+import httpx
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+
+from benchmarks import percentile
+from benchmarks.generator import BENCH_PASSWORD, Catalog, create_tables, seed_catalog
+from src.configurations.database import (
+    get_async_read_session,
+    get_async_session,
+    get_read_session_factory,
+    get_session_factory,
+)
+from src.configurations.settings import settings
+from src.main import app
+from src.tools import generate_token
+
+DEFAULT_OUTPUT = Path('benchmarks/results.json')
+DEFAULT_BASELINE = Path('benchmarks/baseline.json')
+
+
+@dataclass
+class LoadContext:
+    catalog: Catalog
+    headers: dict[str, str]
+
+
+Scenario = Callable[[httpx.AsyncClient, random.Random, LoadContext], Awaitable[httpx.Response]]
+
+
+def _book(rng: random.Random) -> dict:
+    return {'title': f'Load {rng.random()}', 'author': 'Load Author', 'year': rng.randint(1900, 2024), 'pages': 300}
+
+
+async def list_books(client: httpx.AsyncClient, rng: random.Random, context: LoadContext) -> httpx.Response:
+    year = rng.randint(1900, 2024)
+    return await client.get('/api/v1/books/', params={'limit': 20, 'year_from': year, 'year_to': year})
+
+
+async def get_book(client: httpx.AsyncClient, rng: random.Random, context: LoadContext) -> httpx.Response:
+    return await client.get(f'/api/v1/books/{rng.randint(1, context.catalog.books)}')
+
+
+async def create_book(client: httpx.AsyncClient, rng: random.Random, context: LoadContext) -> httpx.Response:
+    return await client.post('/api/v1/books/', json=_book(rng), headers=context.headers)
+
+
+async def update_book(client: httpx.AsyncClient, rng: random.Random, context: LoadContext) -> httpx.Response:
+    book_id = rng.randint(1, context.catalog.books)
+    return await client.put(f'/api/v1/books/{book_id}', json=_book(rng), headers=context.headers)
+
+
+async def issue_token(client: httpx.AsyncClient, rng: random.Random, context: LoadContext) -> httpx.Response:
+    email = context.catalog.seller_email(rng.randint(1, context.catalog.sellers))
+    return await client.post('/api/v1/token/', data={'username': email, 'password': BENCH_PASSWORD})
+
+
+SCENARIOS: dict[str, Scenario] = {
+    'list': list_books,
+    'get': get_book,
+    'create': create_book,
+    'update': update_book,
+    'token': issue_token,
+}
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    context: LoadContext,
+    requests: int,
+    concurrency: int,
+) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    remaining = iter(range(requests))  # общий для всех клиентов счетчик запросов
+
+    async def worker(seed: int) -> None:
+        nonlocal errors
+        rng = random.Random(seed)
+        for _ in remaining:
+            started_at = time.perf_counter()
+            try:
+                response = await scenario(client, rng, context)
+                failed = response.is_error
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - started_at)
+            errors += failed
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(worker(seed) for seed in range(concurrency)))
+    elapsed = time.perf_counter() - started_at
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def use_database(engine: AsyncEngine) -> None:
+    """Переключает зависимости приложения на переданный движок (сессии устроены как в src.configurations)."""
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    read_session_factory = async_sessionmaker(engine.execution_options(isolation_level='AUTOCOMMIT'))
+
+    async def get_session():
+        async with session_factory() as session:
+            yield session
+            await session.commit()
+
+    async def get_read_session():
+        async with read_session_factory() as session:
+            yield session
+
+    app.dependency_overrides[get_async_session] = get_session
+    app.dependency_overrides[get_async_read_session] = get_read_session
+    app.dependency_overrides[get_session_factory] = lambda: session_factory
+    app.dependency_overrides[get_read_session_factory] = lambda: read_session_factory
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Возвращает описания регрессий относительно baseline."""
+    regressions = []
+    for name, current in results['scenarios'].items():
+        if (base := baseline['scenarios'].get(name)) is None:
+            continue
+        if current['rps'] < base['rps'] * (1 - tolerance):
+            regressions.append(f'{name}: {current["rps"]} req/s vs {base["rps"]} in baseline')
+        if current['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f'{name}: p95 {current["p95_ms"]} ms vs {base["p95_ms"]} in baseline')
+    return regressions
+
+
+def print_results(results: dict, baseline: Optional[dict]) -> None:
+    print(f'{"scenario":<10} {"req/s":>10} {"p50, ms":>10} {"p95, ms":>10} {"p99, ms":>10} {"errors":>8}')
+    for name, result in results['scenarios'].items():
+        print(
+            f'{name:<10} {result["rps"]:>10} {result["p50_ms"]:>10} {result["p95_ms"]:>10} '
+            f'{result["p99_ms"]:>10} {result["errors"]:>8}'
+        )
+        if baseline and (base := baseline['scenarios'].get(name)):
+            print(f'{"baseline":>10} {base["rps"]:>10} {base["p50_ms"]:>10} {base["p95_ms"]:>10} {base["p99_ms"]:>10}')
+
+
+async def main(args: argparse.Namespace) -> int:
+    engine = create_async_engine(
+        settings.database_test_url,
+        pool_size=settings.max_connection_count,
+        max_overflow=settings.db_pool_max_overflow,
+    )
+    if args.skip_seed:
+        catalog = Catalog(sellers=args.sellers, books=args.books)
+    else:
+        await create_tables(engine)
+        catalog = await seed_catalog(engine, args.sellers, args.books)
+
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=60)
+    else:
+        use_database(engine)
+        client = httpx.AsyncClient(app=app, base_url='http://bench', timeout=60)
+
+    context = LoadContext(
+        catalog=catalog,
+        headers={'Authorization': f'Bearer {generate_token(claims={"sub": catalog.seller_email(1)})}'},
+    )
+    results = {
+        'meta': {
+            'target': args.base_url or 'asgi',
+            'sellers': catalog.sellers,
+            'books': catalog.books,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'python': platform.python_version(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'scenarios': {},
+    }
+    async with client:
+        for name in args.scenarios:
+            await run_scenario(client, SCENARIOS[name], context, requests=args.concurrency, concurrency=1)  # прогрев
+            results['scenarios'][name] = await run_scenario(
+                client, SCENARIOS[name], context, requests=args.requests, concurrency=args.concurrency
+            )
+
+    app.dependency_overrides.clear()
+    await engine.dispose()
+
+    args.output.write_text(json.dumps(results, indent=2))
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2))
+        print(f'Baseline saved to {args.baseline}')
+
+    baseline = None if args.save_baseline or not args.baseline.exists() else json.loads(args.baseline.read_text())
+    print_results(results, baseline)
+    if baseline and (regressions := compare(results, baseline, args.tolerance)):
+        print('\nRegressions:\n' + '\n'.join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sellers', type=int, default=1000)
+    parser.add_argument('--books', type=int, default=100_000)
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=2000, help='запросов на сценарий')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--base-url', help='адрес запущенного приложения вместо ASGI-транспорта')
+    parser.add_argument('--skip-seed', action='store_true', help='не пересоздавать каталог')
+    parser.add_argument('--output', type=Path, default=DEFAULT_OUTPUT)
+    parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='допустимое ухудшение, доля')
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,112 @@
+"""
+Бенчмарк изменяющих эндпоинтов: PUT и DELETE для книг и продавцов.
+
+Тестовая БД (settings.database_test_url) заполняется продавцами с книгами, после чего через ASGI-транспорт httpx
+каждая книга и каждый продавец по очереди обновляются и удаляются. Сессии коммитятся так же, как в приложении,
+поэтому в задержку входят все обращения к БД внутри запроса. Удаление продавца удаляет и его книги.
+
+Запуск:
+    python -m benchmarks.mutations --sellers 200 --books-per-seller 5
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from benchmarks import percentile
+from benchmarks.generator import create_tables
+from src.configurations.database import get_async_session, get_session_factory
+from src.configurations.settings import settings
+from src.main import app
+from src.models import Seller
+from src.tools import get_current_seller
+
+SEED_SQL = text(
+    """
+    WITH sellers AS (
+        INSERT INTO sellers_table (first_name, last_name, email, hashed_password)
+        SELECT 'Bench', 'Seller', 'bench' || n || '@example.com', '-' FROM generate_series(1, :sellers) AS n
+        RETURNING id
+    )
+    INSERT INTO books_table (title, author, year, count_pages, seller_id)
+    SELECT 'Title ' || n, 'Author ' || n, 2000, 100, sellers.id
+    FROM sellers, generate_series(1, :books_per_seller) AS n
+    """
+)
+
+
+async def seed(engine, sellers: int, books_per_seller: int) -> tuple[list[int], list[int]]:
+    async with engine.begin() as connection:
+        await connection.execute(text('TRUNCATE books_table, sellers_table RESTART IDENTITY CASCADE'))
+        await connection.execute(SEED_SQL, {'sellers': sellers, 'books_per_seller': books_per_seller})
+        await connection.execute(text('ANALYZE books_table, sellers_table'))
+        seller_ids = (await connection.execute(text('SELECT id FROM sellers_table ORDER BY id'))).scalars().all()
+        book_ids = (await connection.execute(text('SELECT id FROM books_table ORDER BY id'))).scalars().all()
+    return list(seller_ids), list(book_ids)
+
+
+async def measure(client: httpx.AsyncClient, method: str, urls: list[str], json=None) -> list[float]:
+    latencies = []
+    for url in urls:
+        started_at = time.perf_counter()
+        response = await client.request(method, url, json=json)
+        latencies.append(time.perf_counter() - started_at)
+        response.raise_for_status()
+    return latencies
+
+
+async def update_sellers(client: httpx.AsyncClient, seller_ids: list[int], seller: dict) -> list[float]:
+    # Email уникален, поэтому у каждого продавца он свой.
+    latencies = []
+    for seller_id in seller_ids:
+        payload = {**seller, 'email': f'new{seller_id}@example.com'}
+        latencies += await measure(client, 'PUT', [f'/api/v1/seller/{seller_id}'], json=payload)
+    return latencies
+
+
+def report(name: str, latencies: list[float]) -> None:
+    print(f'{name:<16} {percentile(latencies, 50) * 1000:>10.2f} {percentile(latencies, 99) * 1000:>10.2f}')
+
+
+async def main(sellers: int, books_per_seller: int) -> None:
+    engine = create_async_engine(settings.database_test_url)
+    await create_tables(engine)
+
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def get_bench_session():
+        async with session_factory() as session:
+            yield session
+            await session.commit()
+
+    # Авторизация не входит в измеряемую работу.
+    app.dependency_overrides[get_async_session] = get_bench_session
+    app.dependency_overrides[get_session_factory] = lambda: session_factory
+    app.dependency_overrides[get_current_seller] = lambda: Seller()
+
+    book = {'title': 'New title', 'author': 'New author', 'year': 2001, 'pages': 200}
+    seller = {'first_name': 'New', 'last_name': 'Name'}
+
+    print(f'{"endpoint":<16} {"p50, ms":>10} {"p99, ms":>10}')
+    async with httpx.AsyncClient(app=app, base_url='http://bench') as client:
+        seller_ids, book_ids = await seed(engine, sellers, books_per_seller)
+        half = len(book_ids) // 2
+        report('PUT /books', await measure(client, 'PUT', [f'/api/v1/books/{i}' for i in book_ids], json=book))
+        report('DELETE /books', await measure(client, 'DELETE', [f'/api/v1/books/{i}' for i in book_ids[:half]]))
+        report('PUT /seller', await update_sellers(client, seller_ids, seller))
+        report('DELETE /seller', await measure(client, 'DELETE', [f'/api/v1/seller/{i}' for i in seller_ids]))
+
+    app.dependency_overrides.clear()
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sellers', type=int, default=200)
+    parser.add_argument('--books-per-seller', type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.sellers, args.books_per_seller))
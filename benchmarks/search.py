@@ -0,0 +1,122 @@
+"""
+Бенчмарк полнотекстового поиска книг (GET /api/v1/books/search).
+
+Для каждого размера каталога тестовая БД (settings.database_test_url) заполняется заново,
+после чего через ASGI-транспорт httpx выполняются поисковые запросы и измеряются перцентили задержки.
+Словарь растет вместе с каталогом, поэтому каждый запрос находит примерно одинаковое число книг —
+при работающем GIN-индексе время ответа не должно зависеть от размера таблицы.
+
+Запуск:
+    python -m benchmarks.search --sizes 10000 100000 1000000
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from benchmarks import percentile
+from benchmarks.generator import create_tables
+from src.configurations.database import get_async_read_session
+from src.configurations.settings import settings
+from src.main import app
+
+# Каждое слово словаря встречается примерно в WORD_FREQUENCY книгах.
+WORD_FREQUENCY = 20
+
+SEED_SQL = text(
+    """
+    INSERT INTO books_table (title, author, year, count_pages, seller_id)
+    SELECT
+        'w' || (random() * :vocabulary)::int || ' w' || (random() * :vocabulary)::int,
+        'a' || (random() * :vocabulary)::int,
+        1900 + (random() * 124)::int,
+        50 + (random() * 950)::int,
+        :seller_id
+    FROM generate_series(1, :size)
+    """
+)
+
+
+async def seed(engine, size: int) -> int:
+    """Заполняет каталог size книгами и возвращает размер словаря."""
+    vocabulary = max(size // WORD_FREQUENCY, 100)
+    async with engine.begin() as connection:
+        await connection.execute(text('TRUNCATE books_table, sellers_table RESTART IDENTITY CASCADE'))
+        seller_id = (
+            await connection.execute(
+                text(
+                    "INSERT INTO sellers_table (first_name, last_name, email, hashed_password) "
+                    "VALUES ('Bench', 'Seller', 'bench@example.com', '-') RETURNING id"
+                )
+            )
+        ).scalar_one()
+        await connection.execute(SEED_SQL, {'vocabulary': vocabulary, 'seller_id': seller_id, 'size': size})
+        await connection.execute(text('ANALYZE books_table'))
+    return vocabulary
+
+
+async def measure(client: httpx.AsyncClient, vocabulary: int, requests: int) -> list[float]:
+    latencies = []
+    for _ in range(requests):
+        # Полное слово и префикс из двух-трех цифр ('w1234', 'a56').
+        word = f'{random.choice("wa")}{random.randrange(vocabulary)}'
+        started_at = time.perf_counter()
+        response = await client.get('/api/v1/books/search', params={'q': word, 'limit': 20})
+        latencies.append(time.perf_counter() - started_at)
+        response.raise_for_status()
+    return latencies
+
+
+async def explain(engine) -> str:
+    async with engine.connect() as connection:
+        plan = await connection.execute(
+            text(
+                "EXPLAIN SELECT id FROM books_table WHERE "
+                "(setweight(to_tsvector('simple'::regconfig, title), 'A') || "
+                "setweight(to_tsvector('simple'::regconfig, author), 'B')) @@ to_tsquery('simple'::regconfig, 'w1:*')"
+            )
+        )
+        return '\n'.join(row[0] for row in plan)
+
+
+async def main(sizes: list[int], requests: int) -> None:
+    engine = create_async_engine(settings.database_test_url)
+    await create_tables(engine)
+
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def get_bench_session():
+        async with session_factory() as session:
+            yield session
+
+    app.dependency_overrides[get_async_read_session] = get_bench_session
+
+    print(f'{"rows":>10} {"p50, ms":>10} {"p95, ms":>10} {"p99, ms":>10}')
+    async with httpx.AsyncClient(app=app, base_url='http://bench') as client:
+        for size in sizes:
+            vocabulary = await seed(engine, size)
+            await measure(client, vocabulary, requests=10)  # прогрев
+            latencies = await measure(client, vocabulary, requests)
+            print(
+                f'{size:>10} {percentile(latencies, 50) * 1000:>10.2f} '
+                f'{percentile(latencies, 95) * 1000:>10.2f} {percentile(latencies, 99) * 1000:>10.2f}'
+            )
+
+    print('\nПлан запроса на последнем размере:')
+    print(await explain(engine))
+
+    app.dependency_overrides.clear()
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.requests))
@@ -0,0 +1,77 @@
+"""
+Бенчмарк сериализации больших списков книг: ORM-объекты + response_model против строк + RowSerializer.
+
+Для каждого размера каталог в тестовой БД (settings.database_test_url) генерируется заново, затем весь список
+(как при full_scan) читается и сериализуется обоими способами. Отдельно измеряются чтение из БД и сериализация;
+тела ответов сравниваются побайтно.
+
+Запуск:
+    python -m benchmarks.serialization --sizes 10000 100000 1000000
+"""
+
+import argparse
+import asyncio
+import gc
+import time
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from benchmarks.generator import create_tables, seed_catalog
+from src.configurations.settings import settings
+from src.models import Book
+from src.schemas import ReturnedAllBooks
+from src.tools import book_rows, dump_response
+
+
+async def measure_orm(session_factory) -> tuple[float, float, bytes]:
+    async with session_factory() as session:
+        started_at = time.perf_counter()
+        books = (await session.execute(select(Book).order_by(Book.id))).scalars().all()
+        fetched_at = time.perf_counter()
+        body = dump_response(ReturnedAllBooks, {'books': books, 'next_cursor': None})
+        return fetched_at - started_at, time.perf_counter() - fetched_at, body
+
+
+async def measure_rows(session_factory) -> tuple[float, float, bytes]:
+    async with session_factory() as session:
+        started_at = time.perf_counter()
+        rows = (await session.execute(select(*book_rows.columns).order_by(Book.id))).all()
+        fetched_at = time.perf_counter()
+        body = book_rows.dump_page('books', rows)
+        return fetched_at - started_at, time.perf_counter() - fetched_at, body
+
+
+async def main(sizes: list[int]) -> None:
+    engine = create_async_engine(settings.database_test_url)
+    await create_tables(engine)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    print(f'{"rows":>9} {"path":>6} {"fetch, ms":>11} {"dump, ms":>10} {"total, ms":>11} {"speedup":>8}')
+    for size in sizes:
+        await seed_catalog(engine, sellers=100, books=size)
+        await measure_rows(session_factory)  # прогрев
+
+        results = {}
+        for name, measure in (('orm', measure_orm), ('rows', measure_rows)):
+            gc.collect()
+            results[name] = await measure(session_factory)
+
+        assert results['orm'][2] == results['rows'][2], 'responses differ'
+        orm_total = sum(results['orm'][:2])
+        for name, (fetch, dump, _) in results.items():
+            total = fetch + dump
+            print(
+                f'{size:>9} {name:>6} {fetch * 1000:>11.1f} {dump * 1000:>10.1f} {total * 1000:>11.1f} '
+                f'{orm_total / total:>7.1f}x'
+            )
+        results.clear()
+
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes))
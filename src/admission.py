@@ -0,0 +1,93 @@
+"""
+Admission control: ограничение числа одновременно обрабатываемых запросов по группам ручек.
+
+Когда БД замедляется, запросы копятся в event loop и в очереди пула соединений, и задержка растет у всех ручек
+сразу. Лимитер держит не больше limit запросов группы в работе; остальные ждут в очереди ограниченной длины
+не дольше queue_timeout, а при переполненной очереди получают отказ сразу — клиенту лучше быстро получить 503,
+чем ждать ответа, который уже никому не нужен.
+"""
+
+import asyncio
+from collections import deque
+
+__all__ = ['AdmissionController', 'ConcurrencyLimiter']
+
+
+class ConcurrencyLimiter:
+    """Семафор с ограниченной очередью ожидания и таймаутом. Слоты выдаются ожидающим в порядке очереди."""
+
+    def __init__(self, limit: int, queue_size: int, queue_timeout: float):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._in_flight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._admitted = 0
+        self._queued = 0
+        self._rejected = 0
+        self._timeouts = 0
+
+    async def acquire(self) -> bool:
+        """Занимает слот. Возвращает False, если очередь переполнена или слот не освободился за queue_timeout."""
+        if self._in_flight < self.limit and not self._waiters:
+            self._in_flight += 1
+            self._admitted += 1
+            return True
+
+        if len(self._waiters) >= self.queue_size:
+            self._rejected += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._queued += 1
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # Слот был передан одновременно с таймаутом или отменой: отдаем его следующему.
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._timeouts += 1
+            return False
+
+        self._admitted += 1
+        return True
+
+    def release(self) -> None:
+        # Освободившийся слот сразу переходит первому ожидающему, in_flight при этом не меняется.
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._in_flight -= 1
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'limit': self.limit,
+            'in_flight': self._in_flight,
+            'queue_size': self.queue_size,
+            'queued': len(self._waiters),
+            'admitted': self._admitted,
+            'queued_total': self._queued,
+            'rejected': self._rejected,
+            'timeouts': self._timeouts,
+        }
+
+
+class AdmissionController:
+    """Набор лимитеров по группам ручек (см. src.middleware.route_group)."""
+
+    def __init__(self, limits: dict[str, int], queue_size: int, queue_timeout: float, retry_after: int):
+        self.retry_after = retry_after
+        self.limiters = {
+            group: ConcurrencyLimiter(limit=limit, queue_size=queue_size, queue_timeout=queue_timeout)
+            for group, limit in limits.items()
+        }
+
+    def stats(self) -> dict[str, dict]:
+        return {group: limiter.stats() for group, limiter in self.limiters.items()}
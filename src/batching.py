@@ -0,0 +1,115 @@
+"""
+Микропакетная запись: одновременные INSERT одной таблицы объединяются в один multi-row INSERT ... RETURNING.
+
+Каждый запрос кладет свою строку в общую пачку и ждет ее id (и другие колонки из returning). Пачка записывается,
+когда в ней набралось max_size строк или с первой строки прошло max_delay секунд, — это верхняя граница добавленной
+задержки. Вместо одного INSERT и одного соединения из пула на запрос получается один запрос и одно соединение на пачку.
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Optional, Sequence
+
+from sqlalchemy import Row, insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['InsertBatcher']
+
+
+@dataclass
+class _PendingRow:
+    values: dict[str, Any]
+    future: asyncio.Future[Row]
+
+
+class InsertBatcher:
+    """
+    Пачка пишется в одной транзакции сессией из фабрики первого запроса пачки.
+    Если multi-row INSERT падает, строки вставляются по одной (каждая в своем SAVEPOINT):
+    ошибку получает только запрос с плохой строкой, остальные получают свои id.
+    """
+
+    def __init__(self, entity: Any, max_size: int, max_delay: float, returning: Sequence[Any] = ()):
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self._statement = insert(entity).returning(*(returning or [entity.id]), sort_by_parameter_order=True)
+        self._pending: list[_PendingRow] = []
+        self._session_factory: Optional[async_sessionmaker[AsyncSession]] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: set[asyncio.Task] = set()
+        self._batches = 0
+        self._rows = 0
+        self._fallbacks = 0
+        self._failed_rows = 0
+
+    async def insert(self, session_factory: async_sessionmaker[AsyncSession], values: dict[str, Any]) -> Row:
+        """Добавляет строку в текущую пачку и возвращает ее колонки returning (по умолчанию id) после коммита."""
+        loop = asyncio.get_running_loop()
+        row = _PendingRow(values=values, future=loop.create_future())
+        self._pending.append(row)
+        if len(self._pending) == 1:
+            self._session_factory = session_factory
+            self._timer = loop.call_later(self.max_delay, self._flush_pending)
+        if len(self._pending) >= self.max_size:
+            self._flush_pending()
+
+        # Отмена запроса не отменяет запись пачки: строка уже в ней и будет вставлена.
+        return await asyncio.shield(row.future)
+
+    def _flush_pending(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        rows, self._pending = self._pending, []
+        if rows:
+            task = asyncio.create_task(self._flush(self._session_factory, rows))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, session_factory: async_sessionmaker[AsyncSession], rows: list[_PendingRow]) -> None:
+        self._batches += 1
+        self._rows += len(rows)
+        try:
+            async with session_factory() as session:
+                results = await self._insert_rows(session, rows)
+                await session.commit()
+        except Exception as e:
+            logger.error('Batch insert of %s rows failed: %s', len(rows), e)
+            results = [e] * len(rows)
+
+        for row, result in zip(rows, results):
+            if isinstance(result, Exception):
+                self._failed_rows += 1
+                row.future.set_exception(result)
+            else:
+                row.future.set_result(result)
+
+    async def _insert_rows(self, session: AsyncSession, rows: list[_PendingRow]) -> list[Row | Exception]:
+        try:
+            async with session.begin_nested():
+                return list((await session.execute(self._statement, [row.values for row in rows])).all())
+        except DBAPIError:
+            self._fallbacks += 1
+
+        results: list[Row | Exception] = []
+        for row in rows:
+            try:
+                async with session.begin_nested():
+                    results.append((await session.execute(self._statement, [row.values])).one())
+            except DBAPIError as e:
+                results.append(e)
+        return results
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'pending': len(self._pending),
+            'flushing': len(self._flushes),
+            'batches': self._batches,
+            'rows': self._rows,
+            'fallbacks': self._fallbacks,
+            'failed_rows': self._failed_rows,
+        }
@@ -0,0 +1,186 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, NamedTuple, Optional, Protocol
+
+__all__ = ['CacheBackend', 'CachedResponse', 'LRUCache', 'ResponseCache']
+
+_MISSING = object()
+
+
+class CacheBackend(Protocol):
+    """Интерфейс хранилища для ResponseCache. LRUCache реализует его для кэша в памяти процесса."""
+
+    def get(self, key: Hashable, default: Any = None) -> Any: ...
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None: ...
+
+    def delete(self, key: Hashable) -> None: ...
+
+    def clear(self) -> None: ...
+
+    def stats(self) -> dict[str, int]: ...
+
+
+class LRUCache:
+    """
+    Кэш в памяти процесса с ограничением по размеру (LRU) и времени жизни записей (TTL).
+    Не потокобезопасен: обращаться к нему можно только из event loop. Синхронные зависимости и ручки FastAPI
+    выполняет в пуле потоков, поэтому все, что читает или меняет кэш, должно быть async.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Сохраняет значение. Переданный ttl может только сократить время жизни записи относительно общего."""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+
+
+class _FlightAborted(Exception):
+    """Запрос-лидер был отменен, не получив ответа: ожидающие выполняют загрузку сами."""
+
+
+class _Flight:
+    __slots__ = ('future', 'stale')
+
+    def __init__(self):
+        self.future: asyncio.Future[Optional[CachedResponse]] = asyncio.get_running_loop().create_future()
+        # Запись инвалидирована во время загрузки: результат отдается ожидающим, но не кэшируется.
+        self.stale = False
+
+
+class ResponseCache:
+    """
+    Кэш сериализованных ответов ручек чтения.
+    Ключ состоит из пространства имен (например, 'book' или 'books'), его поколения и параметров запроса.
+    Инвалидация по конкретным параметрам удаляет одну запись, а инвалидация всего пространства имен
+    увеличивает поколение: старые записи становятся недостижимы и вытесняются из бэкенда по LRU/TTL.
+
+    load() объединяет одновременные промахи по одному ключу (single-flight): запрос в БД и сериализацию
+    выполняет первый запрос, остальные ждут его результат.
+    """
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self._generations: dict[str, int] = {}
+        self._flights: dict[str, _Flight] = {}
+        self.coalesced = 0
+
+    def key(self, namespace: str, *params: Any) -> str:
+        return ':'.join([namespace, str(self._generations.get(namespace, 0)), *map(str, params)])
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        return self.backend.get(key)
+
+    def set(self, key: str, response: CachedResponse) -> None:
+        self.backend.set(key, response)
+
+    async def load(
+        self, key: str, loader: Callable[[], Awaitable[Optional[CachedResponse]]]
+    ) -> Optional[CachedResponse]:
+        """
+        Возвращает ответ из кэша, а при промахе — результат loader (None означает, что объекта нет).
+        Пока loader выполняется, остальные запросы с тем же ключом ждут его результат, а не идут в БД.
+        """
+        if (cached := self.get(key)) is not None:
+            return cached
+
+        if (flight := self._flights.get(key)) is not None:
+            self.coalesced += 1
+            try:
+                # shield: отмена ожидающего запроса не должна отменять общую загрузку.
+                return await asyncio.shield(flight.future)
+            except _FlightAborted:
+                return await self.load(key, loader)
+
+        flight = self._flights[key] = _Flight()
+        try:
+            response = await loader()
+        except BaseException as e:
+            flight.future.set_exception(e if isinstance(e, Exception) else _FlightAborted())
+            flight.future.exception()  # ожидающих может не быть: помечаем исключение как полученное
+            raise
+        else:
+            flight.future.set_result(response)
+            if response is not None and not flight.stale:
+                self.set(key, response)
+            return response
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def invalidate(self, namespace: str, *params: Any) -> None:
+        """Удаляет одну запись, если переданы параметры, иначе все записи пространства имен."""
+        if params:
+            key = self.key(namespace, *params)
+            self.backend.delete(key)
+            # Загрузка, начатая до изменения, могла прочитать старые данные: новые запросы ее не ждут.
+            if (flight := self._flights.pop(key, None)) is not None:
+                flight.stale = True
+        else:
+            # Ключи нового поколения не совпадут с ключами текущих загрузок.
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+
+    def clear(self) -> None:
+        self.backend.clear()
+        self._generations.clear()
+        for flight in self._flights.values():
+            flight.stale = True
+        self._flights.clear()
+        self.coalesced = 0
+
+    def stats(self) -> dict[str, int]:
+        return {**self.backend.stats(), 'in_flight': len(self._flights), 'coalesced': self.coalesced}
@@ -1,34 +1,102 @@
+import itertools
 import logging
+import time
+from dataclasses import dataclass, field
 from typing import AsyncGenerator, Callable, Optional
 
+from sqlalchemy import Engine, event
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import ORMExecuteState, Session
 
-# импортируем из __init__.py, уже содержащий другие модели
-from src.models import BaseModel
+from src.metrics import current_request_stats
 
+from .migrations import migrate
+from .pool import PoolMetrics
 from .settings import settings
 
 logger = logging.getLogger('__name__')
 
 
-__all__ = ['global_init', 'get_async_session', 'create_db_and_tables', 'delete_db_and_tables']
+__all__ = [
+    'global_init',
+    'get_async_session',
+    'get_async_read_session',
+    'get_session_factory',
+    'get_read_session_factory',
+    'get_pool_stats',
+    'migrate_db',
+    'on_commit',
+    'run_commit_callbacks',
+]
+
+# Ключ session.info со списком действий, отложенных до коммита транзакции сессии.
+COMMIT_CALLBACKS_KEY = 'commit_callbacks'
+
+
+def _read_only(engine: AsyncEngine) -> AsyncEngine:
+    # Тот же пул соединений, но в режиме autocommit: для чтения драйвер не отправляет BEGIN/COMMIT.
+    return engine.execution_options(isolation_level='AUTOCOMMIT')
+
+
+@dataclass
+class _Replica:
+    engine: AsyncEngine
+    unhealthy_until: float = 0.0
+    read_engine: AsyncEngine = field(init=False)
+    pool_metrics: PoolMetrics = field(init=False)
+
+    def __post_init__(self):
+        self.read_engine = _read_only(self.engine)
+        self.pool_metrics = PoolMetrics(self.engine)
+
+    @property
+    def healthy(self) -> bool:
+        return self.unhealthy_until <= time.monotonic()
+
 
 __async_engine: Optional[AsyncEngine] = None
-__session_factory: Optional[Callable[[], AsyncSession]] = None
+__read_engine: Optional[AsyncEngine] = None
+__pool_metrics: Optional[PoolMetrics] = None
+__session_factory: Optional[async_sessionmaker[AsyncSession]] = None
+__read_session_factory: Optional[async_sessionmaker[AsyncSession]] = None
+__replicas: list[_Replica] = []
+__replica_counter = itertools.count()
+__last_write_at: float = float('-inf')
 
 SQLALCHEMY_DATABASE_URL = settings.database_url
 
 
+def _create_engine(url: str, **connect_args) -> AsyncEngine:
+    return create_async_engine(
+        url=url,
+        echo=False,
+        pool_size=settings.max_connection_count,
+        max_overflow=settings.db_pool_max_overflow,
+        pool_timeout=settings.db_pool_timeout_seconds,
+        pool_recycle=settings.db_pool_recycle_seconds,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        connect_args={'prepared_statement_cache_size': settings.db_prepared_statement_cache_size, **connect_args},
+    )
+
+
 def global_init() -> None:
-    global __async_engine, __session_factory
+    global __async_engine, __read_engine, __pool_metrics, __session_factory, __read_session_factory, __replicas
 
     if __session_factory:
         return
 
     if not __async_engine:
-        __async_engine = create_async_engine(url=SQLALCHEMY_DATABASE_URL, echo=False)
+        __async_engine = _create_engine(SQLALCHEMY_DATABASE_URL)
 
+    __read_engine = _read_only(__async_engine)
+    __pool_metrics = PoolMetrics(__async_engine)
+    __replicas = [
+        _Replica(engine=_create_engine(url, timeout=settings.db_replica_connect_timeout_seconds))
+        for url in settings.database_replica_urls
+    ]
     __session_factory = async_sessionmaker(__async_engine)
+    __read_session_factory = async_sessionmaker(__read_engine)
 
 
 async def get_async_session() -> AsyncGenerator:
@@ -40,31 +108,156 @@ async def get_async_session() -> AsyncGenerator:
     session: AsyncSession = __session_factory()
 
     try:
+        # Соединение берется сразу, чтобы измерить ожидание свободного соединения в пуле.
+        await __pool_metrics.acquire(session)
         yield session
         await session.commit()
+        if session.info.get('has_writes'):
+            _mark_write()
+        run_commit_callbacks(session)
     except Exception as e:
         logger.error('Raises exception: %s', e)
+        session.info.pop(COMMIT_CALLBACKS_KEY, None)
+        await session.rollback()
         raise e
     finally:
-        await session.rollback()
         await session.close()
 
 
-async def create_db_and_tables():
-    global __async_engine
+def on_commit(session: AsyncSession, callback: Callable[[], None]) -> None:
+    """
+    Откладывает callback до коммита транзакции сессии из get_async_session; при откате он не вызывается.
+    Так сбрасываются кэши: сброс до коммита позволил бы параллельному чтению закэшировать еще старые данные.
+    """
+    session.info.setdefault(COMMIT_CALLBACKS_KEY, []).append(callback)
 
-    if __async_engine is None:
+
+def run_commit_callbacks(session: AsyncSession) -> None:
+    for callback in session.info.pop(COMMIT_CALLBACKS_KEY, []):
+        callback()
+
+
+# Отмечаем сессии, которые что-то записали, чтобы после их коммита временно читать с основной БД.
+@event.listens_for(Session, 'after_flush')
+def _track_flush(session: Session, _) -> None:
+    session.info['has_writes'] = True
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_dml(orm_execute_state: ORMExecuteState) -> None:
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['has_writes'] = True
+
+
+# Число и время SQL-запросов текущего HTTP-запроса для метрик. Вне запроса события ничего не делают.
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany) -> None:
+    if current_request_stats.get() is not None:
+        context.metrics_started_at = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _stop_query_timer(conn, cursor, statement, parameters, context, executemany) -> None:
+    if (stats := current_request_stats.get()) is not None and hasattr(context, 'metrics_started_at'):
+        stats.db_queries += 1
+        stats.db_time += time.perf_counter() - context.metrics_started_at
+
+
+def _mark_write() -> None:
+    global __last_write_at
+    __last_write_at = time.monotonic()
+
+
+def _replicas_round_robin() -> list[_Replica]:
+    """Возвращает доступные реплики, начиная со следующей по кругу. Пустой список — читаем с основной БД."""
+    if not __replicas or time.monotonic() - __last_write_at < settings.db_replica_max_lag_seconds:
+        return []
+
+    start = next(__replica_counter) % len(__replicas)
+    ordered = __replicas[start:] + __replicas[:start]
+    return [replica for replica in ordered if replica.healthy]
+
+
+async def get_async_read_session() -> AsyncGenerator:
+    """
+    Сессия для ручек, которые только читают данные. Выдается на одной из реплик (по кругу),
+    а если реплик нет или все недоступны — на основной БД. Реплика, к которой не удалось подключиться,
+    исключается из ротации на db_replica_retry_seconds.
+
+    Соединение работает в режиме autocommit: запросы чтения не оборачиваются в транзакцию,
+    поэтому не нужны ни BEGIN, ни COMMIT, ни ROLLBACK. Писать через эту сессию нельзя.
+    """
+    global __session_factory
+
+    if not __session_factory:
+        raise ValueError({'message': 'You must call global_init() before using this method.'})
+
+    session: Optional[AsyncSession] = None
+    for replica in _replicas_round_robin():
+        session = __session_factory(bind=replica.read_engine)
+        try:
+            await replica.pool_metrics.acquire(session)
+            break
+        except (DBAPIError, OSError) as e:
+            logger.warning('Replica %s is unavailable: %s', replica.engine.url.render_as_string(), e)
+            replica.unhealthy_until = time.monotonic() + settings.db_replica_retry_seconds
+            await session.close()
+            session = None
+
+    try:
+        if session is None:
+            session = __session_factory(bind=__read_engine)
+            await __pool_metrics.acquire(session)
+        yield session
+    finally:
+        # Возвращаем соединение в пул сразу после того, как обработчик получил результаты.
+        await session.close()
+
+
+def get_session_factory() -> async_sessionmaker[AsyncSession]:
+    # Нужна там, где сессия должна жить дольше обработчика запроса (например, в StreamingResponse):
+    # начиная с FastAPI 0.106 зависимости с yield закрываются до отправки тела ответа.
+    global __session_factory
+
+    if not __session_factory:
+        raise ValueError({'message': 'You must call global_init() before using this method.'})
+
+    return __session_factory
+
+
+def get_read_session_factory() -> async_sessionmaker[AsyncSession]:
+    """
+    Фабрика коротких сессий чтения на основной БД в режиме autocommit. Нужна для запросов, которые должны
+    вернуть соединение в пул сразу, а не в конце запроса, и не могут ждать реплику (например, авторизация).
+    """
+    global __read_session_factory
+
+    if not __read_session_factory:
+        raise ValueError({'message': 'You must call global_init() before using this method.'})
+
+    return __read_session_factory
+
+
+def get_pool_stats() -> dict:
+    global __pool_metrics
+
+    if __pool_metrics is None:
         raise ValueError({'message': 'You must call global_init() before using this method.'})
 
-    async with __async_engine.begin() as conn:
-        await conn.run_sync(BaseModel.metadata.create_all)
+    return {
+        'primary': __pool_metrics.stats(),
+        'replicas': [
+            {'url': replica.engine.url.render_as_string(), 'healthy': replica.healthy, **replica.pool_metrics.stats()}
+            for replica in __replicas
+        ],
+    }
 
 
-async def delete_db_and_tables():
+async def migrate_db() -> int:
+    """Проверяет версию схемы и применяет недостающие миграции (см. src.configurations.migrations)."""
     global __async_engine
 
     if __async_engine is None:
         raise ValueError({'message': 'You must call global_init() before using this method.'})
 
-    async with __async_engine.begin() as conn:
-        await conn.run_sync(BaseModel.metadata.drop_all)
+    return await migrate(__async_engine)
@@ -0,0 +1,479 @@
+"""
+Версионированная схема БД.
+
+Миграции — упорядоченный список SQL-выражений. Примененные миграции записываются в таблицу schema_version
+вместе с контрольной суммой их SQL. При старте приложения выполняется один запрос к schema_version;
+DDL выполняется, только если в коде есть миграции, которых еще нет в БД.
+
+Миграции нельзя менять после выпуска: контрольная сумма измененной миграции не совпадет с записанной в БД,
+и приложение не запустится. Изменения схемы оформляются новой миграцией в конце списка MIGRATIONS.
+"""
+
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['MIGRATIONS', 'Migration', 'SchemaMismatchError', 'migrate']
+
+# Ключ advisory-блокировки: воркеры, стартующие одновременно, применяют миграции по очереди.
+MIGRATION_LOCK_ID = 20_240_020
+
+CREATE_SCHEMA_VERSION_SQL = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    description VARCHAR(200) NOT NULL,
+    checksum CHAR(64) NOT NULL,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+)
+"""
+
+
+class SchemaMismatchError(RuntimeError):
+    pass
+
+
+# Проверка перед миграцией 1. Ее выражения идут с IF NOT EXISTS и не меняют уже существующие таблицы,
+# поэтому таблицы, созданные более старым кодом, нужно проверить: без колонок version не работают ETag,
+# без ON DELETE CASCADE удаление продавца падает на внешнем ключе. Отсутствующие таблицы проверку проходят.
+SCHEMA_V1_PRECHECK_SQL = """
+SELECT problem FROM (
+    VALUES
+        ('sellers_table.version column is missing', to_regclass('sellers_table') IS NULL OR EXISTS (
+            SELECT 1 FROM pg_attribute
+            WHERE attrelid = to_regclass('sellers_table') AND attname = 'version' AND NOT attisdropped
+        )),
+        ('books_table.version column is missing', to_regclass('books_table') IS NULL OR EXISTS (
+            SELECT 1 FROM pg_attribute
+            WHERE attrelid = to_regclass('books_table') AND attname = 'version' AND NOT attisdropped
+        )),
+        ('books_table.seller_id must reference sellers_table ON DELETE CASCADE', to_regclass('books_table') IS NULL OR EXISTS (
+            SELECT 1 FROM pg_constraint
+            WHERE conrelid = to_regclass('books_table') AND confrelid = to_regclass('sellers_table')
+                AND contype = 'f' AND confdeltype = 'c'
+        ))
+) AS checks (problem, ok)
+WHERE NOT ok
+"""
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    statements: tuple[str, ...]
+    # Запрос, который перед выполнением statements возвращает описания несовместимостей уже существующей схемы
+    # (пусто — все в порядке). Не входит в контрольную сумму: проверку можно добавить к выпущенной миграции.
+    precheck: Optional[str] = None
+
+    @property
+    def checksum(self) -> str:
+        return hashlib.sha256('\n'.join(self.statements).encode()).hexdigest()
+
+
+def _book_stats_trigger(operation: str, delta: str, transition_tables: str) -> tuple[str, str]:
+    """
+    Функция и триггер, применяющие к сводной статистике изменения книг одного SQL-выражения.
+    delta — строки (seller_id, year, author, count_pages, sign), sign = 1 для новых строк и -1 для старых.
+    Строки продавцов обновляются upsert'ами, а изменение статистики каталога дописывается новыми строками
+    в book_catalog_stats_delta_table. Строки каталога (seller_id = 0) триггер не трогает: иначе все записи книг
+    ждали бы друг друга на них.
+    Вынесено в функцию только чтобы не повторять один и тот же SQL для INSERT, UPDATE и DELETE:
+    результат входит в контрольную сумму миграции, поэтому менять шаблон после выпуска нельзя.
+    """
+    # Строки продавцов, счетчик которых стал нулевым, удаляем.
+    cleanup = (
+        """
+                DELETE FROM book_stats_table
+                WHERE books_count = 0 AND seller_id IN (SELECT seller_id FROM old_rows);
+                DELETE FROM book_year_stats_table
+                WHERE books_count = 0 AND (seller_id, year) IN (SELECT seller_id, year FROM old_rows);
+                DELETE FROM book_author_stats_table
+                WHERE books_count = 0 AND (seller_id, author) IN (SELECT seller_id, author FROM old_rows);"""
+        if 'old_rows' in transition_tables
+        else ''
+    )
+    function = f"""
+            CREATE OR REPLACE FUNCTION book_stats_{operation}() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                WITH delta AS ({delta}),
+                totals AS (
+                    INSERT INTO book_stats_table AS stats (seller_id, books_count, total_pages)
+                    SELECT seller_id, sum(sign), sum(sign * count_pages) FROM delta GROUP BY seller_id
+                    HAVING sum(sign) <> 0 OR sum(sign * count_pages) <> 0
+                    ORDER BY seller_id
+                    ON CONFLICT (seller_id) DO UPDATE SET
+                        books_count = stats.books_count + excluded.books_count,
+                        total_pages = stats.total_pages + excluded.total_pages
+                ),
+                years AS (
+                    INSERT INTO book_year_stats_table AS stats (seller_id, year, books_count)
+                    SELECT seller_id, year, sum(sign) FROM delta GROUP BY seller_id, year
+                    HAVING sum(sign) <> 0
+                    ORDER BY seller_id, year
+                    ON CONFLICT (seller_id, year) DO UPDATE SET books_count = stats.books_count + excluded.books_count
+                ),
+                authors AS (
+                    INSERT INTO book_author_stats_table AS stats (seller_id, author, books_count)
+                    SELECT seller_id, author, sum(sign) FROM delta GROUP BY seller_id, author
+                    HAVING sum(sign) <> 0
+                    ORDER BY seller_id, author
+                    ON CONFLICT (seller_id, author) DO UPDATE SET books_count = stats.books_count + excluded.books_count
+                )
+                INSERT INTO book_catalog_stats_delta_table (year, author, books_count, total_pages)
+                SELECT year, author, sum(sign), sum(sign * count_pages) FROM delta GROUP BY year, author
+                HAVING sum(sign) <> 0 OR sum(sign * count_pages) <> 0;{cleanup}
+                RETURN NULL;
+            END
+            $$
+            """
+    trigger = (
+        f'CREATE TRIGGER book_stats_{operation} AFTER {operation.upper()} ON books_table '
+        f'REFERENCING {transition_tables} FOR EACH STATEMENT EXECUTE FUNCTION book_stats_{operation}()'
+    )
+    return function, trigger
+
+
+MIGRATIONS: tuple[Migration, ...] = (
+    # IF NOT EXISTS: БД, созданные раньше через metadata.create_all, принимаются как уже имеющие версию 1,
+    # если проверка SCHEMA_V1_PRECHECK_SQL не нашла в них расхождений с ожидаемой схемой.
+    Migration(
+        version=1,
+        description='sellers and books',
+        statements=(
+            'CREATE SEQUENCE IF NOT EXISTS books_version_seq',
+            'CREATE SEQUENCE IF NOT EXISTS sellers_version_seq',
+            """
+            CREATE TABLE IF NOT EXISTS sellers_table (
+                id SERIAL NOT NULL,
+                first_name VARCHAR(50) NOT NULL,
+                last_name VARCHAR(50) NOT NULL,
+                email VARCHAR(100) NOT NULL,
+                hashed_password VARCHAR(128) NOT NULL,
+                version BIGINT DEFAULT nextval('sellers_version_seq') NOT NULL,
+                PRIMARY KEY (id)
+            )
+            """,
+            'CREATE UNIQUE INDEX IF NOT EXISTS ix_sellers_table_email ON sellers_table (email)',
+            """
+            CREATE TABLE IF NOT EXISTS books_table (
+                id SERIAL NOT NULL,
+                title VARCHAR(100) NOT NULL,
+                author VARCHAR(100) NOT NULL,
+                year INTEGER NOT NULL,
+                count_pages INTEGER NOT NULL,
+                seller_id INTEGER NOT NULL,
+                version BIGINT DEFAULT nextval('books_version_seq') NOT NULL,
+                PRIMARY KEY (id),
+                FOREIGN KEY (seller_id) REFERENCES sellers_table (id) ON DELETE CASCADE
+            )
+            """,
+            'CREATE INDEX IF NOT EXISTS ix_books_table_seller_id_id ON books_table (seller_id, id) '
+            'INCLUDE (title, author, year, count_pages, version)',
+            'CREATE INDEX IF NOT EXISTS ix_books_table_author_id ON books_table (author, id)',
+            'CREATE INDEX IF NOT EXISTS ix_books_table_year_id ON books_table (year, id)',
+            'CREATE INDEX IF NOT EXISTS ix_books_table_count_pages_id ON books_table (count_pages, id)',
+            """
+            CREATE INDEX IF NOT EXISTS ix_books_table_search ON books_table USING gin (
+                (setweight(to_tsvector('simple'::regconfig, title), 'A')
+                 || setweight(to_tsvector('simple'::regconfig, author), 'B'))
+            )
+            """,
+        ),
+        precheck=SCHEMA_V1_PRECHECK_SQL,
+    ),
+    # Сводная статистика книг продавцов и всего каталога (seller_id = 0) для /books/stats и /seller/{id}/stats.
+    # Поддерживается statement-level триггерами books_table: изменение, затронувшее любое число книг,
+    # применяется к строкам продавцов несколькими агрегированными upsert'ами, а не построчно.
+    # Изменения каталога триггеры дописывают в book_catalog_stats_delta_table (INSERT без конфликтов и блокировок
+    # общих строк), чтение складывает строки seller_id = 0 с дельтами, а book_catalog_stats_compact() в фоне
+    # переносит дельты в строки seller_id = 0 (см. src.stats).
+    Migration(
+        version=2,
+        description='incremental book stats',
+        statements=(
+            """
+            CREATE TABLE IF NOT EXISTS book_stats_table (
+                seller_id INTEGER NOT NULL,
+                books_count BIGINT NOT NULL,
+                total_pages BIGINT NOT NULL,
+                PRIMARY KEY (seller_id)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS book_year_stats_table (
+                seller_id INTEGER NOT NULL,
+                year INTEGER NOT NULL,
+                books_count BIGINT NOT NULL,
+                PRIMARY KEY (seller_id, year)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS book_author_stats_table (
+                seller_id INTEGER NOT NULL,
+                author VARCHAR(100) NOT NULL,
+                books_count BIGINT NOT NULL,
+                PRIMARY KEY (seller_id, author)
+            )
+            """,
+            'CREATE INDEX IF NOT EXISTS ix_book_author_stats_table_top '
+            'ON book_author_stats_table (seller_id, books_count DESC, author)',
+            """
+            CREATE TABLE IF NOT EXISTS book_catalog_stats_delta_table (
+                id BIGSERIAL NOT NULL,
+                year INTEGER NOT NULL,
+                author VARCHAR(100) NOT NULL,
+                books_count BIGINT NOT NULL,
+                total_pages BIGINT NOT NULL,
+                PRIMARY KEY (id)
+            )
+            """,
+            *_book_stats_trigger(
+                'insert',
+                'SELECT seller_id, year, author, count_pages, 1 AS sign FROM new_rows',
+                'NEW TABLE AS new_rows',
+            ),
+            *_book_stats_trigger(
+                'update',
+                'SELECT seller_id, year, author, count_pages, 1 AS sign FROM new_rows '
+                'UNION ALL SELECT seller_id, year, author, count_pages, -1 FROM old_rows',
+                'OLD TABLE AS old_rows NEW TABLE AS new_rows',
+            ),
+            *_book_stats_trigger(
+                'delete',
+                'SELECT seller_id, year, author, count_pages, -1 AS sign FROM old_rows',
+                'OLD TABLE AS old_rows',
+            ),
+            """
+            CREATE OR REPLACE FUNCTION book_stats_truncate() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                TRUNCATE book_stats_table, book_year_stats_table, book_author_stats_table,
+                    book_catalog_stats_delta_table;
+                RETURN NULL;
+            END
+            $$
+            """,
+            'CREATE TRIGGER book_stats_truncate AFTER TRUNCATE ON books_table '
+            'FOR EACH STATEMENT EXECUTE FUNCTION book_stats_truncate()',
+            # Дельты, видимые транзакции сжатия, удаляются и прибавляются к строкам каталога одним выражением.
+            # Дельты незакоммиченных транзакций она не видит и оставляет; параллельное сжатие ждет на удаляемых
+            # строках и пропускает уже перенесенные, поэтому дельта не учитывается дважды.
+            """
+            CREATE OR REPLACE FUNCTION book_catalog_stats_compact() RETURNS bigint LANGUAGE plpgsql AS $$
+            DECLARE
+                compacted bigint;
+            BEGIN
+                WITH moved AS (
+                    DELETE FROM book_catalog_stats_delta_table RETURNING year, author, books_count, total_pages
+                ),
+                totals AS (
+                    INSERT INTO book_stats_table AS stats (seller_id, books_count, total_pages)
+                    SELECT 0, sum(books_count), sum(total_pages) FROM moved HAVING count(*) > 0
+                    ON CONFLICT (seller_id) DO UPDATE SET
+                        books_count = stats.books_count + excluded.books_count,
+                        total_pages = stats.total_pages + excluded.total_pages
+                ),
+                years AS (
+                    INSERT INTO book_year_stats_table AS stats (seller_id, year, books_count)
+                    SELECT 0, year, sum(books_count) FROM moved GROUP BY year
+                    HAVING sum(books_count) <> 0
+                    ORDER BY year
+                    ON CONFLICT (seller_id, year) DO UPDATE SET books_count = stats.books_count + excluded.books_count
+                ),
+                authors AS (
+                    INSERT INTO book_author_stats_table AS stats (seller_id, author, books_count)
+                    SELECT 0, author, sum(books_count) FROM moved GROUP BY author
+                    HAVING sum(books_count) <> 0
+                    ORDER BY author
+                    ON CONFLICT (seller_id, author) DO UPDATE SET books_count = stats.books_count + excluded.books_count
+                )
+                SELECT count(*) INTO compacted FROM moved;
+
+                DELETE FROM book_year_stats_table WHERE seller_id = 0 AND books_count = 0;
+                DELETE FROM book_author_stats_table WHERE seller_id = 0 AND books_count = 0;
+                RETURN compacted;
+            END
+            $$
+            """,
+            # Заполняем строки продавцов и каталога по уже существующим книгам. Триггеры созданы раньше и держат блокировку таблицы
+            # до конца транзакции, поэтому параллельные изменения не потеряются и не посчитаются дважды.
+            """
+            INSERT INTO book_stats_table (seller_id, books_count, total_pages)
+            SELECT coalesce(seller_id, 0), count(*), coalesce(sum(count_pages), 0)
+            FROM books_table GROUP BY GROUPING SETS ((seller_id), ())
+            """,
+            """
+            INSERT INTO book_year_stats_table (seller_id, year, books_count)
+            SELECT coalesce(seller_id, 0), year, count(*) FROM books_table GROUP BY GROUPING SETS ((seller_id, year), (year))
+            """,
+            """
+            INSERT INTO book_author_stats_table (seller_id, author, books_count)
+            SELECT coalesce(seller_id, 0), author, count(*)
+            FROM books_table GROUP BY GROUPING SETS ((seller_id, author), (author))
+            """,
+        ),
+    ),
+    # Фоновые задачи (удаление продавцов, выгрузки каталога) хранятся в БД, чтобы их видели и могли продолжить
+    # все воркеры приложения (см. src.jobs).
+    Migration(
+        version=3,
+        description='background jobs',
+        statements=(
+            """
+            CREATE TABLE IF NOT EXISTS jobs_table (
+                id VARCHAR(32) NOT NULL,
+                kind VARCHAR(30) NOT NULL,
+                params JSON NOT NULL,
+                status VARCHAR(10) NOT NULL,
+                total BIGINT,
+                processed BIGINT NOT NULL,
+                error VARCHAR(500),
+                claim VARCHAR(32),
+                created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+                heartbeat_at TIMESTAMP WITH TIME ZONE,
+                finished_at TIMESTAMP WITH TIME ZONE,
+                PRIMARY KEY (id)
+            )
+            """,
+            'CREATE INDEX IF NOT EXISTS ix_jobs_table_kind_status_created_at '
+            'ON jobs_table (kind, status, created_at)',
+        ),
+    ),
+    # ETag списков строится из числа строк и max(version). Индексы по version превращают max() в один спуск
+    # по индексу, а число строк берется из поддерживаемых счетчиков, а не из count(*) по всей таблице:
+    # книги — из сводной статистики (миграция 2), продавцы — из seller_stats_table.
+    # Счетчик продавцов устроен как дельты каталога: триггеры только добавляют строки (+n / -n), число продавцов —
+    # их сумма, а seller_stats_compact() (см. src.stats) сворачивает строки в одну. Общей строки, на которой
+    # ждали бы друг друга регистрации продавцов, нет.
+    Migration(
+        version=4,
+        description='collection etag indexes and seller count',
+        statements=(
+            'CREATE INDEX IF NOT EXISTS ix_books_table_version ON books_table (version)',
+            'CREATE INDEX IF NOT EXISTS ix_books_table_seller_id_version ON books_table (seller_id, version)',
+            'CREATE INDEX IF NOT EXISTS ix_sellers_table_version ON sellers_table (version)',
+            """
+            CREATE TABLE IF NOT EXISTS seller_stats_table (
+                id BIGSERIAL NOT NULL,
+                sellers_count BIGINT NOT NULL,
+                PRIMARY KEY (id)
+            )
+            """,
+            """
+            CREATE OR REPLACE FUNCTION seller_stats_insert() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                INSERT INTO seller_stats_table (sellers_count) SELECT count(*) FROM new_rows;
+                RETURN NULL;
+            END
+            $$
+            """,
+            'CREATE TRIGGER seller_stats_insert AFTER INSERT ON sellers_table '
+            'REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION seller_stats_insert()',
+            """
+            CREATE OR REPLACE FUNCTION seller_stats_delete() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                INSERT INTO seller_stats_table (sellers_count) SELECT -count(*) FROM old_rows;
+                RETURN NULL;
+            END
+            $$
+            """,
+            'CREATE TRIGGER seller_stats_delete AFTER DELETE ON sellers_table '
+            'REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION seller_stats_delete()',
+            """
+            CREATE OR REPLACE FUNCTION seller_stats_truncate() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                TRUNCATE seller_stats_table;
+                RETURN NULL;
+            END
+            $$
+            """,
+            'CREATE TRIGGER seller_stats_truncate AFTER TRUNCATE ON sellers_table '
+            'FOR EACH STATEMENT EXECUTE FUNCTION seller_stats_truncate()',
+            # Как и book_catalog_stats_compact(), сворачивает только видимые строки: строки незакоммиченных
+            # транзакций остаются, параллельное сжатие пропускает уже удаленные, сумма не меняется.
+            """
+            CREATE OR REPLACE FUNCTION seller_stats_compact() RETURNS bigint LANGUAGE plpgsql AS $$
+            DECLARE
+                compacted bigint;
+            BEGIN
+                IF (SELECT count(*) FROM seller_stats_table) < 2 THEN
+                    RETURN 0;
+                END IF;
+                WITH moved AS (
+                    DELETE FROM seller_stats_table RETURNING sellers_count
+                ),
+                total AS (
+                    INSERT INTO seller_stats_table (sellers_count)
+                    SELECT sum(sellers_count) FROM moved HAVING count(*) > 0
+                )
+                SELECT count(*) INTO compacted FROM moved;
+                RETURN compacted;
+            END
+            $$
+            """,
+            'INSERT INTO seller_stats_table (sellers_count) SELECT count(*) FROM sellers_table',
+        ),
+    ),
+)
+
+
+def _check_applied(applied: dict[int, str]) -> list[Migration]:
+    """Сверяет примененные миграции с кодом и возвращает еще не примененные."""
+    pending = []
+    for migration in MIGRATIONS:
+        if (checksum := applied.get(migration.version)) is None:
+            pending.append(migration)
+        elif checksum != migration.checksum:
+            raise SchemaMismatchError(f'Migration {migration.version} was changed after it had been applied')
+
+    if newer := sorted(set(applied) - {migration.version for migration in MIGRATIONS}):
+        # Так бывает при выкатке: новые воркеры уже обновили схему, а старые еще работают.
+        logger.warning('Database schema has migrations unknown to this code: %s', newer)
+    return pending
+
+
+async def _read_applied(engine: AsyncEngine) -> dict[int, str]:
+    async with engine.connect() as connection:
+        try:
+            db_result = await connection.execute(text('SELECT version, checksum FROM schema_version'))
+        except ProgrammingError:  # таблицы еще нет: пустая БД
+            return {}
+        return dict(db_result.all())
+
+
+async def migrate(engine: AsyncEngine) -> int:
+    """Приводит схему БД к последней версии и возвращает ее номер. Данные не удаляются."""
+    if not _check_applied(await _read_applied(engine)):
+        return MIGRATIONS[-1].version
+
+    async with engine.begin() as connection:
+        # Перечитываем состояние под блокировкой: миграции мог уже применить другой воркер.
+        await connection.execute(text('SELECT pg_advisory_xact_lock(:lock_id)'), {'lock_id': MIGRATION_LOCK_ID})
+        await connection.exec_driver_sql(CREATE_SCHEMA_VERSION_SQL)
+        applied = dict((await connection.execute(text('SELECT version, checksum FROM schema_version'))).all())
+
+        # DDL в Postgres транзакционный: при ошибке откатываются все миграции этого запуска.
+        for migration in _check_applied(applied):
+            logger.info('Applying migration %s: %s', migration.version, migration.description)
+            if migration.precheck and (
+                problems := (await connection.exec_driver_sql(migration.precheck)).scalars().all()
+            ):
+                raise SchemaMismatchError(
+                    f'Database schema is incompatible with migration {migration.version}: {"; ".join(problems)}'
+                )
+            for statement in migration.statements:
+                await connection.exec_driver_sql(statement)
+            await connection.execute(
+                text(
+                    'INSERT INTO schema_version (version, description, checksum) VALUES (:version, :description, :checksum)'
+                ),
+                {'version': migration.version, 'description': migration.description, 'checksum': migration.checksum},
+            )
+
+    return MIGRATIONS[-1].version
@@ -0,0 +1,88 @@
+import logging
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from src.metrics import Histogram
+
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['PoolMetrics']
+
+
+class PoolMetrics:
+    """
+    Метрики пула соединений движка.
+    acquire_wait — сколько сессия запроса ждала соединение (см. acquire): свободное соединение из пула,
+    новое соединение или ожидание, пока другое вернут в исчерпанный пул. Рост этого времени и acquire_timeouts —
+    признак исчерпания пула. На событиях пула SQLAlchemy (connect, checkout, checkin) измеряются время установки
+    новых соединений и hold_time — сколько соединение удерживают после выдачи из пула. Соединения, удерживаемые
+    дольше db_pool_slow_checkout_seconds, логируются вместе с состоянием пула: именно они исчерпывают пул.
+    """
+
+    def __init__(self, engine: AsyncEngine):
+        self._engine = engine
+        self.acquire_wait = Histogram()
+        self.connect_time = Histogram()
+        self.hold_time = Histogram()
+        self.acquire_timeouts = 0
+        self.connects = 0
+        self.checkouts = 0
+
+        # Слушатели вешаются на движок, а не на экземпляр пула: при пересоздании пула они переносятся в новый.
+        sync_engine = engine.sync_engine
+        event.listen(sync_engine, 'do_connect', self._before_connect)
+        event.listen(sync_engine, 'connect', self._after_connect)
+        event.listen(sync_engine, 'checkout', self._on_checkout)
+        event.listen(sync_engine, 'checkin', self._on_checkin)
+
+    async def acquire(self, session: AsyncSession) -> None:
+        """Берет для сессии соединение, измеряя ожидание. Учитываются и неудачные попытки (таймаут пула)."""
+        started_at = time.perf_counter()
+        try:
+            await session.connection()
+        except PoolTimeoutError:
+            self.acquire_timeouts += 1
+            raise
+        finally:
+            self.acquire_wait.observe(time.perf_counter() - started_at)
+
+    def _before_connect(self, dialect, connection_record, cargs, cparams) -> None:
+        connection_record.info['connect_started_at'] = time.perf_counter()
+
+    def _after_connect(self, dbapi_connection, connection_record) -> None:
+        if (started_at := connection_record.info.pop('connect_started_at', None)) is not None:
+            self.connects += 1
+            self.connect_time.observe(time.perf_counter() - started_at)
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        self.checkouts += 1
+        connection_record.info['checked_out_at'] = time.perf_counter()
+
+    def _on_checkin(self, dbapi_connection, connection_record) -> None:
+        if (checked_out_at := connection_record.info.pop('checked_out_at', None)) is None:
+            return
+        held = time.perf_counter() - checked_out_at
+        self.hold_time.observe(held)
+        if held >= settings.db_pool_slow_checkout_seconds:
+            logger.warning('A DB connection was checked out for %.3fs: %s', held, self._engine.pool.status())
+
+    def stats(self) -> dict:
+        pool = self._engine.pool
+        return {
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'idle': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+            'max_overflow': settings.db_pool_max_overflow,
+            'connects': self.connects,
+            'checkouts': self.checkouts,
+            'acquire_timeouts': self.acquire_timeouts,
+            'acquire_wait_seconds': self.acquire_wait.snapshot(),
+            'connect_time_seconds': self.connect_time.snapshot(),
+            'hold_time_seconds': self.hold_time.snapshot(),
+        }
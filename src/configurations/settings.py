@@ -11,6 +11,9 @@
 что может позволить злоумышленникам получить доступ к приложению.
 """
 
+import tempfile
+from pathlib import Path
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -18,13 +21,79 @@ class Settings(BaseSettings):
     db_host: str
     db_name: str
     db_test_name: str = 'fastapi_project_test_db'
+    # Настройки пула соединений с БД. max_connection_count — число постоянных соединений в пуле.
     max_connection_count: int = 10
+    db_pool_max_overflow: int = 10
+    db_pool_timeout_seconds: float = 30
+    db_pool_recycle_seconds: int = 1800
+    db_pool_pre_ping: bool = True
+    db_pool_slow_checkout_seconds: float = 1
+    db_prepared_statement_cache_size: int = 500
+    # Реплики для ручек чтения: список хостов в формате db_host, например '["postgresql+asyncpg://...:5446"]'.
+    db_replica_hosts: list[str] = []
+    db_replica_connect_timeout_seconds: float = 2
+    # Сколько реплика считается недоступной после ошибки подключения.
+    db_replica_retry_seconds: float = 30
+    # Сколько после записи этот процесс читает с основной БД, чтобы не увидеть (и не закэшировать) отставшие данные.
+    db_replica_max_lag_seconds: float = 1
     jwt_secret_key: str = 'jwt_secret_key'
+    # bcrypt выполняется в отдельном пуле потоков, чтобы не блокировать event loop.
+    password_hasher_workers: int = 4
+    bcrypt_rounds: int = 12
+    # Кэш проверенных JWT и продавцов, чтобы не ходить в БД за авторизацией на каждый запрос.
+    auth_cache_size: int = 10_000
+    auth_cache_ttl_seconds: float = 60
+    # Кэш ответов ручек чтения книг и продавцов. Размер 0 отключает кэш.
+    response_cache_size: int = 10_000
+    response_cache_ttl_seconds: float = 30
+    # Метрики запросов по маршрутам, отдаются на /metrics в формате Prometheus.
+    metrics_enabled: bool = True
+    # Фоновые задачи (удаление продавцов, выгрузки каталога) хранятся в БД и выполняются воркерами всех процессов.
+    # Как часто воркеры проверяют задачи, поставленные другими процессами, и через сколько секунд
+    # без обновления прогресса задача считается брошенной и забирается другим воркером.
+    job_poll_interval_seconds: float = 1
+    job_stale_seconds: float = 60
+    # Фоновое удаление продавцов: число одновременных удалений в процессе, длина общей очереди
+    # и сколько хранится завершенная задача.
+    seller_delete_max_concurrent_jobs: int = 2
+    seller_delete_queue_size: int = 100
+    seller_delete_ttl_seconds: float = 3600
+    seller_delete_cleanup_interval_seconds: float = 60
+    # Admission control: сколько запросов каждой группы ручек обрабатывается одновременно.
+    # auth — выдача токена и регистрация продавца, где основное время занимает bcrypt.
+    admission_enabled: bool = True
+    admission_read_limit: int = 100
+    admission_write_limit: int = 20
+    admission_auth_limit: int = 8
+    # Сколько запросов группы может ждать свободного слота и как долго, прежде чем получить 503.
+    admission_queue_size: int = 100
+    admission_queue_timeout_seconds: float = 2
+    admission_retry_after_seconds: int = 1
+    # Микропакетная запись книг: одновременные POST /books/ объединяются в один INSERT ... RETURNING.
+    # Пачка пишется при book_write_batch_size строках или через book_write_batch_delay_ms после первой строки:
+    # это максимальная задержка, добавляемая к запросу. По умолчанию выключено.
+    book_write_batching: bool = False
+    book_write_batch_size: int = 100
+    book_write_batch_delay_ms: float = 2
+    # Фоновая выгрузка каталога в файлы: каталог для файлов, число одновременных выгрузок в процессе,
+    # длина общей очереди задач и сколько хранится готовый файл.
+    # export_dir должен быть общим для всех процессов и хостов приложения: файл отдает любой из них.
+    export_dir: Path = Path(tempfile.gettempdir()) / 'book-exports'
+    export_max_concurrent_jobs: int = 2
+    export_queue_size: int = 20
+    export_ttl_seconds: float = 3600
+    export_cleanup_interval_seconds: float = 60
+    # Как часто дельты статистики каталога переносятся в ее сжатые строки (см. src.stats).
+    catalog_stats_compact_interval_seconds: float = 5
 
     @property
     def database_url(self) -> str:
         return f'{self.db_host}/{self.db_name}'
 
+    @property
+    def database_replica_urls(self) -> list[str]:
+        return [f'{host}/{self.db_name}' for host in self.db_replica_hosts]
+
     @property
     def database_test_url(self) -> str:
         return f'{self.db_host}/{self.db_test_name}'
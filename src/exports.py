@@ -0,0 +1,124 @@
+"""
+Фоновая выгрузка каталога книг в файл.
+
+Выгрузка — фоновая задача в jobs_table (см. src.jobs), ее выполняют воркеры ExportManager. Воркер читает книги
+серверным курсором и пишет их в сжатый gzip файл NDJSON или CSV в export_dir, поэтому ни HTTP-воркер,
+ни память процесса не зависят от размера каталога.
+export_dir должен быть общим для всех процессов и хостов приложения (например, сетевой том): файл, записанный
+одним процессом, отдает ручка скачивания любого другого. Готовый файл удаляется через export_ttl_seconds.
+"""
+
+import asyncio
+import csv
+import gzip
+import io
+import time
+from pathlib import Path
+from typing import IO, Any, Optional, Sequence
+
+import orjson
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.jobs import JobQueue, JobRun
+from src.models import Book, Job
+from src.schemas import ExportFormat
+from src.stats import catalog_books_count
+
+__all__ = ['EXPORT_JOB_KIND', 'ExportManager']
+
+EXPORT_JOB_KIND = 'books_export'
+EXPORT_COLUMNS = (Book.id, Book.title, Book.author, Book.year, Book.count_pages, Book.seller_id)
+# Сколько строк читается из курсора и пишется в файл за раз. После каждой порции обновляется прогресс задачи.
+EXPORT_CHUNK_SIZE = 10_000
+# Уровень сжатия gzip: 6 почти не уступает 9 по размеру, но заметно быстрее.
+EXPORT_COMPRESS_LEVEL = 6
+
+
+def _encode_rows(export_format: ExportFormat, rows: Sequence[Any]) -> bytes:
+    if export_format is ExportFormat.CSV:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode()
+    return b''.join(orjson.dumps(row._asdict()) + b'\n' for row in rows)
+
+
+def _write_chunk(file: IO[bytes], export_format: ExportFormat, rows: Sequence[Any]) -> None:
+    # Вызывается в потоке: сериализация и сжатие не блокируют event loop.
+    file.write(_encode_rows(export_format, rows))
+
+
+class ExportManager(JobQueue):
+    """Очередь выгрузок каталога (см. JobQueue). Файлы пишутся в directory и удаляются вместе с задачей через ttl."""
+
+    def __init__(self, directory: Path, **kwargs: Any):
+        super().__init__(EXPORT_JOB_KIND, **kwargs)
+        self.directory = directory
+
+    def start(self, session_factory: async_sessionmaker[AsyncSession]) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        super().start(session_factory)
+
+    async def submit(self, session: AsyncSession, export_format: ExportFormat) -> Optional[Job]:
+        return await self.enqueue(session, {'format': export_format.value})
+
+    def file_path(self, export: Job) -> Path:
+        return self.directory / f'{export.id}.{export.params["format"]}.gz'
+
+    async def execute(self, run: JobRun) -> None:
+        export_format = ExportFormat(run.params['format'])
+        path = self.directory / f'{run.job_id}.{export_format.value}.gz'
+        # У каждой попытки свой недописанный файл: воркер, у которого забрали задачу, не испортит чужой.
+        # Прерванная или упавшая выгрузка удаляет свой файл; повторная попытка пишет файл заново.
+        partial_path = path.with_name(f'{path.name}.{run.claim}.part')
+        try:
+            processed = await self._export(run, export_format, partial_path)
+            partial_path.rename(path)
+        except BaseException:
+            partial_path.unlink(missing_ok=True)
+            raise
+        await run.progress(processed=processed)
+
+    async def _export(self, run: JobRun, export_format: ExportFormat, partial_path: Path) -> int:
+        async with self.session_factory() as session:
+            # Оценка для прогресса из сводной статистики; точное число строк — processed по окончании.
+            total = await session.scalar(select(catalog_books_count()))
+            await run.progress(total=int(total), processed=0)
+
+            processed = 0
+            query = select(*EXPORT_COLUMNS).order_by(Book.id).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+            with gzip.open(partial_path, 'wb', compresslevel=EXPORT_COMPRESS_LEVEL) as file:
+                if export_format is ExportFormat.CSV:
+                    file.write(_encode_rows(export_format, [[column.key for column in EXPORT_COLUMNS]]))
+                db_result = await session.stream(query)
+                async for rows in db_result.partitions():
+                    await asyncio.to_thread(_write_chunk, file, export_format, rows)
+                    processed += len(rows)
+                    await run.progress(processed=processed)
+        return processed
+
+    async def remove_expired(self) -> int:
+        """
+        Удаляет задачи, завершенные больше ttl назад, и файлы старше ttl, которым не соответствует ни одна
+        оставшаяся задача: готовые файлы удаленных задач и недописанные файлы упавших воркеров.
+        Файлы идущих выгрузок (этого или другого процесса) не удаляются, сколько бы ни шла выгрузка.
+        Возвращает число удаленных файлов.
+        """
+        await super().remove_expired()
+        async with self.session_factory() as session:
+            exports = set(await session.scalars(select(Job.id).where(Job.kind == self.kind)))
+
+        expired_before = time.time() - self.ttl
+        removed = 0
+        for path in self.directory.glob('*.gz*'):
+            if path.name.split('.', 1)[0] in exports:
+                continue
+            # Файл могла только что удалить очистка другого процесса: export_dir общий.
+            try:
+                if path.stat().st_mtime >= expired_before:
+                    continue
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            removed += 1
+        return removed
@@ -0,0 +1,246 @@
+"""
+Фоновые задачи, общие для всех процессов приложения.
+
+Запрос только записывает задачу в jobs_table; выполняют ее воркеры JobQueue, запущенные в lifespan каждого
+процесса. Статус и прогресс хранятся в БД, поэтому их отдает любой процесс, а задачи переживают перезапуск:
+задачи останавливаемого процесса stop() возвращает в очередь, а задачу упавшего процесса забирает другой воркер,
+когда ее heartbeat_at устареет. Поэтому обработчик должен допускать повторный запуск прерванной задачи.
+"""
+
+import asyncio
+import logging
+import uuid
+from contextlib import suppress
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Optional
+
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.configurations.database import on_commit
+from src.models import Job
+from src.schemas import JobStatus
+
+__all__ = ['JobClaimLost', 'JobHandler', 'JobQueue', 'JobRun']
+
+logger = logging.getLogger(__name__)
+
+JOB_ERROR_LENGTH = 500
+
+
+class JobClaimLost(Exception):
+    """Задачу забрал другой воркер, решив, что этот завис: результат этого воркера больше не нужен."""
+
+
+@dataclass
+class JobRun:
+    """Задача, взятая воркером. processed — прогресс, сохраненный предыдущими попытками."""
+
+    job_id: str
+    params: dict[str, Any]
+    processed: int
+    claim: str
+    queue: 'JobQueue'
+
+    @property
+    def session_factory(self) -> async_sessionmaker[AsyncSession]:
+        return self.queue.session_factory
+
+    async def progress(self, **values: Any) -> None:
+        """Сохраняет прогресс задачи (processed, total) и продлевает ее heartbeat_at."""
+        await self.queue.update(self.job_id, self.claim, **values)
+
+
+JobHandler = Callable[[JobRun], Awaitable[None]]
+
+
+class JobQueue:
+    """
+    max_concurrent воркеров процесса, которые разбирают общую для всех процессов очередь задач вида kind.
+    Задачу забирает ровно один воркер (FOR UPDATE SKIP LOCKED). Задачи, поставленные в этом процессе, воркеры
+    берут сразу после коммита, поставленные в других — не позже чем через poll_interval секунд.
+    Задачу, у которой heartbeat_at не обновлялся stale_after секунд (процесс упал или завис), забирает
+    другой воркер. Если в очереди уже queue_size задач, новая не принимается (enqueue возвращает None).
+    Задачи, завершенные больше ttl назад, удаляются фоновой задачей раз в cleanup_interval секунд.
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        max_concurrent: int,
+        queue_size: int,
+        ttl: float,
+        cleanup_interval: float,
+        poll_interval: float,
+        stale_after: float,
+        handler: Optional[JobHandler] = None,
+    ):
+        self.kind = kind
+        self.max_concurrent = max_concurrent
+        self.queue_size = queue_size
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self._handler = handler
+        self._session_factory: Optional[async_sessionmaker[AsyncSession]] = None
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+        self._running = 0
+
+    @property
+    def session_factory(self) -> async_sessionmaker[AsyncSession]:
+        return self._session_factory
+
+    def handler(self, func: JobHandler) -> JobHandler:
+        """Назначает обработчик задач очереди. Используется как декоратор."""
+        self._handler = func
+        return func
+
+    def start(self, session_factory: async_sessionmaker[AsyncSession]) -> None:
+        self._session_factory = session_factory
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.max_concurrent)]
+        self._tasks.append(asyncio.create_task(self._cleanup()))
+
+    async def stop(self) -> None:
+        """Останавливает воркеры. Незавершенные задачи возвращаются в очередь и выполняются снова после запуска."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(
+        self, session: AsyncSession, params: dict[str, Any], total: Optional[int] = None
+    ) -> Optional[Job]:
+        """
+        Ставит задачу в очередь в транзакции session; воркеры этого процесса будятся после ее коммита.
+        Длина очереди проверяется без блокировок, поэтому параллельные запросы могут немного превысить queue_size.
+        """
+        query = select(func.count()).where(Job.kind == self.kind, Job.status == JobStatus.PENDING.value)
+        if await session.scalar(query) >= self.queue_size:
+            return None
+
+        job = Job(kind=self.kind, params=params, status=JobStatus.PENDING.value, total=total, processed=0)
+        session.add(job)
+        await session.flush()
+        on_commit(session, self._wakeup.set)
+        return job
+
+    async def _worker(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                if await self.run_next():
+                    continue
+            except Exception:
+                logger.exception('Job worker (%s) failed', self.kind)
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+
+    async def run_next(self) -> bool:
+        """Забирает самую старую задачу из очереди и выполняет ее. Возвращает False, если задач нет."""
+        claim = uuid.uuid4().hex
+        stale = and_(
+            Job.status == JobStatus.RUNNING.value,
+            Job.heartbeat_at < func.now() - timedelta(seconds=self.stale_after),
+        )
+        next_job = (
+            select(Job.id)
+            .where(Job.kind == self.kind, or_(Job.status == JobStatus.PENDING.value, stale))
+            .order_by(Job.created_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        query = (
+            update(Job)
+            .where(Job.id == next_job)
+            .values(status=JobStatus.RUNNING.value, claim=claim, heartbeat_at=func.now(), error=None)
+            .returning(Job.id, Job.params, Job.processed)
+            .execution_options(synchronize_session=False)
+        )
+        async with self._session_factory() as session:
+            claimed = (await session.execute(query)).first()
+            await session.commit()
+        if claimed is None:
+            return False
+
+        self._running += 1
+        try:
+            await self._run(JobRun(claimed.id, claimed.params, claimed.processed, claim, self))
+        finally:
+            self._running -= 1
+        return True
+
+    async def _run(self, run: JobRun) -> None:
+        try:
+            await self.execute(run)
+        except asyncio.CancelledError:
+            with suppress(JobClaimLost, SQLAlchemyError):
+                await self.update(run.job_id, run.claim, status=JobStatus.PENDING.value, claim=None, heartbeat_at=None)
+            raise
+        except JobClaimLost:
+            logger.warning('Job %s (%s) was taken over by another worker', run.job_id, self.kind)
+            return
+        except Exception as e:
+            logger.exception('Job %s (%s) failed', run.job_id, self.kind)
+            await self.update(
+                run.job_id,
+                run.claim,
+                status=JobStatus.FAILED.value,
+                error=str(e)[:JOB_ERROR_LENGTH],
+                finished_at=func.now(),
+            )
+            return
+
+        await self.update(run.job_id, run.claim, status=JobStatus.DONE.value, finished_at=func.now())
+
+    async def execute(self, run: JobRun) -> None:
+        """Выполняет задачу. По умолчанию вызывает обработчик, назначенный через handler."""
+        await self._handler(run)
+
+    async def update(self, job_id: str, claim: str, /, **values: Any) -> None:
+        """
+        Обновляет задачу и ее heartbeat_at отдельной короткой транзакцией, чтобы прогресс сразу видели все процессы.
+        Если задачу уже забрал другой воркер, выбрасывает JobClaimLost.
+        """
+        query = (
+            update(Job)
+            .where(Job.id == job_id, Job.claim == claim)
+            .values({'heartbeat_at': func.now(), **values})
+            .execution_options(synchronize_session=False)
+        )
+        async with self._session_factory() as session:
+            result = await session.execute(query)
+            await session.commit()
+        if result.rowcount == 0:
+            raise JobClaimLost(job_id)
+
+    async def _cleanup(self) -> None:
+        while True:
+            await asyncio.sleep(self.cleanup_interval)
+            try:
+                await self.remove_expired()
+            except (OSError, SQLAlchemyError) as e:
+                logger.warning('Job cleanup (%s) failed: %s', self.kind, e)
+
+    async def remove_expired(self) -> int:
+        """Удаляет задачи, завершенные больше ttl назад. Возвращает число удаленных задач."""
+        async with self._session_factory() as session:
+            result = await session.execute(
+                delete(Job)
+                .where(Job.kind == self.kind, Job.finished_at < func.now() - timedelta(seconds=self.ttl))
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+        return result.rowcount
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            'kind': self.kind,
+            'workers': self.max_concurrent,
+            'running': self._running,
+            'queue_size': self.queue_size,
+        }
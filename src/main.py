@@ -1,25 +1,44 @@
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
-from fastapi.responses import ORJSONResponse
+from fastapi.middleware import Middleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 
-from src.configurations import create_db_and_tables, delete_db_and_tables, global_init
-from src.routers import v1_router
+from src.configurations import get_session_factory, global_init, migrate_db
+from src.configurations.settings import settings
+from src.middleware import AdmissionControlMiddleware, MetricsMiddleware
+from src.routers import internal_router, v1_router
+from src.tools import admission_controller, catalog_stats_compactor, export_manager, route_metrics, seller_delete_queue
+
+# Content-Type текстового формата Prometheus.
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
 
 
 @asynccontextmanager
 async def lifespan(_: FastAPI):
-    # Запускается при старте приложения.
+    # Запускается при старте приложения. Если схема актуальна, это один запрос к schema_version.
     global_init()
-    await create_db_and_tables()
+    await migrate_db()
+    export_manager.start(get_session_factory())
+    seller_delete_queue.start(get_session_factory())
+    catalog_stats_compactor.start(get_session_factory())
     yield
-    # Запускается при остановке приложения.
-    await delete_db_and_tables()
+    # При остановке данные не трогаем: схема и записи переживают перезапуск.
+    # Прерванные фоновые задачи возвращаются в очередь и продолжаются после запуска.
+    await catalog_stats_compactor.stop()
+    await export_manager.stop()
+    await seller_delete_queue.stop()
 
 
 # Само приложение FastAPI. Именно оно запускается сервером и служит точкой входа.
 # В нем можно указать разные параметры для Swagger и для ручек (endpoints).
 def create_application():
+    # Admission control стоит внутри MetricsMiddleware: отклоненные запросы тоже попадают в метрики
+    # (под маршрутом <shed:группа>, см. src.middleware).
+    middleware = []
+    if settings.admission_enabled:
+        middleware.append(Middleware(AdmissionControlMiddleware, controller=admission_controller))
+
     return FastAPI(
         title='Book Library App',
         description='FastAPI приложение для МТС ШАД',
@@ -27,6 +46,7 @@ def create_application():
         responses={404: {'description': 'Not Found!'}},
         default_response_class=ORJSONResponse,  # Подключаем быстрый serializer.
         lifespan=lifespan,
+        middleware=middleware,
         swagger_ui_parameters={"defaultModelsExpandDepth": -1},  # Скрываем раздел Schema в Docs
     )
 
@@ -34,8 +54,16 @@ def create_application():
 app = create_application()
 
 
+async def metrics():
+    return PlainTextResponse(route_metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
 def _configure():
     app.include_router(v1_router)
+    app.include_router(internal_router)
+    if settings.metrics_enabled:
+        app.add_middleware(MetricsMiddleware, metrics=route_metrics)
+        app.add_api_route('/metrics', metrics, methods=['GET'], include_in_schema=False)
 
 
 _configure()
@@ -0,0 +1,199 @@
+import bisect
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, Optional, Sequence
+
+from sqlalchemy import Connection, Engine, event
+
+__all__ = [
+    'Histogram',
+    'RequestStats',
+    'QueryCounter',
+    'RouteMetrics',
+    'count_queries',
+    'current_request_stats',
+    'DEFAULT_LATENCY_BUCKETS',
+    'DEFAULT_QUERY_COUNT_BUCKETS',
+    'DEFAULT_SIZE_BUCKETS',
+]
+
+# Границы корзин в секундах: от долей миллисекунды до десятков секунд.
+DEFAULT_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Число SQL-запросов за один HTTP-запрос.
+DEFAULT_QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+# Размер тела ответа в байтах.
+DEFAULT_SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными границами корзин (в стиле Prometheus).
+    Значения могут приходить из пулов потоков, поэтому запись защищена блокировкой.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # последняя корзина — +Inf
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def snapshot(self) -> dict:
+        """Возвращает накопительные счетчики по корзинам, общее число наблюдений и их сумму."""
+        with self._lock:
+            counts = list(self._counts)
+            total_sum = self._sum
+
+        cumulative, buckets = 0, {}
+        for bound, count in zip([*map(str, self.buckets), '+Inf'], counts):
+            cumulative += count
+            buckets[bound] = cumulative
+
+        return {'buckets': buckets, 'count': cumulative, 'sum': total_sum}
+
+
+@dataclass
+class RequestStats:
+    """Обращения к БД в рамках одного HTTP-запроса. Заполняется обработчиками событий движка SQLAlchemy."""
+
+    db_queries: int = 0
+    db_time: float = 0.0
+
+
+# Статистика текущего HTTP-запроса. None вне запроса (фоновые задачи, старт приложения).
+current_request_stats: ContextVar[Optional[RequestStats]] = ContextVar('current_request_stats', default=None)
+
+
+@dataclass
+class QueryCounter:
+    """
+    SQL-выражения, выполненные внутри count_queries(), и отдельно — BEGIN/COMMIT/ROLLBACK.
+    Для соединений в режиме autocommit SQLAlchemy тоже генерирует события транзакции, но драйвер
+    ничего не отправляет в БД, поэтому они не учитываются.
+    """
+
+    statements: list[str] = field(default_factory=list)
+    transactions: list[str] = field(default_factory=list)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        self.statements.append(statement)
+
+    def _transaction_event(self, statement: str) -> Callable[[Connection], None]:
+        def listener(conn: Connection) -> None:
+            if conn.get_execution_options().get('isolation_level') != 'AUTOCOMMIT':
+                self.transactions.append(statement)
+
+        return listener
+
+
+@contextmanager
+def count_queries(target=Engine) -> Iterator[QueryCounter]:
+    """
+    Считает SQL-выражения, отправленные в БД внутри блока, по событию after_cursor_execute,
+    и команды управления транзакцией по событиям begin, commit и rollback.
+    По умолчанию слушает все движки процесса; можно передать конкретный Engine или Connection.
+    """
+    counter = QueryCounter()
+    listeners = [('after_cursor_execute', counter._after_cursor_execute)]
+    listeners += [(name, counter._transaction_event(name.upper())) for name in ('begin', 'commit', 'rollback')]
+    for name, listener in listeners:
+        event.listen(target, name, listener)
+    try:
+        yield counter
+    finally:
+        for name, listener in listeners:
+            event.remove(target, name, listener)
+
+
+class _RouteSeries:
+    def __init__(self):
+        self.requests: defaultdict[int, int] = defaultdict(int)  # status -> число запросов
+        self.duration = Histogram(DEFAULT_LATENCY_BUCKETS)
+        self.db_queries = Histogram(DEFAULT_QUERY_COUNT_BUCKETS)
+        self.db_duration = Histogram(DEFAULT_LATENCY_BUCKETS)
+        self.response_size = Histogram(DEFAULT_SIZE_BUCKETS)
+
+
+class RouteMetrics:
+    """
+    Метрики HTTP-запросов по шаблонам маршрутов ('/api/v1/books/{book_id}', а не конкретным URL).
+    На запрос приходится несколько bisect и сложений; текст в формате Prometheus собирается только при опросе.
+    """
+
+    _HISTOGRAMS = (
+        ('http_request_duration_seconds', 'duration', 'Время обработки запроса.'),
+        ('http_request_db_queries', 'db_queries', 'Число SQL-запросов за HTTP-запрос.'),
+        ('http_request_db_duration_seconds', 'db_duration', 'Время выполнения SQL-запросов за HTTP-запрос.'),
+        ('http_response_size_bytes', 'response_size', 'Размер тела ответа.'),
+    )
+
+    def __init__(self):
+        self._series: dict[tuple[str, str], _RouteSeries] = {}
+        self._lock = threading.Lock()
+
+    def observe(
+        self,
+        method: str,
+        route: str,
+        status_code: int,
+        duration: float,
+        stats: RequestStats,
+        response_size: int,
+    ) -> None:
+        key = (method, route)
+        if (series := self._series.get(key)) is None:
+            with self._lock:
+                series = self._series.setdefault(key, _RouteSeries())
+
+        series.requests[status_code] += 1
+        series.duration.observe(duration)
+        series.db_queries.observe(stats.db_queries)
+        series.db_duration.observe(stats.db_time)
+        series.response_size.observe(response_size)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> str:
+        """Возвращает метрики в текстовом формате Prometheus."""
+        with self._lock:
+            series = sorted(self._series.items())
+
+        lines = ['# HELP http_requests_total Число обработанных запросов.', '# TYPE http_requests_total counter']
+        for (method, route), route_series in series:
+            for status_code, count in sorted(route_series.requests.items()):
+                labels = _format_labels(method=method, route=route, status=status_code)
+                lines.append(f'http_requests_total{{{labels}}} {count}')
+
+        for name, attribute, description in self._HISTOGRAMS:
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+            for (method, route), route_series in series:
+                snapshot = getattr(route_series, attribute).snapshot()
+                labels = _format_labels(method=method, route=route)
+                for bound, count in snapshot['buckets'].items():
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{name}_sum{{{labels}}} {snapshot["sum"]}')
+                lines.append(f'{name}_count{{{labels}}} {snapshot["count"]}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(**labels) -> str:
+    return ','.join(f'{name}="{_escape_label(str(value))}"' for name, value in labels.items())
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,139 @@
+import time
+from typing import Optional
+
+from fastapi import status
+from fastapi.responses import ORJSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.admission import AdmissionController
+from src.metrics import RequestStats, RouteMetrics, current_request_stats
+
+__all__ = ['AdmissionControlMiddleware', 'MetricsMiddleware', 'route_group']
+
+# Метка для запросов, не попавших ни в один маршрут (404 и т.п.), чтобы не плодить метрики по произвольным URL.
+UNMATCHED_ROUTE = '<unmatched>'
+# Метка для запросов, отклоненных admission control до маршрутизации: '<shed:read>', '<shed:write>', '<shed:auth>'.
+SHED_ROUTE = '<shed:{group}>'
+# Ключ scope, в который AdmissionControlMiddleware записывает группу отклоненного запроса.
+SHED_GROUP_SCOPE_KEY = 'admission.shed_group'
+
+SAFE_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+# Ручки, где основное время занимает bcrypt: выдача токена и регистрация продавца.
+AUTH_ROUTES = frozenset({('POST', '/api/v1/token/'), ('POST', '/api/v1/seller/')})
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware, собирающий метрики запросов: время до отправки последнего байта ответа,
+    число и время SQL-запросов (через current_request_stats) и размер ответа.
+    Написан на чистом ASGI, без BaseHTTPMiddleware, чтобы не добавлять задержку и не буферизовать стриминг.
+    """
+
+    def __init__(self, app: ASGIApp, metrics: RouteMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        started_at = time.perf_counter()
+        status_code = 500
+        response_size = 0
+        duration = None
+
+        async def send_with_metrics(message: Message) -> None:
+            nonlocal status_code, response_size, duration
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            elif message['type'] == 'http.response.body':
+                response_size += len(message.get('body', b''))
+                if not message.get('more_body', False):
+                    duration = time.perf_counter() - started_at
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            current_request_stats.reset(token)
+            self.metrics.observe(
+                method=scope['method'],
+                route=_route_label(scope),
+                status_code=status_code,
+                duration=time.perf_counter() - started_at if duration is None else duration,
+                stats=stats,
+                response_size=response_size,
+            )
+
+
+def _route_label(scope: Scope) -> str:
+    # Роутер FastAPI кладет найденный маршрут в scope, его path — шаблон вида '/api/v1/books/{book_id}'.
+    if (route := scope.get('route')) is not None:
+        return route.path
+    # Отклоненный admission control запрос до роутера не доходит: метка — его группа, а не <unmatched>.
+    if (group := scope.get(SHED_GROUP_SCOPE_KEY)) is not None:
+        return SHED_ROUTE.format(group=group)
+    return UNMATCHED_ROUTE
+
+
+def route_group(method: str, path: str) -> Optional[str]:
+    """Группа лимитов admission control для запроса. None — запрос не ограничивается."""
+    if not path.startswith('/api/'):
+        return None  # /metrics, /internal и документация должны отвечать и под нагрузкой
+    if (method, path) in AUTH_ROUTES:
+        return 'auth'
+    return 'read' if method in SAFE_METHODS else 'write'
+
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware, ограничивающий число одновременных запросов по группам ручек (см. src.admission).
+    Запрос, не получивший слот, сразу получает 503 с Retry-After и не доходит до БД.
+    В метриках MetricsMiddleware такие запросы учитываются под маршрутом SHED_ROUTE своей группы.
+
+    Слот освобождается, как только приложение начинает ответ (http.response.start): к этому моменту обработчик
+    и его зависимости уже выполнены. Поэтому долгая передача тела — стриминговые выгрузки, скачивание файлов,
+    медленные клиенты — и фоновые задачи ответа не занимают слоты и не вытесняют короткие запросы;
+    соединения с БД, которые держат стриминговые ответы, ограничивает уже пул соединений.
+    """
+
+    def __init__(self, app: ASGIApp, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http' or (group := route_group(scope['method'], scope['path'])) is None:
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self.controller.limiters[group]
+        if not await limiter.acquire():
+            scope[SHED_GROUP_SCOPE_KEY] = group
+            response = ORJSONResponse(
+                {'detail': 'Service is overloaded, retry later'},
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': str(self.controller.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                limiter.release()
+
+        async def send_wrapper(message: Message) -> None:
+            if message['type'] == 'http.response.start':
+                release()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            release()
@@ -1,5 +1,20 @@
 from .base import BaseModel
-from .books import Book
+from .books import SEARCH_CONFIG, Book, book_search_vector
+from .jobs import Job
 from .sellers import Seller
+from .stats import CATALOG_STATS_ID, BookAuthorStats, BookCatalogStatsDelta, BookStats, BookYearStats, SellerStats
 
-__all__ = ['BaseModel', 'Book', 'Seller']
+__all__ = [
+    'BaseModel',
+    'Book',
+    'Job',
+    'Seller',
+    'BookStats',
+    'BookYearStats',
+    'BookAuthorStats',
+    'BookCatalogStatsDelta',
+    'SellerStats',
+    'CATALOG_STATS_ID',
+    'SEARCH_CONFIG',
+    'book_search_vector',
+]
@@ -1,8 +1,16 @@
-from sqlalchemy import ForeignKey, Integer, String
+from sqlalchemy import BigInteger, ForeignKey, Index, Integer, Sequence, String, func, text
+from sqlalchemy.dialects import postgresql  # noqa: F401 регистрирует функции полнотекстового поиска для func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .base import BaseModel
 
+# Общая для всей таблицы монотонная последовательность версий строк.
+# Любая вставка или изменение книги увеличивает max(version), поэтому по (count, max(version)) можно строить ETag списков.
+books_version_seq = Sequence('books_version_seq', metadata=BaseModel.metadata)
+
+# Конфигурация полнотекстового поиска. 'simple' не применяет стемминг и подходит для названий и имен на любом языке.
+SEARCH_CONFIG = text("'simple'::regconfig")
+
 
 class Book(BaseModel):
     __tablename__: str = 'books_table'  # noqa
@@ -12,5 +20,41 @@ class Book(BaseModel):
     author: Mapped[str] = mapped_column(String(100), nullable=False)
     year: Mapped[int] = mapped_column(Integer)
     count_pages: Mapped[int] = mapped_column(Integer)
-    seller_id: Mapped[int] = mapped_column(ForeignKey('sellers_table.id'), nullable=False)
+    # Книги удаляются вместе с продавцом на стороне БД одним DELETE продавца.
+    seller_id: Mapped[int] = mapped_column(ForeignKey('sellers_table.id', ondelete='CASCADE'), nullable=False)
+    version: Mapped[int] = mapped_column(
+        BigInteger,
+        books_version_seq,
+        server_default=books_version_seq.next_value(),
+        onupdate=books_version_seq.next_value(),
+        nullable=False,
+    )
     seller = relationship(argument='Seller', back_populates='books', single_parent=True)
+
+    # Забираем сгенерированную БД версию через RETURNING сразу при INSERT/UPDATE.
+    __mapper_args__ = {'eager_defaults': True}
+    # Составные индексы (фильтр, id) под keyset-пагинацию отфильтрованных списков.
+    # Индекс по продавцу покрывающий: каталог продавца и его ETag читаются index-only scan'ом.
+    __table_args__ = (
+        Index(
+            'ix_books_table_seller_id_id',
+            'seller_id',
+            'id',
+            postgresql_include=['title', 'author', 'year', 'count_pages', 'version'],
+        ),
+        Index('ix_books_table_author_id', 'author', 'id'),
+        Index('ix_books_table_year_id', 'year', 'id'),
+        Index('ix_books_table_count_pages_id', 'count_pages', 'id'),
+        # max(version) для ETag каталога и каталога продавца — один спуск по индексу.
+        Index('ix_books_table_version', 'version'),
+        Index('ix_books_table_seller_id_version', 'seller_id', 'version'),
+    )
+
+
+# Поисковый документ книги: совпадения в названии весят больше, чем в авторе.
+# Запросы должны использовать именно это выражение, иначе Postgres не применит GIN-индекс.
+_title_document = func.setweight(func.to_tsvector(SEARCH_CONFIG, Book.__table__.c.title), text("'A'"))
+_author_document = func.setweight(func.to_tsvector(SEARCH_CONFIG, Book.__table__.c.author), text("'B'"))
+book_search_vector = _title_document.op('||')(_author_document)
+
+Index('ix_books_table_search', book_search_vector, postgresql_using='gin')
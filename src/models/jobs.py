@@ -0,0 +1,33 @@
+import uuid
+from datetime import datetime
+from typing import Any, Optional
+
+from sqlalchemy import JSON, BigInteger, DateTime, Index, String, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import BaseModel
+
+
+# Фоновые задачи (см. src.jobs): удаление продавцов, выгрузки каталога. Состояние хранится в БД, а не в памяти
+# процесса: статус и прогресс доступны через любой воркер приложения, а задачи переживают перезапуск.
+class Job(BaseModel):
+    __tablename__: str = 'jobs_table'  # noqa
+
+    id: Mapped[str] = mapped_column(String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
+    kind: Mapped[str] = mapped_column(String(30), nullable=False)
+    # Параметры задачи для ее обработчика, например id продавца или формат выгрузки.
+    params: Mapped[dict[str, Any]] = mapped_column(JSON, nullable=False, default=dict)
+    status: Mapped[str] = mapped_column(String(10), nullable=False, default='pending')
+    total: Mapped[Optional[int]] = mapped_column(BigInteger)
+    processed: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    error: Mapped[Optional[str]] = mapped_column(String(500))
+    # Метка воркера, взявшего задачу. Воркер, у которого задачу забрали, больше не может ее обновлять.
+    claim: Mapped[Optional[str]] = mapped_column(String(32))
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    # Воркер обновляет heartbeat_at с прогрессом. Задачу с устаревшим heartbeat_at забирает другой воркер.
+    heartbeat_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+
+
+# Воркеры выбирают из начала этого индекса самую старую задачу своего вида в очереди.
+Index('ix_jobs_table_kind_status_created_at', Job.kind, Job.status, Job.created_at)
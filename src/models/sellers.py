@@ -1,8 +1,11 @@
-from sqlalchemy import Integer, String
+from sqlalchemy import BigInteger, Index, Integer, Sequence, String
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .base import BaseModel
 
+# Монотонная последовательность версий строк продавцов (см. books_version_seq).
+sellers_version_seq = Sequence('sellers_version_seq', metadata=BaseModel.metadata)
+
 
 class Seller(BaseModel):
     __tablename__: str = 'sellers_table'  # noqa
@@ -12,4 +15,17 @@ class Seller(BaseModel):
     last_name: Mapped[str] = mapped_column(String(50), nullable=False)
     email: Mapped[str] = mapped_column(String(100), unique=True, index=True, nullable=False)
     hashed_password: Mapped[str] = mapped_column(String(128), nullable=False)
-    books = relationship(argument='Book', back_populates='seller', cascade='all, delete-orphan')
+    version: Mapped[int] = mapped_column(
+        BigInteger,
+        sellers_version_seq,
+        server_default=sellers_version_seq.next_value(),
+        onupdate=sellers_version_seq.next_value(),
+        nullable=False,
+    )
+    # passive_deletes: при удалении продавца ORM не загружает его книги, их удаляет ON DELETE CASCADE.
+    books = relationship(argument='Book', back_populates='seller', cascade='all, delete-orphan', passive_deletes=True)
+
+    # Забираем сгенерированную БД версию через RETURNING сразу при INSERT/UPDATE.
+    __mapper_args__ = {'eager_defaults': True}
+    # max(version) для ETag списка продавцов — один спуск по индексу.
+    __table_args__ = (Index('ix_sellers_table_version', 'version'),)
@@ -0,0 +1,65 @@
+from sqlalchemy import BigInteger, Index, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import BaseModel
+
+# seller_id строк со статистикой всего каталога. Настоящие id продавцов начинаются с 1.
+# В строках каталога лежат уже сжатые итоги: к ним при чтении прибавляются дельты из BookCatalogStatsDelta.
+CATALOG_STATS_ID = 0
+
+
+# Сводная статистика книг, которую поддерживают триггеры books_table (миграция 2), а не код приложения:
+# так в нее попадают и массовая загрузка, и каскадное удаление книг вместе с продавцом.
+class BookStats(BaseModel):
+    __tablename__: str = 'book_stats_table'  # noqa
+
+    seller_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    books_count: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    total_pages: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+
+class BookYearStats(BaseModel):
+    __tablename__: str = 'book_year_stats_table'  # noqa
+
+    seller_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    year: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    books_count: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+
+class BookAuthorStats(BaseModel):
+    __tablename__: str = 'book_author_stats_table'  # noqa
+
+    seller_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    author: Mapped[str] = mapped_column(String(100), primary_key=True)
+    books_count: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+
+# Число продавцов для ETag списка продавцов — сумма sellers_count всех строк. Триггеры sellers_table (миграция 4)
+# только добавляют строки (+n при вставке, -n при удалении), seller_stats_compact() сворачивает их в одну.
+class SellerStats(BaseModel):
+    __tablename__: str = 'seller_stats_table'  # noqa
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    sellers_count: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+
+# Изменения статистики каталога, еще не перенесенные в строки CATALOG_STATS_ID (миграция 2).
+# Триггеры только добавляют сюда строки, поэтому записи книг разных продавцов не блокируют друг друга;
+# переносит дельты функция book_catalog_stats_compact() (см. src.stats).
+class BookCatalogStatsDelta(BaseModel):
+    __tablename__: str = 'book_catalog_stats_delta_table'  # noqa
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    year: Mapped[int] = mapped_column(Integer, nullable=False)
+    author: Mapped[str] = mapped_column(String(100), nullable=False)
+    books_count: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    total_pages: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+
+# Топ авторов продавца читается из начала этого индекса.
+Index(
+    'ix_book_author_stats_table_top',
+    BookAuthorStats.seller_id,
+    BookAuthorStats.books_count.desc(),
+    BookAuthorStats.author,
+)
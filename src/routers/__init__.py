@@ -1,11 +1,18 @@
 from fastapi import APIRouter
 
+from .internal import internal_router
 from .v1.books import books_router
+from .v1.exports import exports_router
+from .v1.jobs import jobs_router
 from .v1.sellers import seller_router
 from .v1.tokens import token_router
 
 v1_router = APIRouter(prefix='/api/v1')
 
 v1_router.include_router(books_router)
+v1_router.include_router(exports_router)
+v1_router.include_router(jobs_router)
 v1_router.include_router(seller_router)
 v1_router.include_router(token_router)
+
+__all__ = ['internal_router', 'v1_router']
@@ -0,0 +1,62 @@
+from fastapi import APIRouter
+
+from src.configurations import get_pool_stats
+from src.tools import (
+    admission_controller,
+    book_batcher,
+    catalog_stats_compactor,
+    export_manager,
+    password_hasher,
+    response_cache,
+    seller_cache,
+    seller_delete_queue,
+    token_cache,
+)
+
+# Служебные ручки для наблюдения за состоянием приложения. Не предназначены для клиентов API.
+internal_router = APIRouter(tags=['internal'], prefix='/internal')
+
+
+@internal_router.get(path='/password-hasher')
+async def get_password_hasher_stats():
+    return password_hasher.stats()
+
+
+@internal_router.get(path='/auth-cache')
+async def get_auth_cache_stats():
+    return {'tokens': token_cache.stats(), 'sellers': seller_cache.stats()}
+
+
+@internal_router.get(path='/response-cache')
+async def get_response_cache_stats():
+    return response_cache.stats()
+
+
+@internal_router.get(path='/db-pool')
+async def get_db_pool_stats():
+    return get_pool_stats()
+
+
+@internal_router.get(path='/jobs')
+async def get_job_stats():
+    return {queue.kind: queue.stats() for queue in (seller_delete_queue, export_manager)}
+
+
+@internal_router.get(path='/admission')
+async def get_admission_stats():
+    return admission_controller.stats()
+
+
+@internal_router.get(path='/book-batcher')
+async def get_book_batcher_stats():
+    return book_batcher.stats()
+
+
+@internal_router.get(path='/exports')
+async def get_export_stats():
+    return export_manager.stats()
+
+
+@internal_router.get(path='/catalog-stats')
+async def get_catalog_stats_compactor_stats():
+    return catalog_stats_compactor.stats()
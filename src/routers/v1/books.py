@@ -1,54 +1,338 @@
-from typing import Annotated
+import re
+import time
+from functools import partial
+from typing import Annotated, Any, AsyncIterator, Optional
 
-from fastapi import APIRouter, Depends, Response, status
-from sqlalchemy import select
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import and_, delete, func, insert, or_, select, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from src.models import Book, Seller
-from src.schemas import IncomingBook, ReturnedAllBooks, ReturnedBookWithSellerId
-from src.tools import DBSession, get_current_seller
+from src.cache import CachedResponse
+from src.configurations import on_commit
+from src.configurations.settings import settings
+from src.models import CATALOG_STATS_ID, SEARCH_CONFIG, Book, Seller, book_search_vector
+from src.schemas import IncomingBook, ReturnedAllBooks, ReturnedBookStats, ReturnedBookWithSellerId, ReturnedBulkBooks
+from src.stats import catalog_books_count, get_book_stats
+from src.tools import (
+    DEFAULT_PAGE_SIZE,
+    DEFAULT_TOP_AUTHORS,
+    MAX_PAGE_SIZE,
+    BookFields,
+    BookFilters,
+    DBReadSession,
+    DBSession,
+    IfNoneMatch,
+    InvalidCursorException,
+    Page,
+    SessionFactory,
+    TopAuthors,
+    book_batcher,
+    cached_json_response,
+    decode_cursor,
+    encode_cursor,
+    etag_matches,
+    get_collection_etag,
+    get_current_seller,
+    invalidate_book_responses,
+    json_response,
+    make_etag,
+    not_modified_response,
+    paginate,
+    response_cache,
+)
 
 books_router = APIRouter(tags=['books'], prefix='/books')
 
+# Сколько строк читается из серверного курсора и отправляется клиенту за один раз.
+EXPORT_CHUNK_SIZE = 1000
+# Сколько книг валидируется и вставляется одним multi-row INSERT при массовой загрузке.
+BULK_BATCH_SIZE = 1000
+# Максимальное число слов в поисковом запросе.
+SEARCH_MAX_TERMS = 10
+
 
 @books_router.post(path='/', response_model=ReturnedBookWithSellerId, status_code=status.HTTP_201_CREATED)
 async def create_book(
     book: IncomingBook,
     session: DBSession,
+    session_factory: SessionFactory,
     current_seller: Annotated[Seller, Depends(get_current_seller)],
 ):
-    new_book = Book(
-        title=book.title,
-        author=book.author,
-        year=book.year,
-        count_pages=book.count_pages,
-        seller_id=current_seller.id,
-    )
+    values = {
+        'title': book.title,
+        'author': book.author,
+        'year': book.year,
+        'count_pages': book.count_pages,
+        'seller_id': current_seller.id,
+    }
+    if settings.book_write_batching:
+        # Книга вставляется вместе с книгами из одновременных запросов и уже закоммичена (см. InsertBatcher).
+        # Пока запрос ждет пачку, он не держит соединение: сессия запроса не используется, а продавец
+        # для авторизации загружается в короткой сессии (см. get_current_seller).
+        inserted = await book_batcher.insert(session_factory, values)
+        invalidate_book_responses(seller_id=current_seller.id)
+        return {**values, **inserted._asdict()}
+
+    new_book = Book(**values)
     session.add(new_book)
     await session.flush()
+    on_commit(session, partial(invalidate_book_responses, seller_id=current_seller.id))
 
     return new_book
 
 
+async def _iter_bulk_items(request: Request) -> AsyncIterator[Any]:
+    # NDJSON читаем построчно прямо из потока запроса, не дожидаясь всего тела.
+    # Строки отдаются как есть (bytes) и разбираются pydantic'ом вместе с валидацией.
+    if request.headers.get('content-type', '').startswith('application/x-ndjson'):
+        buffer = b''
+        async for chunk in request.stream():
+            *lines, buffer = (buffer + chunk).split(b'\n')
+            for line in lines:
+                if line.strip():
+                    yield line
+        if buffer.strip():
+            yield buffer
+        return
+
+    try:
+        items = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid JSON')
+
+    if not isinstance(items, list):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Expected a JSON array of books')
+
+    for item in items:
+        yield item
+
+
+def _validate_bulk_item(item: Any) -> IncomingBook:
+    if isinstance(item, bytes):
+        return IncomingBook.model_validate_json(item)
+    return IncomingBook.model_validate(item)
+
+
+def _format_errors(error: ValidationError) -> list[dict[str, Any]]:
+    return [{'loc': list(err['loc']), 'msg': err['msg'], 'type': err['type']} for err in error.errors()]
+
+
+async def _insert_books_batch(
+    session: AsyncSession,
+    rows: list[tuple[int, dict[str, Any]]],
+) -> tuple[int, list[dict[str, Any]]]:
+    """Вставляет пачку книг одним запросом. При ошибке БД повторяет вставку построчно, чтобы найти плохие строки."""
+    try:
+        async with session.begin_nested():
+            await session.execute(insert(Book), [row for _, row in rows])
+        return len(rows), []
+    except DBAPIError:
+        pass
+
+    inserted, errors = 0, []
+    for index, row in rows:
+        try:
+            async with session.begin_nested():
+                await session.execute(insert(Book), [row])
+            inserted += 1
+        except DBAPIError as e:
+            errors.append({'index': index, 'errors': [{'loc': [], 'msg': str(e.orig), 'type': 'db_error'}]})
+
+    return inserted, errors
+
+
+@books_router.post(path='/bulk', response_model=ReturnedBulkBooks, status_code=status.HTTP_201_CREATED)
+async def create_books_bulk(
+    request: Request,
+    session: DBSession,
+    current_seller: Annotated[Seller, Depends(get_current_seller)],
+):
+    """
+    Массовая загрузка книг продавца.
+    Принимает JSON-массив или поток NDJSON (Content-Type: application/x-ndjson) объектов формата IncomingBook.
+    Невалидные строки возвращаются в errors и не мешают вставке остальных.
+    """
+    started_at = time.perf_counter()
+    inserted, errors = 0, []
+    batch: list[tuple[int, dict[str, Any]]] = []
+
+    index = 0
+    async for item in _iter_bulk_items(request):
+        try:
+            book = _validate_bulk_item(item)
+        except ValidationError as e:
+            errors.append({'index': index, 'errors': _format_errors(e)})
+        else:
+            batch.append(
+                (
+                    index,
+                    {
+                        'title': book.title,
+                        'author': book.author,
+                        'year': book.year,
+                        'count_pages': book.count_pages,
+                        'seller_id': current_seller.id,
+                    },
+                )
+            )
+        index += 1
+
+        if len(batch) >= BULK_BATCH_SIZE:
+            batch_inserted, batch_errors = await _insert_books_batch(session, batch)
+            inserted += batch_inserted
+            errors.extend(batch_errors)
+            batch = []
+
+    if batch:
+        batch_inserted, batch_errors = await _insert_books_batch(session, batch)
+        inserted += batch_inserted
+        errors.extend(batch_errors)
+
+    if inserted:
+        on_commit(session, partial(invalidate_book_responses, seller_id=current_seller.id))
+
+    elapsed = time.perf_counter() - started_at
+    return {
+        'inserted': inserted,
+        'errors': sorted(errors, key=lambda err: err['index']),
+        'elapsed_seconds': round(elapsed, 6),
+        'rows_per_second': round(inserted / elapsed, 2) if elapsed else 0.0,
+    }
+
+
 @books_router.get(path='/', response_model=ReturnedAllBooks)
-async def get_all_books(session: DBSession):
-    query = select(Book)
-    db_result = await session.execute(query)
-    books = db_result.scalars().all()
-    return {'books': books}
+async def get_all_books(
+    session: DBReadSession,
+    page: Page,
+    filters: BookFilters,
+    fields: BookFields,
+    if_none_match: IfNoneMatch = None,
+):
+    # Полную выгрузку не кэшируем: она может занять слишком много памяти.
+    cache_key = (
+        None
+        if page.full_scan
+        else response_cache.key('books', page.limit, page.cursor, *filters.cache_params(), fields.fields)
+    )
+    if cache_key and (cached := response_cache.get(cache_key)) is not None:
+        return cached_json_response(cached, if_none_match)
+
+    # Если каталог не менялся, клиенту хватит одного агрегирующего запроса.
+    etag = await get_collection_etag(session, catalog_books_count(), Book.version, representation=fields.etag_parts)
+    if etag_matches(if_none_match, etag):
+        return not_modified_response(etag)
+
+    # Выбираем только запрошенные колонки, а не ORM-объекты: страница сериализуется из строк напрямую.
+    books, next_cursor = await paginate(session, filters.apply(select(*fields.columns)), Book.id, page)
+    cached = CachedResponse(body=fields.dump_page('books', books, next_cursor), etag=etag)
+    if cache_key:
+        response_cache.set(cache_key, cached)
+
+    return cached_json_response(cached)
+
+
+async def _stream_books_ndjson(session_factory: async_sessionmaker[AsyncSession]) -> AsyncIterator[bytes]:
+    # Сессия открывается внутри генератора: она должна жить, пока клиент читает ответ.
+    async with session_factory() as session:
+        query = (
+            select(Book.id, Book.title, Book.author, Book.year, Book.count_pages, Book.seller_id)
+            .order_by(Book.id)
+            .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+        )
+        db_result = await session.stream(query)
+        async for rows in db_result.partitions():
+            yield b''.join(orjson.dumps(row._asdict()) + b'\n' for row in rows)
+
+
+@books_router.get(
+    path='/export',
+    response_class=StreamingResponse,
+    responses={200: {'content': {'application/x-ndjson': {}}}},
+)
+async def export_books(session_factory: SessionFactory):
+    """Отдает весь каталог книг в формате NDJSON, не загружая его целиком в память."""
+    return StreamingResponse(_stream_books_ndjson(session_factory), media_type='application/x-ndjson')
+
+
+def _to_prefix_tsquery(q: str) -> Optional[str]:
+    # Каждое слово ищется как префикс ('tolk' найдет 'Tolkien'), все слова должны совпасть.
+    # Спецсимволы синтаксиса tsquery отбрасываются вместе с остальной пунктуацией.
+    terms = re.findall(r'\w+', q)[:SEARCH_MAX_TERMS]
+    return ' & '.join(f'{term}:*' for term in terms) or None
+
+
+@books_router.get(path='/search', response_model=ReturnedAllBooks)
+async def search_books(
+    session: DBReadSession,
+    q: Annotated[str, Query(min_length=1, max_length=200, description='Слова или начала слов из названия и автора.')],
+    fields: BookFields,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+):
+    """Полнотекстовый поиск книг по названию и автору. Результаты отсортированы по релевантности."""
+    if not (ts_query_text := _to_prefix_tsquery(q)):
+        return json_response(fields.dump_page('books', []))
+
+    ts_query = func.to_tsquery(SEARCH_CONFIG, ts_query_text)
+    rank = func.ts_rank(book_search_vector, ts_query).label('rank')
+    query = select(*fields.columns, rank).where(book_search_vector.op('@@')(ts_query)).order_by(rank.desc(), Book.id)
+
+    # Keyset-пагинация по (rank, id): курсор хранит обе величины последней отданной записи.
+    if cursor is not None:
+        values = decode_cursor(cursor)
+        if len(values) != 2 or not isinstance(values[0], (int, float)) or not isinstance(values[1], int):
+            raise InvalidCursorException()
+        last_rank, last_id = values
+        query = query.where(or_(rank < last_rank, and_(rank == last_rank, Book.id > last_id)))
+
+    db_result = await session.execute(query.limit(limit + 1))
+    rows = db_result.all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].rank, rows[-1].id)
+
+    # Колонка rank (и id, если его не запросили) идет после полей ответа и в ответ не попадает.
+    return json_response(fields.dump_page('books', rows, next_cursor))
+
+
+@books_router.get(path='/stats', response_model=ReturnedBookStats)
+async def get_books_stats(session: DBReadSession, top_authors: TopAuthors = DEFAULT_TOP_AUTHORS):
+    """Статистика всего каталога: число книг, сумма страниц, распределение по годам и топ авторов."""
+    return await get_book_stats(session, CATALOG_STATS_ID, top_authors)
 
 
 @books_router.get(path='/{book_id}', response_model=ReturnedBookWithSellerId)
-async def get_book(book_id: int, session: DBSession):
-    if book := await session.get(Book, book_id):
-        return book
+async def get_book(book_id: int, session: DBReadSession, fields: BookFields, if_none_match: IfNoneMatch = None):
+    async def load() -> Optional[CachedResponse]:
+        query = select(*fields.columns, Book.version).where(Book.id == book_id)
+        if book := (await session.execute(query)).first():
+            return CachedResponse(body=fields.dump_one(book), etag=make_etag(book.version, *fields.etag_parts))
+        return None
 
-    return Response(status_code=status.HTTP_404_NOT_FOUND)
+    # Кэшируется только полное представление: его запись удаляется при изменении книги.
+    # Одновременные запросы одной книги выполняют один SELECT на всех (см. ResponseCache.load).
+    if fields.etag_parts:
+        cached = await load()
+    else:
+        cached = await response_cache.load(response_cache.key('book', book_id), load)
+
+    if cached is None:
+        return Response(status_code=status.HTTP_404_NOT_FOUND)
+    return cached_json_response(cached, if_none_match)
 
 
 @books_router.delete(path='/{book_id}')
 async def delete_book(book_id: int, session: DBSession):
-    if deleted_book := await session.get(Book, book_id):
-        await session.delete(deleted_book)
+    # Один DELETE ... RETURNING вместо SELECT + DELETE: пустой результат означает, что книги нет.
+    query = delete(Book).where(Book.id == book_id).returning(Book.seller_id)
+    if (seller_id := (await session.execute(query)).scalar()) is not None:
+        on_commit(session, partial(invalidate_book_responses, seller_id=seller_id, book_id=book_id))
         return Response(status_code=status.HTTP_204_NO_CONTENT)
 
     return Response(status_code=status.HTTP_404_NOT_FOUND)
@@ -61,13 +345,20 @@ async def update_book(
     session: DBSession,
     _: Annotated[Seller, Depends(get_current_seller)],  # здесь происходит авторизация
 ):
-    if updated_book := await session.get(Book, book_id):
-        updated_book.author = new_data.author
-        updated_book.title = new_data.title
-        updated_book.year = new_data.year
-        updated_book.count_pages = new_data.count_pages
-
-        await session.flush()
+    # Один UPDATE ... RETURNING вместо SELECT + UPDATE. Версия строки увеличивается через onupdate колонки.
+    query = (
+        update(Book)
+        .where(Book.id == book_id)
+        .values(
+            title=new_data.title,
+            author=new_data.author,
+            year=new_data.year,
+            count_pages=new_data.count_pages,
+        )
+        .returning(Book.id, Book.title, Book.author, Book.year, Book.count_pages, Book.seller_id)
+    )
+    if updated_book := (await session.execute(query)).first():
+        on_commit(session, partial(invalidate_book_responses, seller_id=updated_book.seller_id, book_id=book_id))
         return updated_book
 
     return Response(status_code=status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Response, status
+from fastapi.responses import FileResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.exports import EXPORT_JOB_KIND
+from src.models import Job
+from src.schemas import IncomingExport, JobStatus, ReturnedExport
+from src.tools import DBSession, dump_response, export_manager, json_response
+
+exports_router = APIRouter(tags=['exports'], prefix='/exports')
+
+# Через сколько секунд предлагать повторить запрос, если очередь выгрузок заполнена.
+EXPORT_RETRY_AFTER_SECONDS = 30
+
+
+def _dump_export(export: Job) -> bytes:
+    download_url = f'/api/v1/exports/{export.id}/download' if export.status == JobStatus.DONE else None
+    return dump_response(
+        ReturnedExport,
+        {
+            'id': export.id,
+            'kind': export.kind,
+            'status': export.status,
+            'format': export.params['format'],
+            'total': export.total,
+            'processed': export.processed,
+            'error': export.error,
+            'download_url': download_url,
+        },
+    )
+
+
+@exports_router.post(path='/', response_model=ReturnedExport, status_code=status.HTTP_202_ACCEPTED)
+async def create_export(export: IncomingExport, session: DBSession):
+    """
+    Ставит выгрузку всего каталога книг в очередь. Файл формируется в фоне и сжимается gzip;
+    прогресс доступен по адресу из заголовка Location, готовый файл — по download_url.
+    """
+    if (job := await export_manager.submit(session, export.format)) is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Too many exports in progress, retry later',
+            headers={'Retry-After': str(EXPORT_RETRY_AFTER_SECONDS)},
+        )
+
+    return json_response(
+        _dump_export(job), status_code=status.HTTP_202_ACCEPTED, headers={'Location': f'/api/v1/exports/{job.id}'}
+    )
+
+
+async def _get_export(session: AsyncSession, export_id: str) -> Optional[Job]:
+    # Задача читается с primary, а не с реплики: ее могли поставить или обновить только что.
+    # populate_existing: воркеры обновляют задачу в своих сессиях, объект из identity map может быть устаревшим.
+    job = await session.get(Job, export_id, populate_existing=True)
+    return job if job is not None and job.kind == EXPORT_JOB_KIND else None
+
+
+@exports_router.get(path='/{export_id}', response_model=ReturnedExport)
+async def get_export(export_id: str, session: DBSession):
+    if job := await _get_export(session, export_id):
+        return json_response(_dump_export(job))
+
+    return Response(status_code=status.HTTP_404_NOT_FOUND)
+
+
+@exports_router.get(
+    path='/{export_id}/download',
+    response_class=FileResponse,
+    responses={200: {'content': {'application/gzip': {}}}},
+)
+async def download_export(export_id: str, session: DBSession):
+    if (job := await _get_export(session, export_id)) is None:
+        return Response(status_code=status.HTTP_404_NOT_FOUND)
+    if job.status != JobStatus.DONE:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f'Export is {job.status}')
+    # Файл мог быть удален по истечении срока хранения.
+    path = export_manager.file_path(job)
+    expired = job.finished_at + timedelta(seconds=export_manager.ttl) < datetime.now(timezone.utc)
+    if expired or not path.exists():
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail='Export file has expired')
+
+    return FileResponse(path, media_type='application/gzip', filename=f'books-{path.name}')
@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Response, status
+
+from src.models import Job
+from src.schemas import ReturnedJob
+from src.tools import DBSession, dump_response, json_response
+
+jobs_router = APIRouter(tags=['jobs'], prefix='/jobs')
+
+
+@jobs_router.get(path='/{job_id}', response_model=ReturnedJob)
+async def get_job(job_id: str, session: DBSession):
+    """Статус и прогресс фоновой задачи."""
+    # Задача читается с primary: ее могли поставить только что. Воркеры обновляют ее в своих сессиях,
+    # поэтому объект из identity map перечитывается (populate_existing).
+    if job := await session.get(Job, job_id, populate_existing=True):
+        return json_response(dump_response(ReturnedJob, job))
+
+    return Response(status_code=status.HTTP_404_NOT_FOUND)
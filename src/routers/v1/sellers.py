@@ -1,16 +1,59 @@
-from typing import Annotated
+from functools import partial
+from typing import Annotated, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Response, status
-from sqlalchemy import select
+from sqlalchemy import delete, func, select, update
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import selectinload
 
-from src.models import Seller
-from src.schemas import BaseSeller, IncomingSeller, ReturnedAllSellers, ReturnedSeller, ReturnedSellerWithBooks
-from src.tools import DBSession, get_current_seller, hash_password
+from src.cache import CachedResponse
+from src.configurations import on_commit
+from src.jobs import JobRun
+from src.models import Book, Seller
+from src.schemas import (
+    BaseSeller,
+    IncomingSeller,
+    ReturnedAllBooks,
+    ReturnedAllSellers,
+    ReturnedBookStats,
+    ReturnedJob,
+    ReturnedSeller,
+    ReturnedSellerWithBooks,
+)
+from src.stats import get_book_stats, seller_books_count, sellers_count
+from src.tools import (
+    DEFAULT_TOP_AUTHORS,
+    BookFields,
+    DBReadSession,
+    DBSession,
+    IfNoneMatch,
+    Page,
+    SellerFields,
+    SellerWithBooksFields,
+    TopAuthors,
+    cached_json_response,
+    dump_response,
+    etag_matches,
+    get_collection_etag,
+    get_current_seller,
+    invalidate_seller_cache,
+    invalidate_seller_responses,
+    json_response,
+    make_etag,
+    not_modified_response,
+    paginate,
+    password_hasher,
+    response_cache,
+    seller_delete_queue,
+)
 
 seller_router = APIRouter(tags=['seller'], prefix='/seller')
 
+# Сколько книг удаляется одной транзакцией при фоновом удалении продавца.
+SELLER_DELETE_BATCH_SIZE = 10_000
+# Через сколько секунд предлагать повторить запрос, если очередь фоновых удалений заполнена.
+SELLER_DELETE_RETRY_AFTER_SECONDS = 30
+
 
 @seller_router.post(path='/', response_model=ReturnedSeller, status_code=status.HTTP_201_CREATED)
 async def create_seller(seller: IncomingSeller, session: DBSession):
@@ -18,7 +61,7 @@ async def create_seller(seller: IncomingSeller, session: DBSession):
         first_name=seller.first_name,
         last_name=seller.last_name,
         email=seller.email,
-        hashed_password=hash_password(seller.password),
+        hashed_password=await password_hasher.hash(seller.password),
     )
     session.add(new_seller)
     try:
@@ -26,36 +69,181 @@ async def create_seller(seller: IncomingSeller, session: DBSession):
     except IntegrityError:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Email already exists')
 
+    on_commit(session, invalidate_seller_responses)
     return new_seller
 
 
 @seller_router.get(path='/', response_model=ReturnedAllSellers)
-async def get_all_sellers(session: DBSession):
-    query = select(Seller)
-    db_result = await session.execute(query)
-    sellers = db_result.scalars().all()
-    return {'sellers': sellers}
+async def get_all_sellers(session: DBReadSession, page: Page, fields: SellerFields, if_none_match: IfNoneMatch = None):
+    # Полную выгрузку не кэшируем: она может занять слишком много памяти.
+    cache_key = None if page.full_scan else response_cache.key('sellers', page.limit, page.cursor, fields.fields)
+    if cache_key and (cached := response_cache.get(cache_key)) is not None:
+        return cached_json_response(cached, if_none_match)
+
+    etag = await get_collection_etag(session, sellers_count(), Seller.version, representation=fields.etag_parts)
+    if etag_matches(if_none_match, etag):
+        return not_modified_response(etag)
+
+    sellers, next_cursor = await paginate(session, select(*fields.columns), Seller.id, page)
+    cached = CachedResponse(body=fields.dump_page('sellers', sellers, next_cursor), etag=etag)
+    if cache_key:
+        response_cache.set(cache_key, cached)
+
+    return cached_json_response(cached)
 
 
 @seller_router.get(path='/{seller_id}', response_model=ReturnedSellerWithBooks)
 async def get_seller(
     seller_id: int,
-    session: DBSession,
+    session: DBReadSession,
     _: Annotated[Seller, Depends(get_current_seller)],  # здесь происходит авторизация
+    fields: SellerWithBooksFields,
+    if_none_match: IfNoneMatch = None,
 ):
-    query = select(Seller).options(selectinload(Seller.books)).where(Seller.id == seller_id)
-    db_result = await session.execute(query)
+    async def load() -> Optional[CachedResponse]:
+        if not fields.with_books:
+            # Без книг достаточно одного SELECT нужных колонок продавца.
+            query = select(*fields.seller.columns, Seller.version).where(Seller.id == seller_id)
+            if seller := (await session.execute(query)).first():
+                etag = make_etag(seller.version, *fields.etag_parts)
+                return CachedResponse(body=fields.seller.dump_one(seller), etag=etag)
+            return None
 
-    if seller := db_result.scalars().first():
-        return seller
+        query = select(Seller).options(selectinload(Seller.books)).where(Seller.id == seller_id)
+        if seller := (await session.execute(query)).scalars().first():
+            # Ответ включает книги продавца, поэтому ETag зависит и от них.
+            books_version = max((book.version for book in seller.books), default=0)
+            etag = make_etag(seller.version, len(seller.books), books_version, *fields.etag_parts)
+            return CachedResponse(body=fields.dump(seller), etag=etag)
+        return None
 
-    return Response(status_code=status.HTTP_404_NOT_FOUND)
+    # Кэшируется только полное представление: его запись удаляется при изменении продавца или его книг.
+    # Одновременные запросы одного продавца выполняют одну загрузку на всех (см. ResponseCache.load).
+    if fields.etag_parts:
+        cached = await load()
+    else:
+        cached = await response_cache.load(response_cache.key('seller', seller_id), load)
+
+    if cached is None:
+        return Response(status_code=status.HTTP_404_NOT_FOUND)
+    return cached_json_response(cached, if_none_match)
+
+
+@seller_router.get(path='/{seller_id}/books', response_model=ReturnedAllBooks)
+async def get_seller_books(
+    seller_id: int,
+    session: DBReadSession,
+    page: Page,
+    fields: BookFields,
+    if_none_match: IfNoneMatch = None,
+):
+    """Каталог книг продавца с пагинацией. Читается index-only scan'ом по ix_books_table_seller_id_id."""
+    namespace = f'seller:{seller_id}:books'
+    cache_key = None if page.full_scan else response_cache.key(namespace, page.limit, page.cursor, fields.fields)
+    if cache_key and (cached := response_cache.get(cache_key)) is not None:
+        return cached_json_response(cached, if_none_match)
+
+    etag = await get_collection_etag(
+        session,
+        seller_books_count(seller_id),
+        Book.version,
+        Book.seller_id == seller_id,
+        representation=fields.etag_parts,
+    )
+    if etag_matches(if_none_match, etag):
+        return not_modified_response(etag)
+
+    # Выбираем только колонки из покрывающего индекса, без загрузки ORM-объектов.
+    query = select(*fields.columns).where(Book.seller_id == seller_id)
+    books, next_cursor = await paginate(session, query, Book.id, page)
+    if not books and page.cursor is None and not await session.get(Seller, seller_id):
+        return Response(status_code=status.HTTP_404_NOT_FOUND)
+
+    cached = CachedResponse(body=fields.dump_page('books', books, next_cursor), etag=etag)
+    if cache_key:
+        response_cache.set(cache_key, cached)
+
+    return cached_json_response(cached)
 
 
-@seller_router.delete(path='/{seller_id}')
-async def delete_seller(seller_id: int, session: DBSession):
-    if deleted_seller := await session.get(Seller, seller_id):
-        await session.delete(deleted_seller)
+@seller_router.get(path='/{seller_id}/stats', response_model=ReturnedBookStats)
+async def get_seller_stats(seller_id: int, session: DBReadSession, top_authors: TopAuthors = DEFAULT_TOP_AUTHORS):
+    """Статистика каталога продавца из сводных таблиц, без загрузки его книг."""
+    stats = await get_book_stats(session, seller_id, top_authors)
+    if not stats['books_count'] and not await session.get(Seller, seller_id):
+        return Response(status_code=status.HTTP_404_NOT_FOUND)
+    return stats
+
+
+def _invalidate_deleted_seller(seller_id: int, email: Optional[str] = None) -> None:
+    if email is not None:
+        invalidate_seller_cache(email)
+    invalidate_seller_responses(seller_id)
+    # Вместе с продавцом удаляются и его книги.
+    response_cache.invalidate('book')
+    response_cache.invalidate('books')
+    response_cache.invalidate(f'seller:{seller_id}:books')
+
+
+@seller_delete_queue.handler
+async def _delete_seller_in_batches(run: JobRun) -> None:
+    """
+    Удаляет книги продавца пачками, каждая пачка в своей транзакции, затем самого продавца.
+    Прерванное удаление при повторном запуске продолжается с оставшихся книг.
+    """
+    seller_id, processed = run.params['seller_id'], run.processed
+    async with run.session_factory() as session:
+        batch = select(Book.id).where(Book.seller_id == seller_id).limit(SELLER_DELETE_BATCH_SIZE).scalar_subquery()
+        query = delete(Book).where(Book.id.in_(batch)).execution_options(synchronize_session=False)
+        while deleted := (await session.execute(query)).rowcount:
+            await session.commit()
+            processed += deleted
+            _invalidate_deleted_seller(seller_id)
+            await run.progress(processed=processed)
+
+        query = delete(Seller).where(Seller.id == seller_id).returning(Seller.email)
+        email = (await session.execute(query)).scalar()
+        await session.commit()
+
+    _invalidate_deleted_seller(seller_id, email)
+
+
+@seller_router.delete(
+    path='/{seller_id}',
+    responses={status.HTTP_202_ACCEPTED: {'model': ReturnedJob, 'description': 'Удаление запущено в фоне'}},
+)
+async def delete_seller(
+    seller_id: int,
+    session: DBSession,
+    background: bool = False,
+):
+    """
+    Удаляет продавца вместе с книгами (ON DELETE CASCADE) одним запросом.
+    С background=true книги удаляются в фоне пачками по SELLER_DELETE_BATCH_SIZE без долгой блокировки строк;
+    ответ 202 содержит задачу, прогресс которой доступен по адресу из заголовка Location.
+    Задача хранится в БД: ее статус отдает любой процесс, а прерванное удаление заканчивает другой воркер.
+    """
+    if background:
+        books_count = select(func.count()).where(Book.seller_id == Seller.id).scalar_subquery()
+        total = (await session.execute(select(books_count).where(Seller.id == seller_id))).scalar()
+        if total is None:
+            return Response(status_code=status.HTTP_404_NOT_FOUND)
+
+        if (job := await seller_delete_queue.enqueue(session, {'seller_id': seller_id}, total=total)) is None:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail='Too many seller deletions in progress, retry later',
+                headers={'Retry-After': str(SELLER_DELETE_RETRY_AFTER_SECONDS)},
+            )
+        return json_response(
+            dump_response(ReturnedJob, job),
+            status_code=status.HTTP_202_ACCEPTED,
+            headers={'Location': f'/api/v1/jobs/{job.id}'},
+        )
+
+    query = delete(Seller).where(Seller.id == seller_id).returning(Seller.email)
+    if (email := (await session.execute(query)).scalar()) is not None:
+        on_commit(session, partial(_invalidate_deleted_seller, seller_id, email))
         return Response(status_code=status.HTTP_204_NO_CONTENT)
 
     return Response(status_code=status.HTTP_404_NOT_FOUND)
@@ -63,12 +251,18 @@ async def delete_seller(seller_id: int, session: DBSession):
 
 @seller_router.put(path='/{seller_id}', response_model=ReturnedSeller, status_code=status.HTTP_202_ACCEPTED)
 async def update_seller(seller_id: int, new_data: BaseSeller, session: DBSession):
-    if updated_seller := await session.get(Seller, seller_id):
-        updated_seller.first_name = new_data.first_name
-        updated_seller.last_name = new_data.last_name
-        updated_seller.email = new_data.email
-
-        await session.flush()
+    # Один UPDATE ... RETURNING вместо SELECT + UPDATE. Подзапрос в RETURNING видит строку до изменения
+    # и отдает прежний email: по нему сбрасывается кэш авторизации.
+    previous_email = select(Seller.email).where(Seller.id == seller_id).scalar_subquery()
+    query = (
+        update(Seller)
+        .where(Seller.id == seller_id)
+        .values(first_name=new_data.first_name, last_name=new_data.last_name, email=new_data.email)
+        .returning(Seller.id, Seller.first_name, Seller.last_name, Seller.email, previous_email.label('previous_email'))
+    )
+    if updated_seller := (await session.execute(query)).first():
+        on_commit(session, partial(invalidate_seller_cache, updated_seller.previous_email))
+        on_commit(session, partial(invalidate_seller_responses, seller_id))
         return updated_seller
 
     return Response(status_code=status.HTTP_404_NOT_FOUND)
@@ -6,7 +6,7 @@ from sqlalchemy import select
 
 from src.models import Seller
 from src.schemas import Token
-from src.tools import DBSession, UnauthorizedException, generate_token, verify_password
+from src.tools import DBSession, UnauthorizedException, generate_token, password_hasher
 
 token_router = APIRouter(tags=['token'], prefix='/token')
 
@@ -20,7 +20,7 @@ async def create_jwt_token(
     db_result = await session.execute(query)
     seller = db_result.scalar_one_or_none()
 
-    if not seller or not verify_password(form_data.password, seller.hashed_password):
+    if not seller or not await password_hasher.verify(form_data.password, seller.hashed_password):
         raise UnauthorizedException('Incorrect email or password')
 
     access_token = generate_token(claims={'sub': seller.email})
@@ -1,5 +1,8 @@
 from .books import *
+from .exports import *
+from .jobs import *
 from .sellers import *
+from .stats import *
 from .tokens import *
 
-__all__ = [books.__all__, sellers.__all__, tokens.__all__]
+__all__ = [books.__all__, exports.__all__, jobs.__all__, sellers.__all__, stats.__all__, tokens.__all__]
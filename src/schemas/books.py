@@ -1,7 +1,9 @@
+from typing import Any, Optional
+
 from pydantic import BaseModel, Field, field_validator
 from pydantic_core import PydanticCustomError
 
-__all__ = ['IncomingBook', 'ReturnedBookWithSellerId', 'ReturnedBook', 'ReturnedAllBooks']
+__all__ = ['IncomingBook', 'ReturnedBookWithSellerId', 'ReturnedBook', 'ReturnedAllBooks', 'ReturnedBulkBooks']
 
 
 class BaseBook(BaseModel):
@@ -43,3 +45,16 @@ class ReturnedBookWithSellerId(ReturnedBook):
 
 class ReturnedAllBooks(BaseModel):
     books: list[ReturnedBookWithSellerId]
+    next_cursor: Optional[str] = None
+
+
+class BulkBookError(BaseModel):
+    index: int
+    errors: list[dict[str, Any]]
+
+
+class ReturnedBulkBooks(BaseModel):
+    inserted: int
+    errors: list[BulkBookError]
+    elapsed_seconds: float
+    rows_per_second: float
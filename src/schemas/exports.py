@@ -0,0 +1,23 @@
+from enum import Enum
+from typing import Optional
+
+from pydantic import BaseModel
+
+from .jobs import ReturnedJob
+
+__all__ = ['ExportFormat', 'IncomingExport', 'ReturnedExport']
+
+
+class ExportFormat(str, Enum):
+    NDJSON = 'ndjson'
+    CSV = 'csv'
+
+
+class IncomingExport(BaseModel):
+    format: ExportFormat = ExportFormat.NDJSON
+
+
+class ReturnedExport(ReturnedJob):
+    format: ExportFormat
+    # Адрес файла, когда выгрузка завершена.
+    download_url: Optional[str] = None
@@ -0,0 +1,22 @@
+from enum import Enum
+from typing import Optional
+
+from pydantic import BaseModel
+
+__all__ = ['JobStatus', 'ReturnedJob']
+
+
+class JobStatus(str, Enum):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+
+class ReturnedJob(BaseModel):
+    id: str
+    kind: str
+    status: JobStatus
+    total: Optional[int] = None
+    processed: int
+    error: Optional[str] = None
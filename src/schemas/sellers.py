@@ -1,4 +1,5 @@
 import re
+from typing import Optional
 
 from pydantic import BaseModel, EmailStr, Field, field_validator
 from pydantic_core import PydanticCustomError
@@ -60,3 +61,4 @@ class ReturnedSellerWithBooks(ReturnedSeller):
 
 class ReturnedAllSellers(BaseModel):
     sellers: list[ReturnedSeller]
+    next_cursor: Optional[str] = None
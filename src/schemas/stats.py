@@ -0,0 +1,20 @@
+from pydantic import BaseModel
+
+__all__ = ['ReturnedBookStats']
+
+
+class YearStats(BaseModel):
+    year: int
+    books_count: int
+
+
+class AuthorStats(BaseModel):
+    author: str
+    books_count: int
+
+
+class ReturnedBookStats(BaseModel):
+    books_count: int
+    total_pages: int
+    years: list[YearStats]
+    top_authors: list[AuthorStats]
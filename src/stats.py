@@ -0,0 +1,170 @@
+"""
+Чтение сводной статистики книг, сжатие дельт статистики каталога и счетчики для ETag списков.
+
+Триггеры books_table (миграция 2) не обновляют строки каталога (seller_id = CATALOG_STATS_ID): на них ждали бы
+друг друга все транзакции, меняющие книги. Вместо этого они дописывают изменения в book_catalog_stats_delta_table,
+а чтение статистики каталога прибавляет дельты к строкам каталога (см. get_book_stats).
+Чтобы дельт оставалось немного и чтение не дорожало, CatalogStatsCompactor раз в interval секунд переносит их
+в строки каталога функцией book_catalog_stats_compact(). Так же устроен счетчик продавцов (миграция 4):
+его строки сворачивает seller_stats_compact(). Сжатие в нескольких процессах одновременно безопасно.
+"""
+
+import asyncio
+import logging
+from typing import Any, Optional
+
+from sqlalchemy import ColumnElement, func, select, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.models import CATALOG_STATS_ID, BookCatalogStatsDelta, BookStats, SellerStats
+
+__all__ = [
+    'CatalogStatsCompactor',
+    'catalog_books_count',
+    'get_book_stats',
+    'seller_books_count',
+    'sellers_count',
+]
+
+logger = logging.getLogger(__name__)
+
+
+def catalog_books_count() -> ColumnElement[int]:
+    """Число книг каталога: сжатый итог плюс еще не сжатые дельты. Без прохода по books_table."""
+    compacted = select(BookStats.books_count).where(BookStats.seller_id == CATALOG_STATS_ID).scalar_subquery()
+    pending = select(func.sum(BookCatalogStatsDelta.books_count)).scalar_subquery()
+    return func.coalesce(compacted, 0) + func.coalesce(pending, 0)
+
+
+def seller_books_count(seller_id: int) -> ColumnElement[int]:
+    """Число книг продавца из сводной статистики."""
+    return func.coalesce(select(BookStats.books_count).where(BookStats.seller_id == seller_id).scalar_subquery(), 0)
+
+
+def sellers_count() -> ColumnElement[int]:
+    """Число продавцов: сумма строк seller_stats_table, которых после сжатия немного."""
+    return func.coalesce(select(func.sum(SellerStats.sellers_count)).scalar_subquery(), 0)
+
+
+# Итоги, годы и топ авторов одним выражением: все части статистики читаются из одного снимка данных.
+# Для каталога (seller_id = CATALOG_STATS_ID) к сжатым строкам прибавляются еще не сжатые дельты;
+# для продавца CTE delta пуст. Топ авторов каталога собирается из топа сжатых строк без авторов из дельт
+# и авторов из дельт с их сжатыми счетчиками: только их места в топе могли измениться.
+BOOK_STATS_QUERY = text(
+    """
+    WITH delta AS (
+        SELECT year, author, books_count, total_pages FROM book_catalog_stats_delta_table
+        WHERE CAST(:seller_id AS INTEGER) = 0
+    ),
+    delta_authors AS (
+        SELECT author, sum(books_count) AS books_count FROM delta GROUP BY author
+    )
+    SELECT
+        CAST(
+            coalesce((SELECT books_count FROM book_stats_table WHERE seller_id = :seller_id), 0)
+            + coalesce((SELECT sum(books_count) FROM delta), 0)
+            AS BIGINT
+        ) AS books_count,
+        CAST(
+            coalesce((SELECT total_pages FROM book_stats_table WHERE seller_id = :seller_id), 0)
+            + coalesce((SELECT sum(total_pages) FROM delta), 0)
+            AS BIGINT
+        ) AS total_pages,
+        (
+            SELECT coalesce(json_agg(json_build_object('year', year, 'books_count', books_count) ORDER BY year), '[]')
+            FROM (
+                SELECT year, CAST(sum(books_count) AS BIGINT) AS books_count
+                FROM (
+                    SELECT year, books_count FROM book_year_stats_table WHERE seller_id = :seller_id
+                    UNION ALL
+                    SELECT year, books_count FROM delta
+                ) AS rows
+                GROUP BY year
+                HAVING sum(books_count) > 0
+            ) AS years
+        ) AS years,
+        (
+            SELECT coalesce(
+                json_agg(json_build_object('author', author, 'books_count', books_count)
+                ORDER BY books_count DESC, author),
+                '[]'
+            )
+            FROM (
+                SELECT author, books_count
+                FROM (
+                    (
+                        SELECT author, books_count FROM book_author_stats_table
+                        WHERE seller_id = :seller_id AND author NOT IN (SELECT author FROM delta_authors)
+                        ORDER BY books_count DESC, author LIMIT :top_authors
+                    )
+                    UNION ALL
+                    SELECT delta_authors.author, CAST(delta_authors.books_count + coalesce(base.books_count, 0) AS BIGINT)
+                    FROM delta_authors
+                    LEFT JOIN book_author_stats_table AS base
+                        ON base.seller_id = :seller_id AND base.author = delta_authors.author
+                ) AS candidates
+                WHERE books_count > 0
+                ORDER BY books_count DESC, author LIMIT :top_authors
+            ) AS top
+        ) AS top_authors
+    """
+)
+
+
+async def get_book_stats(session: AsyncSession, seller_id: int, top_authors: int) -> dict[str, Any]:
+    """
+    Статистика книг продавца (или всего каталога при seller_id = CATALOG_STATS_ID) из сводных таблиц.
+    Запрос идет по первичным ключам и индексу, его стоимость не зависит от числа книг. Он один, поэтому
+    итоги, годы и авторы согласованы между собой и на autocommit-сессии, где у каждого запроса свой снимок.
+    """
+    params = {'seller_id': seller_id, 'top_authors': top_authors}
+    if not (stats := (await session.execute(BOOK_STATS_QUERY, params)).one()).books_count:
+        return {'books_count': 0, 'total_pages': 0, 'years': [], 'top_authors': []}
+    return stats._asdict()
+
+
+class CatalogStatsCompactor:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._session_factory: Optional[async_sessionmaker[AsyncSession]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._runs = 0
+        self._compacted = 0
+        self._failures = 0
+
+    def start(self, session_factory: async_sessionmaker[AsyncSession]) -> None:
+        self._session_factory = session_factory
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def compact(self, session: AsyncSession) -> int:
+        """Сворачивает видимые дельты каталога и счетчика продавцов и коммитит. Возвращает число свернутых строк."""
+        compacted = await session.scalar(select(func.book_catalog_stats_compact() + func.seller_stats_compact()))
+        await session.commit()
+        self._runs += 1
+        self._compacted += compacted
+        return compacted
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                async with self._session_factory() as session:
+                    await self.compact(session)
+            except SQLAlchemyError as e:
+                self._failures += 1
+                logger.warning('Catalog stats compaction failed: %s', e)
+
+    def stats(self) -> dict:
+        return {
+            'interval_seconds': self.interval,
+            'runs': self._runs,
+            'compacted': self._compacted,
+            'failures': self._failures,
+        }
@@ -5,14 +5,18 @@ PyTest автоматически обнаруживает их по имени
 """
 
 import asyncio
+from contextlib import contextmanager, nullcontext
 
 import httpx
 import pytest
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
+from src.configurations.migrations import migrate
 from src.configurations.settings import settings
+from src.metrics import count_queries
 from src.models import BaseModel, Book, Seller
-from src.tools import generate_token, hash_password
+from src.tools import generate_token, hash_password, response_cache, route_metrics, seller_cache, token_cache
 
 # Переопределяем движок для запуска тестов и подключаем его к тестовой базе.
 # Это решает проблему с сохранностью данных в основной базе приложения. Фикстуры тестов их не зачистят.
@@ -36,32 +40,60 @@ def event_loop():
     loop.close()
 
 
-# Создаем таблицы в тестовой БД. Предварительно удаляя старые.
+# Создаем таблицы в тестовой БД миграциями, как при старте приложения. Предварительно удаляя старые.
 @pytest.fixture(scope='session', autouse=True)
 async def create_tables() -> None:
     """Create tables in DB."""
     async with async_test_engine.begin() as connection:
         await connection.run_sync(BaseModel.metadata.drop_all)
-        await connection.run_sync(BaseModel.metadata.create_all)
+        await connection.execute(text('DROP TABLE IF EXISTS schema_version'))
+    await migrate(async_test_engine)
+
+
+# Кэши и метрики живут в памяти процесса, а данные каждого теста откатываются. Сбрасываем их, чтобы тесты не влияли друг на друга.
+@pytest.fixture(autouse=True)
+def clear_caches():
+    token_cache.clear()
+    seller_cache.clear()
+    response_cache.clear()
+    route_metrics.clear()
 
 
 # Создаем сессию для БД используемую для тестов.
+# Все изменения теста идут во внешней транзакции соединения и откатываются в конце.
+# Коммиты внутри приложения (например, в фоновых задачах) превращаются в SAVEPOINT'ы этой транзакции.
 @pytest.fixture
 async def db_session():
     async with async_test_engine.connect() as connection:
-        async with async_test_session(bind=connection) as session:
+        transaction = await connection.begin()
+        async with async_test_session(bind=connection, join_transaction_mode='create_savepoint') as session:
             yield session
-            await session.rollback()
+        await transaction.rollback()
 
 
 # Мы не можем создать 2 приложения (app) - это приведет к ошибкам.
 # Поэтому, на время запуска тестов мы подменяем там зависимость с сессией.
 @pytest.fixture
 def test_app(db_session):
-    from src.configurations.database import get_async_session
+    from src.configurations.database import (
+        get_async_read_session,
+        get_async_session,
+        get_read_session_factory,
+        get_session_factory,
+        run_commit_callbacks,
+    )
     from src.main import app
 
-    app.dependency_overrides[get_async_session] = lambda: db_session
+    async def get_session():
+        yield db_session
+        # Коммита нет (тестовая транзакция откатывается), но отложенные до него действия ручек выполняются.
+        run_commit_callbacks(db_session)
+
+    app.dependency_overrides[get_async_session] = get_session
+    app.dependency_overrides[get_async_read_session] = lambda: db_session
+    # Ручки, открывающие собственные сессии, тоже должны работать внутри тестовой транзакции.
+    app.dependency_overrides[get_session_factory] = lambda: lambda: nullcontext(db_session)
+    app.dependency_overrides[get_read_session_factory] = lambda: lambda: nullcontext(db_session)
 
     return app
 
@@ -106,3 +138,18 @@ async def test_book(db_session: AsyncSession, test_seller: Seller):
 @pytest.fixture
 def jwt_token(test_seller: Seller) -> str:
     return generate_token(claims={'sub': test_seller.email})
+
+
+# Проверка бюджета SQL-запросов ручки: ловит N+1 и случайные лишние запросы.
+# Использование: with query_budget(3): await async_client.get(...)
+@pytest.fixture
+def query_budget():
+    @contextmanager
+    def check(budget: int):
+        with count_queries() as counter:
+            yield counter
+        assert counter.count <= budget, f'{counter.count} SQL statements, budget is {budget}:\n' + '\n'.join(
+            counter.statements
+        )
+
+    return check
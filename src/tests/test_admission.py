@@ -0,0 +1,122 @@
+import asyncio
+
+import httpx
+from fastapi import status
+from httpx import AsyncClient
+
+from src.admission import AdmissionController, ConcurrencyLimiter
+from src.metrics import RouteMetrics
+from src.middleware import AdmissionControlMiddleware, MetricsMiddleware, route_group
+
+
+def test_route_group():
+    assert route_group('GET', '/api/v1/books/1') == 'read'
+    assert route_group('PUT', '/api/v1/books/1') == 'write'
+    assert route_group('POST', '/api/v1/token/') == 'auth'
+    assert route_group('POST', '/api/v1/seller/') == 'auth'
+    assert route_group('GET', '/metrics') is None
+
+
+async def test_limiter_queues_then_rejects():
+    limiter = ConcurrencyLimiter(limit=1, queue_size=1, queue_timeout=1)
+    assert await limiter.acquire()
+
+    waiting = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    assert limiter.stats()['queued'] == 1
+    # Очередь заполнена — следующий запрос отклоняется сразу.
+    assert not await limiter.acquire()
+
+    limiter.release()
+    assert await waiting
+    limiter.release()
+
+    assert limiter.stats() == {
+        'limit': 1,
+        'in_flight': 0,
+        'queue_size': 1,
+        'queued': 0,
+        'admitted': 2,
+        'queued_total': 1,
+        'rejected': 1,
+        'timeouts': 0,
+    }
+
+
+async def test_limiter_queue_timeout():
+    limiter = ConcurrencyLimiter(limit=1, queue_size=10, queue_timeout=0.01)
+    assert await limiter.acquire()
+
+    assert not await limiter.acquire()
+    assert limiter.stats()['timeouts'] == 1
+    assert limiter.stats()['queued'] == 0
+
+    limiter.release()
+    assert limiter.stats()['in_flight'] == 0
+
+
+async def test_middleware_sheds_excess_load():
+    started, finish = asyncio.Event(), asyncio.Event()
+
+    async def slow_app(scope, receive, send):
+        if scope['path'] == '/api/v1/books/':
+            started.set()
+            await finish.wait()
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b'ok'})
+
+    controller = AdmissionController({'read': 1, 'write': 1, 'auth': 1}, queue_size=0, queue_timeout=1, retry_after=3)
+    metrics = RouteMetrics()
+    app = MetricsMiddleware(AdmissionControlMiddleware(slow_app, controller), metrics)
+    async with AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test') as client:
+        first = asyncio.create_task(client.get('/api/v1/books/'))
+        await started.wait()
+
+        response = await client.get('/api/v1/books/1')
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert response.headers['retry-after'] == '3'
+
+        # Другие группы ограничиваются независимо.
+        assert (await client.post('/api/v1/token/')).status_code == status.HTTP_200_OK
+
+        finish.set()
+        assert (await first).status_code == status.HTTP_200_OK
+
+    assert controller.stats()['read']['rejected'] == 1
+    assert controller.stats()['read']['in_flight'] == 0
+    # Отклоненный запрос виден в метриках под своей группой, а не среди <unmatched>.
+    assert 'http_requests_total{method="GET",route="<shed:read>",status="503"} 1' in metrics.render()
+
+
+async def test_middleware_releases_slot_when_response_starts():
+    streaming, finish = asyncio.Event(), asyncio.Event()
+
+    async def streaming_app(scope, receive, send):
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        if scope['path'] == '/api/v1/books/export':
+            streaming.set()
+            await finish.wait()
+        await send({'type': 'http.response.body', 'body': b'ok'})
+
+    controller = AdmissionController({'read': 1, 'write': 1, 'auth': 1}, queue_size=0, queue_timeout=1, retry_after=3)
+    app = AdmissionControlMiddleware(streaming_app, controller)
+    async with AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test') as client:
+        export = asyncio.create_task(client.get('/api/v1/books/export'))
+        await streaming.wait()
+
+        # Тело выгрузки еще передается, но слот уже свободен для следующего запроса.
+        assert controller.stats()['read']['in_flight'] == 0
+        assert (await client.get('/api/v1/books/1')).status_code == status.HTTP_200_OK
+
+        finish.set()
+        assert (await export).status_code == status.HTTP_200_OK
+
+    assert controller.stats()['read']['rejected'] == 0
+    assert controller.stats()['read']['in_flight'] == 0
+
+
+async def test_admission_stats(async_client: AsyncClient):
+    response = await async_client.get('/internal/admission')
+
+    assert response.status_code == status.HTTP_200_OK
+    assert set(response.json()) == {'read', 'write', 'auth'}
@@ -1,9 +1,23 @@
+import asyncio
+from contextlib import nullcontext
+
+import orjson
 from fastapi import status
 from httpx import AsyncClient
-from sqlalchemy import select
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.models import Book, Seller
+from src.batching import InsertBatcher
+from src.cache import CachedResponse
+from src.configurations import get_async_session, run_commit_callbacks
+from src.configurations.settings import settings
+from src.metrics import count_queries
+from src.models import Book, BookCatalogStatsDelta, Seller, SellerStats
+from src.schemas import ReturnedAllBooks
+from src.stats import CatalogStatsCompactor, sellers_count
+from src.tests.conftest import async_test_engine
+from src.tools import book_rows, dump_response, response_cache
 
 
 async def test_create_book(
@@ -35,6 +49,109 @@ async def test_create_book(
     assert res['seller_id'] == test_seller.id
 
 
+async def test_create_book_batched(
+    async_client: AsyncClient,
+    db_session: AsyncSession,
+    test_seller: Seller,
+    jwt_token: str,
+    monkeypatch,
+):
+    batcher = InsertBatcher(Book, max_size=5, max_delay=0.01, returning=(Book.id, Book.version))
+    monkeypatch.setattr(settings, 'book_write_batching', True)
+    monkeypatch.setattr('src.routers.v1.books.book_batcher', batcher)
+
+    async def create(n: int):
+        book = {'title': f'Batched {n}', 'author': 'Robert Martin', 'year': 2024, 'pages': 350}
+        return await async_client.post('/api/v1/books/', json=book, headers={'Authorization': f'Bearer {jwt_token}'})
+
+    # Первый запрос кладет продавца в кэш авторизации, следующие пять записываются одной пачкой.
+    responses = [await create(0), *await asyncio.gather(*(create(n) for n in range(1, 6)))]
+
+    assert {response.status_code for response in responses} == {status.HTTP_201_CREATED}
+    assert batcher.stats()['batches'] == 2
+    for n, response in enumerate(responses):
+        book = await db_session.get(Book, response.json()['id'])
+        assert book.title == response.json()['title'] == f'Batched {n}'
+        assert book.seller_id == test_seller.id
+
+
+async def test_insert_batcher_isolates_failed_rows(db_session: AsyncSession, test_seller: Seller):
+    batcher = InsertBatcher(Book, max_size=3, max_delay=1, returning=(Book.id, Book.version))
+    rows = [
+        {'title': 'Good', 'author': 'Nobody', 'year': 2000, 'count_pages': 10, 'seller_id': test_seller.id},
+        {'title': 'Bad', 'author': 'Nobody', 'year': 2000, 'count_pages': 10**12, 'seller_id': test_seller.id},
+        {'title': 'Good too', 'author': 'Nobody', 'year': 2000, 'count_pages': 10, 'seller_id': test_seller.id},
+    ]
+
+    results = await asyncio.gather(
+        *(batcher.insert(lambda: nullcontext(db_session), row) for row in rows), return_exceptions=True
+    )
+
+    assert isinstance(results[1], DBAPIError)
+    for result, title in ((results[0], 'Good'), (results[2], 'Good too')):
+        book = await db_session.get(Book, result.id)
+        assert (book.title, book.version) == (title, result.version)
+    stats = batcher.stats()
+    assert (stats['batches'], stats['rows'], stats['fallbacks'], stats['failed_rows']) == (1, 3, 1, 1)
+
+
+async def test_create_books_bulk(
+    async_client: AsyncClient,
+    db_session: AsyncSession,
+    test_seller: Seller,
+    jwt_token: str,
+):
+    books = [
+        {'title': 'Agile Principles Revisited', 'author': 'Robert Martin', 'year': 2024, 'pages': 350},
+        {'title': 'Old Book', 'author': 'Nobody', 'year': 1800, 'pages': 100},
+        {'title': '1984', 'author': 'George Orwell', 'year': 1949, 'pages': 328},
+        {'title': 'Too Long', 'author': 'Nobody', 'year': 2000, 'pages': 10**12},  # не влезает в integer в БД
+    ]
+    response = await async_client.post(
+        url='/api/v1/books/bulk',
+        json=books,
+        headers={'Authorization': f'Bearer {jwt_token}'},
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+
+    res = response.json()
+    assert res['inserted'] == 2
+    assert [error['index'] for error in res['errors']] == [1, 3]
+    assert res['errors'][0]['errors'][0]['loc'] == ['year']
+    assert res['errors'][1]['errors'][0]['type'] == 'db_error'
+    assert res['rows_per_second'] > 0
+
+    db_result = await db_session.execute(select(Book.title).where(Book.seller_id == test_seller.id))
+    assert sorted(db_result.scalars().all()) == ['1984', 'Agile Principles Revisited']
+
+
+async def test_create_books_bulk_ndjson(
+    async_client: AsyncClient,
+    db_session: AsyncSession,
+    test_seller: Seller,
+    jwt_token: str,
+):
+    lines = [
+        b'{"title": "Dune", "author": "Frank Herbert", "year": 1965, "pages": 412}',
+        b'not a json',
+        b'',
+        b'{"title": "1984", "author": "George Orwell", "year": 1949, "pages": 328}',
+    ]
+    response = await async_client.post(
+        url='/api/v1/books/bulk',
+        content=b'\n'.join(lines),
+        headers={'Authorization': f'Bearer {jwt_token}', 'Content-Type': 'application/x-ndjson'},
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+
+    res = response.json()
+    assert res['inserted'] == 2
+    assert [error['index'] for error in res['errors']] == [1]
+
+    db_result = await db_session.execute(select(Book.title).where(Book.seller_id == test_seller.id))
+    assert sorted(db_result.scalars().all()) == ['1984', 'Dune']
+
+
 async def test_get_all_books(
     async_client: AsyncClient,
     db_session: AsyncSession,
@@ -67,10 +184,155 @@ async def test_get_all_books(
                 'count_pages': 328,
                 'seller_id': test_seller.id,
             },
-        ]
+        ],
+        'next_cursor': None,
     }
 
 
+async def test_get_all_books_paginated(
+    async_client: AsyncClient,
+    db_session: AsyncSession,
+    test_book: Book,
+    test_seller: Seller,
+):
+    test_book_2 = Book(title='1984', author='George Orwell', year=1949, count_pages=328, seller_id=test_seller.id)
+    test_book_3 = Book(title='Dune', author='Frank Herbert', year=1965, count_pages=412, seller_id=test_seller.id)
+    db_session.add_all([test_book_2, test_book_3])
+    await db_session.flush()
+
+    response = await async_client.get('/api/v1/books/', params={'limit': 2})
+    assert response.status_code == status.HTTP_200_OK
+    first_page = response.json()
+    assert [book['id'] for book in first_page['books']] == [test_book.id, test_book_2.id]
+    assert first_page['next_cursor'] is not None
+
+    response = await async_client.get('/api/v1/books/', params={'limit': 2, 'cursor': first_page['next_cursor']})
+    assert response.status_code == status.HTTP_200_OK
+    second_page = response.json()
+    assert [book['id'] for book in second_page['books']] == [test_book_3.id]
+    assert second_page['next_cursor'] is None
+
+    response = await async_client.get('/api/v1/books/', params={'limit': 2, 'full_scan': True})
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()['books']) == 3
+    assert response.json()['next_cursor'] is None
+
+
+async def test_get_all_books_filtered(
+    async_client: AsyncClient,
+    db_session: AsyncSession,
+    test_book: Book,
+    test_seller: Seller,
+):
+    other_seller = Seller(first_name='Ivan', last_name='Godunov', email='ivan@mail.ru', hashed_password='-')
+    db_session.add(other_seller)
+    await db_session.flush()
+    db_session.add_all(
+        [
+            Book(title='1984', author='George Orwell', year=1949, count_pages=328, seller_id=test_seller.id),
+            Book(title='Animal Farm', author='George Orwell', year=1945, count_pages=112, seller_id=other_seller.id),
+        ]
+    )
+    await db_session.flush()
+
+    async def titles(**params) -> list[str]:
+        response = await async_client.get('/api/v1/books/', params=params)
+        assert response.status_code == status.HTTP_200_OK
+        return [book['title'] for book in response.json()['books']]
+
+    assert await titles(author='George Orwell') == ['1984', 'Animal Farm']
+    assert await titles(author='George Orwell', seller_id=other_seller.id) == ['Animal Farm']
+    assert await titles(year_from=1946, year_to=2000) == ['1984']
+    assert await titles(pages_from=300, pages_to=400) == ['1984']
+    assert await titles(year_from=2000) == ['Hogwarts']
+
+
+async def test_get_all_books_with_invalid_cursor(async_client: AsyncClient):
+    response = await async_client.get('/api/v1/books/', params={'cursor': 'not-a-cursor'})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json() == {'detail': 'Invalid cursor'}
+
+
+async def test_export_books(
+    async_client: AsyncClient,
+    db_session: AsyncSession,
+    test_book: Book,
+    test_seller: Seller,
+):
+    test_book_2 = Book(title='1984', author='George Orwell', year=1949, count_pages=328, seller_id=test_seller.id)
+    db_session.add(test_book_2)
+    await db_session.flush()
+
+    response = await async_client.get('/api/v1/books/export')
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers['content-type'] == 'application/x-ndjson'
+
+    lines = response.content.splitlines()
+    assert [orjson.loads(line) for line in lines] == [
+        {
+            'id': test_book.id,
+            'title': 'Hogwarts',
+            'author': 'J.K. Rowling',
+            'year': 2024,
+            'count_pages': 450,
+            'seller_id': test_seller.id,
+        },
+        {
+            'id': test_book_2.id,
+            'title': '1984',
+            'author': 'George Orwell',
+            'year': 1949,
+            'count_pages': 328,
+            'seller_id': test_seller.id,
+        },
+    ]
+
+
+async def test_search_books(
+    async_client: AsyncClient,
+    db_session: AsyncSession,
+    test_book: Book,
+    test_seller: Seller,
+):
+    db_session.add_all(
+        [
+            Book(title='The Hobbit', author='J.R.R. Tolkien', year=1937, count_pages=310, seller_id=test_seller.id),
+            Book(
+                title='Tolkien: A Biography',
+                author='Humphrey Carpenter',
+                year=1977,
+                count_pages=300,
+                seller_id=test_seller.id,
+            ),
+            Book(title='1984', author='George Orwell', year=1949, count_pages=328, seller_id=test_seller.id),
+        ]
+    )
+    await db_session.flush()
+
+    response = await async_client.get('/api/v1/books/search', params={'q': 'tolk'})
+    assert response.status_code == status.HTTP_200_OK
+    # Совпадение в названии ранжируется выше, чем в авторе.
+    assert [book['title'] for book in response.json()['books']] == ['Tolkien: A Biography', 'The Hobbit']
+
+    response = await async_client.get('/api/v1/books/search', params={'q': 'tolk', 'limit': 1})
+    first_page = response.json()
+    assert [book['title'] for book in first_page['books']] == ['Tolkien: A Biography']
+
+    response = await async_client.get(
+        '/api/v1/books/search',
+        params={'q': 'tolk', 'limit': 1, 'cursor': first_page['next_cursor']},
+    )
+    second_page = response.json()
+    assert [book['title'] for book in second_page['books']] == ['The Hobbit']
+    assert second_page['next_cursor'] is None
+
+    response = await async_client.get('/api/v1/books/search', params={'q': 'george orw'})
+    assert [book['title'] for book in response.json()['books']] == ['1984']
+
+    response = await async_client.get('/api/v1/books/search', params={'q': '&|!'})
+    assert response.json() == {'books': [], 'next_cursor': None}
+
+
 async def test_get_single_book(
     async_client: AsyncClient,
     test_book: Book,
@@ -89,6 +351,133 @@ async def test_get_single_book(
     }
 
 
+async def test_get_single_book_coalesces_concurrent_requests(async_client: AsyncClient, test_book: Book):
+    with count_queries() as counter:
+        responses = await asyncio.gather(*(async_client.get(f'/api/v1/books/{test_book.id}') for _ in range(10)))
+
+    assert {response.status_code for response in responses} == {status.HTTP_200_OK}
+    assert len({response.content for response in responses}) == 1
+    assert counter.count == 1
+
+
+async def test_get_single_book_is_cached_until_update(
+    async_client: AsyncClient,
+    db_session: AsyncSession,
+    test_book: Book,
+    jwt_token: str,
+):
+    response = await async_client.get(f'/api/v1/books/{test_book.id}')
+    assert response.json()['title'] == 'Hogwarts'
+
+    # Изменение в обход ручек не инвалидирует кэш — отдается сохраненный ответ.
+    test_book.title = 'Changed directly'
+    await db_session.flush()
+    response = await async_client.get(f'/api/v1/books/{test_book.id}')
+    assert response.json()['title'] == 'Hogwarts'
+
+    response = await async_client.put(
+        url=f'/api/v1/books/{test_book.id}',
+        json={'title': '1984', 'author': 'George Orwell', 'year': 1949, 'pages': 328},
+        headers={'Authorization': f'Bearer {jwt_token}'},
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+
+    response = await async_client.get(f'/api/v1/books/{test_book.id}')
+    assert response.json()['title'] == '1984'
+
+    response = await async_client.get('/api/v1/books/')
+    assert response.json()['books'][0]['title'] == '1984'
+
+
+async def test_read_between_flush_and_commit_is_not_cached(
+    test_app,
+    async_client: AsyncClient,
+    db_session: AsyncSession,
+    test_book: Book,
+    jwt_token: str,
+):
+    key = response_cache.key('book', test_book.id)
+    stale = CachedResponse(body=b'{"title": "Hogwarts"}', etag='"stale"')
+
+    async def read_on_another_connection() -> CachedResponse:
+        return stale
+
+    async def get_session():
+        yield db_session
+        # UPDATE уже выполнен, но не закоммичен: чтение с другого соединения видит старую книгу и кэширует ее.
+        assert await response_cache.load(key, read_on_another_connection) is stale
+        run_commit_callbacks(db_session)
+
+    test_app.dependency_overrides[get_async_session] = get_session
+    response = await async_client.put(
+        url=f'/api/v1/books/{test_book.id}',
+        json={'title': '1984', 'author': 'George Orwell', 'year': 1949, 'pages': 328},
+        headers={'Authorization': f'Bearer {jwt_token}'},
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+
+    # Кэш сбрасывается после коммита, поэтому старый ответ в нем не задерживается.
+    assert response_cache.get(key) is None
+    response = await async_client.get(f'/api/v1/books/{test_book.id}')
+    assert response.json()['title'] == '1984'
+
+
+async def test_get_single_book_not_modified(
+    async_client: AsyncClient,
+    db_session: AsyncSession,
+    test_book: Book,
+    jwt_token: str,
+):
+    response = await async_client.get(f'/api/v1/books/{test_book.id}')
+    etag = response.headers['ETag']
+
+    response = await async_client.get(f'/api/v1/books/{test_book.id}', headers={'If-None-Match': etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.content == b''
+    assert response.headers['ETag'] == etag
+
+    await async_client.put(
+        url=f'/api/v1/books/{test_book.id}',
+        json={'title': '1984', 'author': 'George Orwell', 'year': 1949, 'pages': 328},
+        headers={'Authorization': f'Bearer {jwt_token}'},
+    )
+    # В тестах все запросы идут через одну сессию: забываем объекты, загруженные до UPDATE.
+    db_session.expunge_all()
+
+    response = await async_client.get(f'/api/v1/books/{test_book.id}', headers={'If-None-Match': etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers['ETag'] != etag
+
+
+async def test_get_all_books_not_modified(
+    async_client: AsyncClient,
+    db_session: AsyncSession,
+    test_book: Book,
+    test_seller: Seller,
+    jwt_token: str,
+):
+    response = await async_client.get('/api/v1/books/')
+    etag = response.headers['ETag']
+
+    response = await async_client.get('/api/v1/books/', headers={'If-None-Match': etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    # Без кэша ответов ETag списка вычисляется агрегирующим запросом.
+    response_cache.clear()
+    response = await async_client.get('/api/v1/books/', headers={'If-None-Match': etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    await async_client.post(
+        url='/api/v1/books/',
+        json={'title': '1984', 'author': 'George Orwell', 'year': 1949, 'pages': 328},
+        headers={'Authorization': f'Bearer {jwt_token}'},
+    )
+
+    response = await async_client.get('/api/v1/books/', headers={'If-None-Match': etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()['books']) == 2
+
+
 async def test_get_nonexistent_book(
     async_client: AsyncClient,
     test_seller: Seller,
@@ -131,3 +520,144 @@ async def test_update_book(
     assert book.author == 'George Orwell'
     assert book.year == 1949
     assert book.count_pages == 328
+
+
+async def test_update_and_delete_nonexistent_book(async_client: AsyncClient, jwt_token: str):
+    response = await async_client.put(
+        url='/api/v1/books/-1',
+        json={'title': '1984', 'author': 'George Orwell', 'year': 1949, 'pages': 328},
+        headers={'Authorization': f'Bearer {jwt_token}'},
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    response = await async_client.delete('/api/v1/books/-1')
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+async def test_book_rows_match_response_model(db_session: AsyncSession, test_book: Book):
+    # Быстрая сериализация списков должна давать те же байты, что и response_model.
+    rows = (await db_session.execute(select(*book_rows.columns))).all()
+    books = (await db_session.execute(select(Book))).scalars().all()
+    expected = dump_response(ReturnedAllBooks, {'books': books, 'next_cursor': 'cursor'})
+    assert book_rows.dump_page('books', rows, 'cursor') == expected
+
+
+async def test_get_books_sparse_fields(
+    async_client: AsyncClient,
+    db_session: AsyncSession,
+    test_book: Book,
+    test_seller: Seller,
+):
+    db_session.add(Book(title='1984', author='George Orwell', year=1949, count_pages=328, seller_id=test_seller.id))
+    await db_session.flush()
+
+    response = await async_client.get('/api/v1/books/', params={'fields': 'id,title,author'})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['books'][0] == {'id': test_book.id, 'title': 'Hogwarts', 'author': 'J.K. Rowling'}
+    full_etag = (await async_client.get('/api/v1/books/')).headers['ETag']
+    assert response.headers['ETag'] != full_etag
+
+    # Без id в ответе пагинация продолжает работать: id выбирается для курсора, но не отдается.
+    response = await async_client.get('/api/v1/books/', params={'fields': 'title', 'limit': 1})
+    assert response.json()['books'] == [{'title': 'Hogwarts'}]
+    response = await async_client.get(
+        '/api/v1/books/', params={'fields': 'title', 'limit': 1, 'cursor': response.json()['next_cursor']}
+    )
+    assert response.json() == {'books': [{'title': '1984'}], 'next_cursor': None}
+
+    response = await async_client.get('/api/v1/books/search', params={'q': 'orwell', 'fields': 'author'})
+    assert response.json()['books'] == [{'author': 'George Orwell'}]
+
+    response = await async_client.get(f'/api/v1/books/{test_book.id}', params={'fields': 'year,title'})
+    assert response.json() == {'title': 'Hogwarts', 'year': 2024}
+
+    response = await async_client.get('/api/v1/books/', params={'fields': 'title,version'})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()['detail'] == 'Unknown fields: version'
+
+
+async def test_books_stats_follow_changes(
+    async_client: AsyncClient,
+    test_book: Book,
+    test_seller: Seller,
+    jwt_token: str,
+):
+    headers = {'Authorization': f'Bearer {jwt_token}'}
+    books = [
+        {'title': '1984', 'author': 'George Orwell', 'year': 1949, 'pages': 328},
+        {'title': 'Animal Farm', 'author': 'George Orwell', 'year': 1945, 'pages': 112},
+    ]
+    response = await async_client.post('/api/v1/books/', json=books[0], headers=headers)
+    book_id = response.json()['id']
+    await async_client.post('/api/v1/books/bulk', json=[books[1]], headers=headers)
+
+    response = await async_client.get('/api/v1/books/stats')
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {
+        'books_count': 3,
+        'total_pages': 450 + 328 + 112,
+        'years': [{'year': 1945, 'books_count': 1}, {'year': 1949, 'books_count': 1}, {'year': 2024, 'books_count': 1}],
+        'top_authors': [{'author': 'George Orwell', 'books_count': 2}, {'author': 'J.K. Rowling', 'books_count': 1}],
+    }
+
+    # Изменение и удаление переносят книги между годами и авторами, опустевшие строки пропадают.
+    book = {'title': 'Hogwarts 2', 'author': 'J.K. Rowling', 'year': 2024, 'pages': 500}
+    await async_client.put(f'/api/v1/books/{book_id}', json=book, headers=headers)
+    await async_client.delete(f'/api/v1/books/{test_book.id}')
+
+    response = await async_client.get(f'/api/v1/seller/{test_seller.id}/stats', params={'top_authors': 1})
+    assert response.json() == {
+        'books_count': 2,
+        'total_pages': 500 + 112,
+        'years': [{'year': 1945, 'books_count': 1}, {'year': 2024, 'books_count': 1}],
+        'top_authors': [{'author': 'George Orwell', 'books_count': 1}],
+    }
+
+
+# Сжатие переносит дельты каталога в его строки, не меняя статистику; следующие изменения снова идут дельтами.
+async def test_books_stats_survive_compaction(
+    async_client: AsyncClient,
+    db_session: AsyncSession,
+    test_book: Book,
+    jwt_token: str,
+):
+    headers = {'Authorization': f'Bearer {jwt_token}'}
+    book = {'title': '1984', 'author': 'George Orwell', 'year': 1949, 'pages': 328}
+    await async_client.post('/api/v1/books/', json=book, headers=headers)
+    expected = (await async_client.get('/api/v1/books/stats')).json()
+
+    assert await CatalogStatsCompactor(interval=1).compact(db_session) > 0
+    assert await db_session.scalar(select(func.count()).select_from(BookCatalogStatsDelta)) == 0
+    assert await db_session.scalar(select(func.count()).select_from(SellerStats)) == 1
+    assert await db_session.scalar(select(sellers_count())) == 1
+    assert (await async_client.get('/api/v1/books/stats')).json() == expected
+
+    await async_client.delete(f'/api/v1/books/{test_book.id}')
+    response = await async_client.get('/api/v1/books/stats')
+    assert response.json() == {
+        'books_count': 1,
+        'total_pages': 328,
+        'years': [{'year': 1949, 'books_count': 1}],
+        'top_authors': [{'author': 'George Orwell', 'books_count': 1}],
+    }
+
+
+# Книги разных продавцов с одинаковыми годом и автором пишутся параллельно: общих строк статистики
+# (каталога) триггеры не блокируют, поэтому вторая транзакция не ждет коммита первой.
+async def test_books_stats_do_not_serialize_writers():
+    insert_seller = text(
+        "INSERT INTO sellers_table (first_name, last_name, email, hashed_password) "
+        "VALUES ('Writer', 'Writer', :email, 'hash') RETURNING id"
+    )
+    insert_book = text(
+        "INSERT INTO books_table (title, author, year, count_pages, seller_id) "
+        "VALUES ('Same', 'Same Author', 2000, 100, :seller_id)"
+    )
+    async with async_test_engine.connect() as first, async_test_engine.connect() as second:
+        for connection, email in ((first, 'first@writer.com'), (second, 'second@writer.com')):
+            await connection.begin()
+            await connection.execute(text("SET LOCAL lock_timeout = '1s'"))
+            seller_id = (await connection.execute(insert_seller, {'email': email})).scalar_one()
+            await connection.execute(insert_book, {'seller_id': seller_id})
+        await second.rollback()
+        await first.rollback()
@@ -0,0 +1,110 @@
+import asyncio
+import time
+
+from src.cache import CachedResponse, LRUCache, ResponseCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1  # 'a' становится самым свежим
+
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats() == {'size': 2, 'maxsize': 2, 'hits': 3, 'misses': 1, 'evictions': 1}
+
+
+def test_lru_cache_expires_entries():
+    cache = LRUCache(maxsize=10, ttl=60)
+    cache.set('short', 1, ttl=0.01)
+    cache.set('expired', 2, ttl=-1)
+    cache.set('long', 3)
+    time.sleep(0.02)
+
+    assert cache.get('short') is None
+    assert cache.get('expired') is None
+    assert cache.get('long') == 3
+    assert len(cache) == 1
+
+
+def test_response_cache_invalidation():
+    cache = ResponseCache(LRUCache(maxsize=10, ttl=60))
+    book_2 = CachedResponse(body=b'book-2', etag='"2"')
+    cache.set(cache.key('book', 1), CachedResponse(body=b'book-1', etag='"1"'))
+    cache.set(cache.key('book', 2), book_2)
+    cache.set(cache.key('books', 100, None), CachedResponse(body=b'page', etag='"2-2"'))
+
+    cache.invalidate('book', 1)
+    assert cache.get(cache.key('book', 1)) is None
+    assert cache.get(cache.key('book', 2)) == book_2
+
+    cache.invalidate('books')
+    assert cache.get(cache.key('books', 100, None)) is None
+    assert cache.get(cache.key('book', 2)) == book_2
+
+
+async def test_response_cache_load_coalesces_concurrent_misses():
+    cache = ResponseCache(LRUCache(maxsize=10, ttl=60))
+    book = CachedResponse(body=b'book-1', etag='"1"')
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return book
+
+    key = cache.key('book', 1)
+    assert await asyncio.gather(*(cache.load(key, loader) for _ in range(5))) == [book] * 5
+    assert calls == 1
+    assert cache.get(key) == book
+    assert cache.stats()['coalesced'] == 4
+
+
+async def test_response_cache_load_does_not_cache_invalidated_result():
+    cache = ResponseCache(LRUCache(maxsize=10, ttl=60))
+    started, release = asyncio.Event(), asyncio.Event()
+
+    async def stale_loader():
+        started.set()
+        await release.wait()
+        return CachedResponse(body=b'old', etag='"1"')
+
+    async def fresh_loader():
+        return CachedResponse(body=b'new', etag='"2"')
+
+    key = cache.key('book', 1)
+    stale = asyncio.create_task(cache.load(key, stale_loader))
+    await started.wait()
+
+    # После изменения новые запросы не присоединяются к загрузке, начатой до него.
+    cache.invalidate('book', 1)
+    assert (await cache.load(key, fresh_loader)).body == b'new'
+
+    release.set()
+    assert (await stale).body == b'old'
+    assert cache.get(key).body == b'new'
+
+
+async def test_response_cache_load_survives_cancelled_leader():
+    cache = ResponseCache(LRUCache(maxsize=10, ttl=60))
+    started = asyncio.Event()
+
+    async def hanging_loader():
+        started.set()
+        await asyncio.Event().wait()
+
+    async def loader():
+        return CachedResponse(body=b'book-1', etag='"1"')
+
+    key = cache.key('book', 1)
+    leader = asyncio.create_task(cache.load(key, hanging_loader))
+    await started.wait()
+    waiter = asyncio.create_task(cache.load(key, loader))
+    await asyncio.sleep(0)
+
+    leader.cancel()
+    assert (await waiter).body == b'book-1'
@@ -0,0 +1,153 @@
+import gzip
+import os
+import time
+from contextlib import nullcontext
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import orjson
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.exports import EXPORT_JOB_KIND, ExportManager
+from src.jobs import JobClaimLost
+from src.models import Book, Job
+
+
+# Воркеров нет: задачи выполняются явным вызовом run_next, чтобы тест не делил сессию с фоновой задачей.
+@pytest.fixture
+async def export_manager(db_session: AsyncSession, tmp_path, monkeypatch):
+    manager = ExportManager(
+        tmp_path, max_concurrent=0, queue_size=1, ttl=60, cleanup_interval=60, poll_interval=60, stale_after=60
+    )
+    manager.start(lambda: nullcontext(db_session))
+    monkeypatch.setattr('src.routers.v1.exports.export_manager', manager)
+    yield manager
+    await manager.stop()
+
+
+@pytest.mark.parametrize('export_format', ['ndjson', 'csv'])
+async def test_export_books(async_client: AsyncClient, export_manager, test_book: Book, export_format: str):
+    response = await async_client.post('/api/v1/exports/', json={'format': export_format})
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert response.json()['status'] == 'pending'
+    location = response.headers['location']
+
+    assert await export_manager.run_next()
+    assert not await export_manager.run_next()
+
+    export = (await async_client.get(location)).json()
+    assert export['status'] == 'done'
+    assert export['total'] == export['processed'] == 1
+
+    response = await async_client.get(export['download_url'])
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers['content-type'] == 'application/gzip'
+
+    lines = gzip.decompress(response.content).decode().splitlines()
+    if export_format == 'csv':
+        assert lines == [
+            'id,title,author,year,count_pages,seller_id',
+            f'{test_book.id},Hogwarts,J.K. Rowling,2024,450,{test_book.seller_id}',
+        ]
+    else:
+        assert [orjson.loads(line)['title'] for line in lines] == ['Hogwarts']
+
+
+async def test_export_unknown(async_client: AsyncClient, export_manager):
+    assert (await async_client.get('/api/v1/exports/unknown')).status_code == status.HTTP_404_NOT_FOUND
+    assert (await async_client.get('/api/v1/exports/unknown/download')).status_code == status.HTTP_404_NOT_FOUND
+
+
+async def test_export_queue_is_bounded(async_client: AsyncClient, export_manager):
+    response = await async_client.post('/api/v1/exports/', json={})
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    response = await async_client.get(f'{response.headers["location"]}/download')
+    assert response.status_code == status.HTTP_409_CONFLICT
+
+    response = await async_client.post('/api/v1/exports/', json={})
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert 'retry-after' in response.headers
+
+
+async def test_export_files_expire(
+    async_client: AsyncClient, db_session: AsyncSession, export_manager, test_book: Book
+):
+    response = await async_client.post('/api/v1/exports/', json={})
+    await export_manager.run_next()
+    export = (await async_client.get(response.headers['location'])).json()
+    path = export_manager.directory / f'{export["id"]}.ndjson.gz'
+
+    stale = export_manager.directory / 'stale.ndjson.gz.part'
+    stale.touch()
+    expired_at = time.time() - export_manager.ttl - 1
+    os.utime(stale, (expired_at, expired_at))
+
+    assert await export_manager.remove_expired() == 1
+    assert path.exists()
+
+    expired = datetime.now(timezone.utc) - timedelta(seconds=export_manager.ttl + 1)
+    await db_session.execute(update(Job).where(Job.id == export['id']).values(finished_at=expired))
+    response = await async_client.get(export['download_url'])
+    assert response.status_code == status.HTTP_410_GONE
+
+    # Истекшая задача удаляется вместе с файлом.
+    os.utime(path, (expired_at, expired_at))
+    assert await export_manager.remove_expired() == 1
+    assert not path.exists()
+    assert (await async_client.get(export['download_url'])).status_code == status.HTTP_404_NOT_FOUND
+
+
+# Идущая выгрузка (в этом или другом процессе) может писать файл дольше ttl: очистка не удаляет его из-под воркера.
+async def test_export_cleanup_skips_running_exports(db_session: AsyncSession, export_manager):
+    export = Job(kind=EXPORT_JOB_KIND, params={'format': 'ndjson'}, status='running', processed=0, claim='worker')
+    db_session.add(export)
+    await db_session.flush()
+
+    partial_path = export_manager.directory / f'{export.id}.ndjson.gz.worker.part'
+    partial_path.touch()
+    expired_at = time.time() - export_manager.ttl - 1
+    os.utime(partial_path, (expired_at, expired_at))
+
+    assert await export_manager.remove_expired() == 0
+    assert partial_path.exists()
+
+
+# Очистки всех процессов проходят по общему export_dir: файл, удаленный другим процессом, пропускается.
+async def test_export_cleanup_skips_files_removed_by_another_process(export_manager, monkeypatch):
+    removed, expired = export_manager.directory / 'removed.ndjson.gz', export_manager.directory / 'expired.ndjson.gz'
+    expired.touch()
+    expired_at = time.time() - export_manager.ttl - 1
+    os.utime(expired, (expired_at, expired_at))
+    monkeypatch.setattr(Path, 'glob', lambda self, pattern: iter([removed, expired]))
+
+    assert await export_manager.remove_expired() == 1
+    assert not expired.exists()
+
+
+# Задачу упавшего или зависшего воркера забирает другой, а старый воркер больше не может ее обновить.
+async def test_export_stale_job_is_taken_over(
+    async_client: AsyncClient, db_session: AsyncSession, export_manager, test_book: Book
+):
+    heartbeat_at = datetime.now(timezone.utc) - timedelta(seconds=export_manager.stale_after + 1)
+    export = Job(
+        kind=EXPORT_JOB_KIND,
+        params={'format': 'ndjson'},
+        status='running',
+        processed=0,
+        claim='dead',
+        heartbeat_at=heartbeat_at,
+    )
+    db_session.add(export)
+    await db_session.flush()
+
+    assert await export_manager.run_next()
+    response = await async_client.get(f'/api/v1/exports/{export.id}')
+    assert response.json()['status'] == 'done'
+    assert response.json()['processed'] == 1
+
+    with pytest.raises(JobClaimLost):
+        await export_manager.update(export.id, 'dead', processed=0)
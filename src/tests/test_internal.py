@@ -0,0 +1,48 @@
+import asyncio
+import threading
+
+from fastapi import status
+from httpx import AsyncClient
+
+from src.models import Seller
+from src.tools import PasswordHasher
+
+
+async def test_get_password_hasher_stats(
+    async_client: AsyncClient,
+    test_seller: Seller,
+):
+    response = await async_client.get('/internal/password-hasher')
+    assert response.status_code == status.HTTP_200_OK
+    completed_before = response.json()['completed']
+
+    await async_client.post(
+        url='api/v1/token/',
+        data={'username': test_seller.email, 'password': '(X8r8ez@nw'},
+    )
+
+    response = await async_client.get('/internal/password-hasher')
+    assert response.status_code == status.HTTP_200_OK
+    stats = response.json()
+    assert stats['completed'] == completed_before + 1
+    assert stats['queued'] == 0
+    assert stats['in_flight'] == 0
+    assert stats['workers'] > 0
+
+
+async def test_password_hasher_cancelled_job_leaves_queue():
+    hasher = PasswordHasher(max_workers=1)
+    release = threading.Event()
+    busy = asyncio.create_task(hasher._submit(release.wait))
+    waiting = asyncio.create_task(hasher._submit(release.wait))
+    await asyncio.sleep(0.05)
+    assert hasher.stats()['queued'] == 1
+
+    # Задача отменена до того, как пул взял ее в работу: из очереди она должна уйти.
+    waiting.cancel()
+    await asyncio.gather(waiting, return_exceptions=True)
+    assert hasher.stats()['queued'] == 0
+
+    release.set()
+    await busy
+    assert hasher.stats() == {'workers': 1, 'queued': 0, 'in_flight': 0, 'completed': 1}
@@ -0,0 +1,34 @@
+import asyncio
+from contextlib import nullcontext
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.jobs import JobQueue, JobRun
+from src.models import Job
+
+
+# Задача, прерванная остановкой процесса, возвращается в очередь, а не теряется и не помечается упавшей.
+async def test_interrupted_job_is_requeued(db_session: AsyncSession):
+    started = asyncio.Event()
+
+    async def handler(run: JobRun) -> None:
+        await run.progress(processed=1)
+        started.set()
+        await asyncio.Event().wait()
+
+    queue = JobQueue(
+        'test', max_concurrent=0, queue_size=1, ttl=60, cleanup_interval=60, poll_interval=60, stale_after=60
+    )
+    queue.handler(handler)
+    queue.start(lambda: nullcontext(db_session))
+    job = await queue.enqueue(db_session, {})
+
+    task = asyncio.create_task(queue.run_next())
+    await started.wait()
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    await queue.stop()
+
+    job = await db_session.get(Job, job.id, populate_existing=True)
+    assert (job.status, job.claim, job.heartbeat_at) == ('pending', None, None)
+    assert job.processed == 1
@@ -0,0 +1,80 @@
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from src.configurations.pool import PoolMetrics
+from src.configurations.settings import settings
+from src.metrics import Histogram, RequestStats, RouteMetrics
+from src.models import Book
+
+
+def test_histogram_snapshot():
+    histogram = Histogram(buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 2):
+        histogram.observe(value)
+
+    snapshot = histogram.snapshot()
+    assert snapshot['buckets'] == {'0.1': 2, '1': 3, '+Inf': 4}
+    assert snapshot['count'] == 4
+    assert snapshot['sum'] == pytest.approx(2.65)
+
+
+async def test_pool_metrics():
+    engine = create_async_engine(settings.database_test_url, pool_size=1, max_overflow=0, pool_timeout=0.1)
+    metrics = PoolMetrics(engine)
+    session_factory = async_sessionmaker(engine)
+    try:
+        for _ in range(2):
+            async with session_factory() as session:
+                await metrics.acquire(session)
+                await session.execute(text('SELECT 1'))
+                assert metrics.stats()['checked_out'] == 1
+
+        # Пул исчерпан: вторая сессия ждет соединение pool_timeout и получает ошибку.
+        async with session_factory() as holder, session_factory() as waiter:
+            await metrics.acquire(holder)
+            with pytest.raises(PoolTimeoutError):
+                await metrics.acquire(waiter)
+    finally:
+        await engine.dispose()
+
+    stats = metrics.stats()
+    # Второй раз соединение взято из пула, а не открыто заново.
+    assert stats['connects'] == 1
+    assert stats['connect_time_seconds']['count'] == 1
+    assert stats['checkouts'] == 3
+    assert stats['hold_time_seconds']['count'] == 3
+    assert stats['acquire_wait_seconds']['count'] == 4
+    assert stats['acquire_wait_seconds']['sum'] >= 0.1
+    assert stats['acquire_timeouts'] == 1
+    assert stats['checked_out'] == 0
+
+
+def test_route_metrics_render():
+    metrics = RouteMetrics()
+    metrics.observe('GET', '/books/{book_id}', 200, 0.003, RequestStats(db_queries=2, db_time=0.001), 120)
+    metrics.observe('GET', '/books/{book_id}', 404, 0.002, RequestStats(db_queries=1, db_time=0.001), 0)
+
+    text = metrics.render()
+    assert 'http_requests_total{method="GET",route="/books/{book_id}",status="200"} 1' in text
+    assert 'http_requests_total{method="GET",route="/books/{book_id}",status="404"} 1' in text
+    assert 'http_request_db_queries_bucket{method="GET",route="/books/{book_id}",le="2"} 2' in text
+    assert 'http_response_size_bytes_sum{method="GET",route="/books/{book_id}"} 120' in text
+    assert '# TYPE http_request_duration_seconds histogram' in text
+
+
+async def test_metrics_endpoint(async_client: AsyncClient, test_book: Book):
+    response = await async_client.get('/api/v1/books/', params={'year_from': test_book.year})
+    assert response.status_code == status.HTTP_200_OK
+
+    response = await async_client.get('/metrics')
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers['content-type'].startswith('text/plain')
+    # Метки — шаблон маршрута без query-параметров; список книг выполнил хотя бы один SQL-запрос.
+    labels = 'method="GET",route="/api/v1/books/"'
+    assert f'http_requests_total{{{labels},status="200"}} 1' in response.text
+    assert f'http_request_db_queries_bucket{{{labels},le="0"}} 0' in response.text
+    assert 'year_from' not in response.text
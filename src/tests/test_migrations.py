@@ -0,0 +1,83 @@
+from dataclasses import replace
+
+import pytest
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.configurations import migrations
+from src.configurations.migrations import MIGRATIONS, SchemaMismatchError, migrate
+from src.configurations.settings import settings
+from src.metrics import count_queries
+from src.models import BaseModel
+from src.tests.conftest import async_test_engine
+
+
+def _schema(connection) -> dict:
+    inspector = inspect(connection)
+    return {
+        table: (
+            {column['name'] for column in inspector.get_columns(table)},
+            {index['name'] for index in inspector.get_indexes(table)},
+        )
+        for table in BaseModel.metadata.tables
+    }
+
+
+# Схема, созданная миграциями (см. фикстуру create_tables), должна совпадать с моделями.
+async def test_migrations_match_models():
+    expected = {
+        name: ({column.name for column in table.columns}, {index.name for index in table.indexes})
+        for name, table in BaseModel.metadata.tables.items()
+    }
+    async with async_test_engine.connect() as connection:
+        assert await connection.run_sync(_schema) == expected
+
+
+# Если схема актуальна, старт приложения — это один запрос к schema_version без DDL.
+async def test_migrate_current_schema_is_single_query():
+    with count_queries(async_test_engine.sync_engine) as counter:
+        assert await migrate(async_test_engine) == MIGRATIONS[-1].version
+
+    assert counter.count == 1
+
+
+async def test_migrate_rejects_changed_migration(monkeypatch):
+    changed = replace(MIGRATIONS[0], statements=MIGRATIONS[0].statements + ('SELECT 1',))
+    monkeypatch.setattr(migrations, 'MIGRATIONS', (changed, *MIGRATIONS[1:]))
+
+    with pytest.raises(SchemaMismatchError):
+        await migrate(async_test_engine)
+
+
+# Таблицы, созданные старым кодом (без books_table.version и каскадного удаления), не принимаются молча за версию 1.
+async def test_migrate_rejects_outdated_existing_schema():
+    async with async_test_engine.begin() as connection:
+        await connection.exec_driver_sql('DROP SCHEMA IF EXISTS legacy_schema CASCADE')
+        await connection.exec_driver_sql('CREATE SCHEMA legacy_schema')
+        await connection.exec_driver_sql(
+            'CREATE TABLE legacy_schema.sellers_table (id SERIAL PRIMARY KEY, first_name VARCHAR(50) NOT NULL, '
+            'last_name VARCHAR(50) NOT NULL, email VARCHAR(100) NOT NULL, hashed_password VARCHAR(128) NOT NULL, '
+            'version BIGINT NOT NULL DEFAULT 0)'
+        )
+        await connection.exec_driver_sql(
+            'CREATE TABLE legacy_schema.books_table (id SERIAL PRIMARY KEY, title VARCHAR(100) NOT NULL, '
+            'author VARCHAR(100) NOT NULL, year INTEGER NOT NULL, count_pages INTEGER NOT NULL, '
+            'seller_id INTEGER NOT NULL REFERENCES legacy_schema.sellers_table (id))'
+        )
+
+    engine = create_async_engine(
+        settings.database_test_url, connect_args={'server_settings': {'search_path': 'legacy_schema'}}
+    )
+    try:
+        with pytest.raises(
+            SchemaMismatchError, match=r'books_table\.version column is missing; books_table\.seller_id must reference'
+        ):
+            await migrate(engine)
+        async with engine.connect() as connection:
+            # Миграция откатилась целиком: версия не записана.
+            tables = await connection.run_sync(lambda sync_connection: inspect(sync_connection).get_table_names())
+            assert 'schema_version' not in tables
+    finally:
+        await engine.dispose()
+        async with async_test_engine.begin() as connection:
+            await connection.exec_driver_sql('DROP SCHEMA legacy_schema CASCADE')
@@ -0,0 +1,245 @@
+"""
+Бюджеты SQL-запросов для ручек книг, продавцов и токенов.
+Каждая ручка вызывается на маленьком и большом наборе данных: число запросов не должно зависеть от числа строк.
+"""
+
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.configurations import database
+from src.configurations.pool import PoolMetrics
+from src.metrics import count_queries
+from src.models import Book, Seller
+from src.routers.v1.books import books_router
+from src.routers.v1.sellers import seller_router
+from src.routers.v1.tokens import token_router
+from src.stats import catalog_books_count, sellers_count
+from src.tests.conftest import async_test_engine
+from src.tools import generate_token
+
+# Метрики пула тестового движка для настоящих зависимостей сессий (см. session_dependencies).
+pool_metrics = PoolMetrics(async_test_engine)
+
+# (метод, путь в роутере) -> максимальное число SQL-выражений за запрос.
+# В запросах с авторизацией один запрос уходит на загрузку продавца (кэш в тестах пустой).
+QUERY_BUDGETS = {
+    ('POST', '/books/'): 2,  # продавец + INSERT
+    ('POST', '/books/bulk'): 4,  # продавец + SAVEPOINT + INSERT + RELEASE на пачку
+    ('GET', '/books/'): 2,  # ETag + страница
+    ('GET', '/books/export'): 1,
+    ('GET', '/books/search'): 1,
+    ('GET', '/books/stats'): 1,  # итоги, годы и авторы одним запросом к сводным таблицам
+    ('GET', '/books/{book_id}'): 1,
+    ('DELETE', '/books/{book_id}'): 1,
+    ('PUT', '/books/{book_id}'): 2,  # продавец + UPDATE
+    ('POST', '/seller/'): 1,
+    ('GET', '/seller/'): 2,  # ETag + страница
+    ('GET', '/seller/{seller_id}'): 3,  # продавец для авторизации + продавец + selectinload книг
+    ('GET', '/seller/{seller_id}/books'): 2,  # ETag + страница
+    ('GET', '/seller/{seller_id}/stats'): 1,  # итоги, годы и авторы одним запросом к сводным таблицам
+    ('DELETE', '/seller/{seller_id}'): 1,
+    ('PUT', '/seller/{seller_id}'): 1,
+    ('POST', '/token/'): 1,
+}
+
+ROW_COUNTS = [1, 30]
+
+
+def test_every_endpoint_has_query_budget():
+    endpoints = {
+        (method, route.path)
+        for router in (books_router, seller_router, token_router)
+        for route in router.routes
+        for method in route.methods
+    }
+    assert endpoints == set(QUERY_BUDGETS)
+
+
+@pytest.fixture
+async def seller_with_books(db_session: AsyncSession, request) -> Seller:
+    seller = Seller(first_name='Serena', last_name='Williams', email='loud@rocket.com', hashed_password='-')
+    db_session.add(seller)
+    await db_session.flush()
+    db_session.add_all(
+        [
+            Book(title=f'Book {i}', author='Author', year=2000, count_pages=100, seller_id=seller.id)
+            for i in range(request.param)
+        ]
+    )
+    await db_session.flush()
+    # Ручки работают в той же сессии: забываем объекты, чтобы запросы не обслуживались из identity map.
+    db_session.expunge_all()
+    return seller
+
+
+@pytest.fixture
+def auth_headers(seller_with_books: Seller) -> dict[str, str]:
+    return {'Authorization': f'Bearer {generate_token(claims={"sub": seller_with_books.email})}'}
+
+
+async def _first_book_id(db_session: AsyncSession, seller: Seller) -> int:
+    book_id = await db_session.scalar(select(Book.id).where(Book.seller_id == seller.id).limit(1))
+    db_session.expunge_all()
+    return book_id
+
+
+def budget(method: str, path: str) -> int:
+    return QUERY_BUDGETS[(method, path)]
+
+
+@pytest.mark.parametrize('seller_with_books', ROW_COUNTS, indirect=True)
+async def test_books_read_budget(async_client: AsyncClient, query_budget, seller_with_books: Seller):
+    with query_budget(budget('GET', '/books/')):
+        response = await async_client.get('/api/v1/books/')
+    assert response.status_code == status.HTTP_200_OK
+
+    with query_budget(budget('GET', '/books/export')):
+        response = await async_client.get('/api/v1/books/export')
+    assert response.status_code == status.HTTP_200_OK
+
+    with query_budget(budget('GET', '/books/search')):
+        response = await async_client.get('/api/v1/books/search', params={'q': 'book'})
+    assert response.status_code == status.HTTP_200_OK
+
+    with query_budget(budget('GET', '/books/stats')):
+        response = await async_client.get('/api/v1/books/stats')
+    assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.parametrize('seller_with_books', ROW_COUNTS, indirect=True)
+async def test_book_budget(
+    async_client: AsyncClient,
+    db_session: AsyncSession,
+    query_budget,
+    seller_with_books: Seller,
+    auth_headers: dict[str, str],
+):
+    book_id = await _first_book_id(db_session, seller_with_books)
+    book = {'title': '1984', 'author': 'George Orwell', 'year': 1949, 'pages': 328}
+
+    with query_budget(budget('POST', '/books/')):
+        response = await async_client.post('/api/v1/books/', json=book, headers=auth_headers)
+    assert response.status_code == status.HTTP_201_CREATED
+
+    with query_budget(budget('POST', '/books/bulk')):
+        response = await async_client.post('/api/v1/books/bulk', json=[book] * 30, headers=auth_headers)
+    assert response.status_code == status.HTTP_201_CREATED
+
+    with query_budget(budget('GET', '/books/{book_id}')):
+        response = await async_client.get(f'/api/v1/books/{book_id}')
+    assert response.status_code == status.HTTP_200_OK
+
+    with query_budget(budget('PUT', '/books/{book_id}')):
+        response = await async_client.put(f'/api/v1/books/{book_id}', json=book, headers=auth_headers)
+    assert response.status_code == status.HTTP_202_ACCEPTED
+
+    with query_budget(budget('DELETE', '/books/{book_id}')):
+        response = await async_client.delete(f'/api/v1/books/{book_id}')
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+
+
+@pytest.mark.parametrize('seller_with_books', ROW_COUNTS, indirect=True)
+async def test_seller_budget(
+    async_client: AsyncClient,
+    query_budget,
+    seller_with_books: Seller,
+    auth_headers: dict[str, str],
+):
+    seller_id = seller_with_books.id
+
+    with query_budget(budget('GET', '/seller/')):
+        response = await async_client.get('/api/v1/seller/')
+    assert response.status_code == status.HTTP_200_OK
+
+    with query_budget(budget('GET', '/seller/{seller_id}')):
+        response = await async_client.get(f'/api/v1/seller/{seller_id}', headers=auth_headers)
+    assert response.status_code == status.HTTP_200_OK
+
+    with query_budget(budget('GET', '/seller/{seller_id}/books')):
+        response = await async_client.get(f'/api/v1/seller/{seller_id}/books')
+    assert response.status_code == status.HTTP_200_OK
+
+    with query_budget(budget('GET', '/seller/{seller_id}/stats')):
+        response = await async_client.get(f'/api/v1/seller/{seller_id}/stats')
+    assert response.status_code == status.HTTP_200_OK
+
+    new_data = {'first_name': 'Hannah', 'last_name': 'Miller', 'email': 'joshuaward@gmail.com'}
+    with query_budget(budget('PUT', '/seller/{seller_id}')):
+        response = await async_client.put(f'/api/v1/seller/{seller_id}', json=new_data)
+    assert response.status_code == status.HTTP_202_ACCEPTED
+
+    with query_budget(budget('DELETE', '/seller/{seller_id}')):
+        response = await async_client.delete(f'/api/v1/seller/{seller_id}')
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+
+
+async def test_seller_create_and_token_budget(async_client: AsyncClient, db_session: AsyncSession, query_budget):
+    # Тестовая сессия открывает SAVEPOINT при первом обращении к БД: открываем его до замера.
+    await db_session.connection()
+    seller = {'first_name': 'Serena', 'last_name': 'Williams', 'email': 'loud@rocket.com', 'password': '(X8r8ez@nw'}
+    with query_budget(budget('POST', '/seller/')):
+        response = await async_client.post('/api/v1/seller/', json=seller)
+    assert response.status_code == status.HTTP_201_CREATED
+    db_session.expunge_all()
+
+    with query_budget(budget('POST', '/token/')):
+        response = await async_client.post(
+            '/api/v1/token/', data={'username': seller['email'], 'password': seller['password']}
+        )
+    assert response.status_code == status.HTTP_201_CREATED
+
+
+@pytest.fixture
+def session_dependencies(monkeypatch):
+    """Настоящие зависимости сессий (без тестовой транзакции) поверх тестовой БД."""
+    monkeypatch.setattr(database, '__session_factory', async_sessionmaker(async_test_engine))
+    monkeypatch.setattr(database, '__pool_metrics', pool_metrics)
+    monkeypatch.setattr(database, '__read_engine', async_test_engine.execution_options(isolation_level='AUTOCOMMIT'))
+    monkeypatch.setattr(database, '__replicas', [])
+
+
+async def _use_session(dependency) -> None:
+    sessions = dependency()
+    session = await anext(sessions)
+    await session.execute(select(Seller.id).limit(1))
+    with pytest.raises(StopAsyncIteration):
+        await anext(sessions)
+
+
+async def test_read_session_sends_no_transaction_control(session_dependencies):
+    with count_queries(async_test_engine.sync_engine) as counter:
+        await _use_session(database.get_async_read_session)
+
+    assert counter.count == 1
+    assert counter.transactions == []
+
+
+async def test_write_session_commits_once(session_dependencies):
+    with count_queries(async_test_engine.sync_engine) as counter:
+        await _use_session(database.get_async_session)
+
+    assert counter.count == 1
+    # Ни ROLLBACK после успешного коммита, ни лишних транзакций.
+    assert counter.transactions == ['BEGIN', 'COMMIT']
+
+
+# ETag списка не должен проходить по всей таблице: число строк берется из счетчиков, max(version) — из индекса.
+@pytest.mark.parametrize(
+    ('count', 'version_column', 'index'),
+    [
+        (catalog_books_count(), Book.version, 'ix_books_table_version'),
+        (sellers_count(), Seller.version, 'ix_sellers_table_version'),
+    ],
+)
+async def test_collection_etag_reads_version_index(db_session: AsyncSession, count, version_column, index):
+    # На маленькой тестовой таблице планировщик предпочел бы Seq Scan при любых индексах.
+    await db_session.execute(text('SET LOCAL enable_seqscan = off'))
+    query = select(count, func.coalesce(func.max(version_column), 0))
+    sql = query.compile(async_test_engine.sync_engine, compile_kwargs={'literal_binds': True})
+    plan = '\n'.join(await db_session.scalars(text(f'EXPLAIN {sql}')))
+
+    assert f'Index Only Scan Backward using {index}' in plan
+    assert 'Seq Scan on books_table' not in plan and 'Seq Scan on sellers_table' not in plan
@@ -1,10 +1,15 @@
+from contextlib import nullcontext
+from datetime import datetime, timedelta, timezone
+
+import pytest
 from fastapi import status
 from httpx import AsyncClient
-from sqlalchemy import select
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.models import Book, Seller
-from src.tools import hash_password
+from src.models import Book, Job, Seller
+from src.schemas import ReturnedAllSellers
+from src.tools import dump_response, hash_password, seller_cache, seller_delete_queue, seller_rows
 
 
 async def test_create_seller(async_client: AsyncClient):
@@ -76,10 +81,34 @@ async def test_get_all_sellers(
                 'last_name': 'Godunov',
                 'email': 'ivan@mail.ru',
             },
-        ]
+        ],
+        'next_cursor': None,
     }
 
 
+async def test_get_all_sellers_paginated(
+    async_client: AsyncClient,
+    db_session: AsyncSession,
+    test_seller: Seller,
+):
+    test_seller_2 = Seller(
+        first_name='Ivan', last_name='Godunov', email='ivan@mail.ru', hashed_password=hash_password('qwerty123')
+    )
+    db_session.add(test_seller_2)
+    await db_session.flush()
+
+    response = await async_client.get('/api/v1/seller/', params={'limit': 1})
+    assert response.status_code == status.HTTP_200_OK
+    first_page = response.json()
+    assert [seller['id'] for seller in first_page['sellers']] == [test_seller.id]
+
+    response = await async_client.get('/api/v1/seller/', params={'limit': 1, 'cursor': first_page['next_cursor']})
+    assert response.status_code == status.HTTP_200_OK
+    second_page = response.json()
+    assert [seller['id'] for seller in second_page['sellers']] == [test_seller_2.id]
+    assert second_page['next_cursor'] is None
+
+
 async def test_get_single_seller(
     async_client: AsyncClient,
     test_seller: Seller,
@@ -108,6 +137,74 @@ async def test_get_single_seller(
     }
 
 
+async def test_get_single_seller_not_modified(
+    async_client: AsyncClient,
+    db_session: AsyncSession,
+    test_seller: Seller,
+    test_book: Book,
+    jwt_token: str,
+):
+    headers = {'Authorization': f'Bearer {jwt_token}'}
+    response = await async_client.get(url=f'/api/v1/seller/{test_seller.id}', headers=headers)
+    etag = response.headers['ETag']
+
+    response = await async_client.get(
+        url=f'/api/v1/seller/{test_seller.id}',
+        headers={**headers, 'If-None-Match': etag},
+    )
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    # Изменение книги продавца меняет и ETag продавца.
+    await async_client.put(
+        url=f'/api/v1/books/{test_book.id}',
+        json={'title': '1984', 'author': 'George Orwell', 'year': 1949, 'pages': 328},
+        headers=headers,
+    )
+    # В тестах все запросы идут через одну сессию: забываем объекты, загруженные до UPDATE.
+    db_session.expunge_all()
+    response = await async_client.get(
+        url=f'/api/v1/seller/{test_seller.id}',
+        headers={**headers, 'If-None-Match': etag},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['books'][0]['title'] == '1984'
+
+
+async def test_get_seller_books(
+    async_client: AsyncClient,
+    db_session: AsyncSession,
+    test_seller: Seller,
+    test_book: Book,
+):
+    test_book_2 = Book(title='1984', author='George Orwell', year=1949, count_pages=328, seller_id=test_seller.id)
+    db_session.add(test_book_2)
+    await db_session.flush()
+
+    response = await async_client.get(f'/api/v1/seller/{test_seller.id}/books', params={'limit': 1})
+    assert response.status_code == status.HTTP_200_OK
+    first_page = response.json()
+    assert first_page['books'] == [
+        {
+            'id': test_book.id,
+            'title': 'Hogwarts',
+            'author': 'J.K. Rowling',
+            'year': 2024,
+            'count_pages': 450,
+            'seller_id': test_seller.id,
+        },
+    ]
+
+    response = await async_client.get(
+        f'/api/v1/seller/{test_seller.id}/books',
+        params={'limit': 1, 'cursor': first_page['next_cursor']},
+    )
+    assert [book['id'] for book in response.json()['books']] == [test_book_2.id]
+    assert response.json()['next_cursor'] is None
+
+    response = await async_client.get('/api/v1/seller/-1/books')
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
 async def test_get_nonexistent_seller(
     async_client: AsyncClient,
     test_seller: Seller,
@@ -152,3 +249,221 @@ async def test_update_seller(
     assert updated_seller.first_name == 'Hannah'
     assert updated_seller.last_name == 'Miller'
     assert updated_seller.email == 'joshuaward@gmail.com'
+
+
+async def test_delete_seller_invalidates_auth_cache(
+    db_session: AsyncSession,
+    async_client: AsyncClient,
+    test_seller: Seller,
+    jwt_token: str,
+):
+    response = await async_client.get(
+        url=f'/api/v1/seller/{test_seller.id}',
+        headers={'Authorization': f'Bearer {jwt_token}'},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert seller_cache.get(test_seller.email) is not None
+
+    response = await async_client.delete(f'/api/v1/seller/{test_seller.id}')
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert seller_cache.get(test_seller.email) is None
+    await db_session.flush()
+
+    response = await async_client.get(
+        url=f'/api/v1/seller/{test_seller.id}',
+        headers={'Authorization': f'Bearer {jwt_token}'},
+    )
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+async def test_delete_seller_with_books(
+    db_session: AsyncSession,
+    async_client: AsyncClient,
+    test_seller: Seller,
+    test_book: Book,
+):
+    response = await async_client.delete(f'/api/v1/seller/{test_seller.id}')
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+
+    assert (await db_session.execute(select(func.count()).select_from(Book))).scalar() == 0
+    assert (await db_session.execute(select(func.count()).select_from(Seller))).scalar() == 0
+
+
+async def test_update_seller_invalidates_auth_cache(
+    async_client: AsyncClient,
+    test_seller: Seller,
+    jwt_token: str,
+):
+    response = await async_client.get(
+        url=f'/api/v1/seller/{test_seller.id}',
+        headers={'Authorization': f'Bearer {jwt_token}'},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    old_email = test_seller.email
+    assert seller_cache.get(old_email) is not None
+
+    response = await async_client.put(
+        url=f'/api/v1/seller/{test_seller.id}',
+        json={'first_name': 'Hannah', 'last_name': 'Miller', 'email': 'joshuaward@gmail.com'},
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert response.json()['email'] == 'joshuaward@gmail.com'
+    assert seller_cache.get(old_email) is None
+
+
+async def test_update_and_delete_nonexistent_seller(async_client: AsyncClient):
+    response = await async_client.put(
+        url='/api/v1/seller/-1',
+        json={'first_name': 'Hannah', 'last_name': 'Miller', 'email': 'joshuaward@gmail.com'},
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    response = await async_client.delete('/api/v1/seller/-1')
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+# Воркеров нет: задачи выполняются явным вызовом run_next, чтобы тест не делил сессию с фоновой задачей.
+@pytest.fixture
+async def delete_queue(db_session: AsyncSession, monkeypatch):
+    monkeypatch.setattr(seller_delete_queue, 'max_concurrent', 0)
+    seller_delete_queue.start(lambda: nullcontext(db_session))
+    yield seller_delete_queue
+    await seller_delete_queue.stop()
+
+
+async def test_delete_seller_in_background(
+    db_session: AsyncSession,
+    async_client: AsyncClient,
+    delete_queue,
+    test_seller: Seller,
+    test_book: Book,
+    monkeypatch,
+):
+    db_session.add_all(
+        [
+            Book(title=f'Book {i}', author='Author', year=2000, count_pages=100, seller_id=test_seller.id)
+            for i in range(4)
+        ]
+    )
+    await db_session.flush()
+    # Маленькая пачка, чтобы удаление прошло в несколько транзакций.
+    monkeypatch.setattr('src.routers.v1.sellers.SELLER_DELETE_BATCH_SIZE', 2)
+
+    response = await async_client.delete(f'/api/v1/seller/{test_seller.id}', params={'background': True})
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    job = response.json()
+    assert job['kind'] == 'seller_delete'
+    assert job['status'] == 'pending'
+    assert job['total'] == 5
+
+    # Задача записана в БД, ее выполняет воркер очереди.
+    assert await delete_queue.run_next()
+    assert not await delete_queue.run_next()
+
+    response = await async_client.get(response.headers['Location'])
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['status'] == 'done'
+    assert response.json()['processed'] == 5
+
+    assert (await db_session.execute(select(func.count()).select_from(Book))).scalar() == 0
+    assert (await db_session.execute(select(func.count()).select_from(Seller))).scalar() == 0
+
+    response = await async_client.delete('/api/v1/seller/-1', params={'background': True})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    response = await async_client.get('/api/v1/jobs/unknown')
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+# Удаление, брошенное упавшим процессом на середине, заканчивает другой воркер: оставшиеся книги и продавец.
+async def test_abandoned_seller_delete_is_finished(
+    db_session: AsyncSession, async_client: AsyncClient, delete_queue, test_seller: Seller, test_book: Book
+):
+    heartbeat_at = datetime.now(timezone.utc) - timedelta(seconds=delete_queue.stale_after + 1)
+    job = Job(
+        kind=delete_queue.kind,
+        params={'seller_id': test_seller.id},
+        status='running',
+        total=3,
+        processed=2,
+        claim='dead',
+        heartbeat_at=heartbeat_at,
+    )
+    db_session.add(job)
+    await db_session.flush()
+
+    assert await delete_queue.run_next()
+
+    response = await async_client.get(f'/api/v1/jobs/{job.id}')
+    assert response.json()['status'] == 'done'
+    assert response.json()['processed'] == 3
+    assert (await db_session.execute(select(func.count()).select_from(Seller))).scalar() == 0
+
+
+async def test_seller_delete_queue_is_bounded(
+    async_client: AsyncClient, delete_queue, test_seller: Seller, monkeypatch
+):
+    monkeypatch.setattr(delete_queue, 'queue_size', 1)
+    response = await async_client.delete(f'/api/v1/seller/{test_seller.id}', params={'background': True})
+    assert response.status_code == status.HTTP_202_ACCEPTED
+
+    response = await async_client.delete(f'/api/v1/seller/{test_seller.id}', params={'background': True})
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert 'retry-after' in response.headers
+
+
+async def test_seller_rows_match_response_model(db_session: AsyncSession, test_seller: Seller):
+    rows = (await db_session.execute(select(*seller_rows.columns))).all()
+    sellers = (await db_session.execute(select(Seller))).scalars().all()
+    expected = dump_response(ReturnedAllSellers, {'sellers': sellers, 'next_cursor': None})
+    assert seller_rows.dump_page('sellers', rows) == expected
+
+
+async def test_get_sellers_sparse_fields(async_client: AsyncClient, test_seller: Seller, test_book: Book):
+    response = await async_client.get('/api/v1/seller/', params={'fields': 'email'})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['sellers'] == [{'email': test_seller.email}]
+
+    response = await async_client.get(f'/api/v1/seller/{test_seller.id}/books', params={'fields': 'id,title'})
+    assert response.json()['books'] == [{'id': test_book.id, 'title': test_book.title}]
+
+    response = await async_client.get('/api/v1/seller/', params={'fields': 'hashed_password'})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+async def test_get_single_seller_sparse_fields(
+    async_client: AsyncClient, test_seller: Seller, test_book: Book, jwt_token: str
+):
+    headers = {'Authorization': f'Bearer {jwt_token}'}
+    url = f'/api/v1/seller/{test_seller.id}'
+
+    response = await async_client.get(url, params={'fields': 'email'}, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {'email': test_seller.email}
+    etag = response.headers['ETag']
+
+    response = await async_client.get(url, params={'fields': 'id,books'}, headers=headers)
+    assert response.json()['id'] == test_seller.id
+    assert [book['id'] for book in response.json()['books']] == [test_book.id]
+    assert set(response.json()) == {'id', 'books'}
+    assert response.headers['ETag'] != etag
+
+    # Неполное представление не совпадает по ETag с полным.
+    response = await async_client.get(url, headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == status.HTTP_200_OK
+
+    response = await async_client.get(url, params={'fields': 'hashed_password'}, headers=headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+async def test_seller_stats(async_client: AsyncClient, test_seller: Seller, test_book: Book):
+    response = await async_client.get(f'/api/v1/seller/{test_seller.id}/stats')
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['books_count'] == 1
+
+    # Книги удаляются каскадом вместе с продавцом, триггеры убирают их и из статистики каталога.
+    await async_client.delete(f'/api/v1/seller/{test_seller.id}')
+    response = await async_client.get(f'/api/v1/seller/{test_seller.id}/stats')
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    response = await async_client.get('/api/v1/books/stats')
+    assert response.json() == {'books_count': 0, 'total_pages': 0, 'years': [], 'top_authors': []}
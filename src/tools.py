@@ -1,25 +1,110 @@
+import asyncio
+import threading
+import time
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import astuple, dataclass
 from datetime import datetime, timedelta
-from typing import Annotated, Optional
+from typing import Annotated, Any, Callable, Collection, Optional, Sequence
 
-from fastapi import Depends, HTTPException
+import orjson
+from fastapi import Depends, Header, HTTPException, Query, Response
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt  # noqa: python-jose in fact
 from passlib.context import CryptContext
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel
+from sqlalchemy import ColumnElement, Select, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import InstrumentedAttribute
 from starlette import status
 
-from src.configurations import get_async_session
+from src.admission import AdmissionController
+from src.batching import InsertBatcher
+from src.cache import CachedResponse, LRUCache, ResponseCache
+from src.configurations import get_async_read_session, get_async_session, get_read_session_factory, get_session_factory
 from src.configurations.settings import settings
-from src.models import Seller
+from src.exports import ExportManager
+from src.jobs import JobQueue
+from src.metrics import RouteMetrics
+from src.models import Book, Seller
+from src.schemas import ReturnedBookWithSellerId, ReturnedSeller, ReturnedSellerWithBooks
+from src.stats import CatalogStatsCompactor
 
 ACCESS_TOKEN_ALGORITHM = 'HS256'
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Сколько авторов возвращает статистика книг по умолчанию и максимум.
+DEFAULT_TOP_AUTHORS = 10
+MAX_TOP_AUTHORS = 100
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='api/v1/token/')
-pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto', bcrypt__rounds=settings.bcrypt_rounds)
+
+# token -> email и email -> данные продавца. Записи токенов живут не дольше срока действия самого токена.
+# Кэши локальны для процесса: в других воркерах изменения продавца станут видны не позже auth_cache_ttl_seconds.
+token_cache = LRUCache(maxsize=settings.auth_cache_size, ttl=settings.auth_cache_ttl_seconds)
+seller_cache = LRUCache(maxsize=settings.auth_cache_size, ttl=settings.auth_cache_ttl_seconds)
+
+# Кэш готовых тел ответов для ручек чтения книг и продавцов.
+response_cache = ResponseCache(LRUCache(maxsize=settings.response_cache_size, ttl=settings.response_cache_ttl_seconds))
+
+# Воркеры фонового удаления продавцов (очередь общая для процессов, в БД). Запускаются в lifespan приложения,
+# обработчик задачи — в src.routers.v1.sellers.
+seller_delete_queue = JobQueue(
+    kind='seller_delete',
+    max_concurrent=settings.seller_delete_max_concurrent_jobs,
+    queue_size=settings.seller_delete_queue_size,
+    ttl=settings.seller_delete_ttl_seconds,
+    cleanup_interval=settings.seller_delete_cleanup_interval_seconds,
+    poll_interval=settings.job_poll_interval_seconds,
+    stale_after=settings.job_stale_seconds,
+)
+
+# Воркеры фоновых выгрузок каталога (очередь общая для процессов, в БД). Запускаются в lifespan приложения.
+export_manager = ExportManager(
+    directory=settings.export_dir,
+    max_concurrent=settings.export_max_concurrent_jobs,
+    queue_size=settings.export_queue_size,
+    ttl=settings.export_ttl_seconds,
+    cleanup_interval=settings.export_cleanup_interval_seconds,
+    poll_interval=settings.job_poll_interval_seconds,
+    stale_after=settings.job_stale_seconds,
+)
+
+# Фоновое сжатие дельт статистики каталога. Запускается в lifespan приложения.
+catalog_stats_compactor = CatalogStatsCompactor(interval=settings.catalog_stats_compact_interval_seconds)
+
+# Метрики HTTP-запросов по маршрутам, собираются MetricsMiddleware.
+route_metrics = RouteMetrics()
+
+# Пачки одновременных вставок книг для create_book (включается настройкой book_write_batching).
+book_batcher = InsertBatcher(
+    Book,
+    max_size=settings.book_write_batch_size,
+    max_delay=settings.book_write_batch_delay_ms / 1000,
+    returning=(Book.id, Book.version),
+)
+
+# Лимиты одновременных запросов по группам ручек, применяются AdmissionControlMiddleware.
+admission_controller = AdmissionController(
+    limits={
+        'read': settings.admission_read_limit,
+        'write': settings.admission_write_limit,
+        'auth': settings.admission_auth_limit,
+    },
+    queue_size=settings.admission_queue_size,
+    queue_timeout=settings.admission_queue_timeout_seconds,
+    retry_after=settings.admission_retry_after_seconds,
+)
 
 DBSession = Annotated[AsyncSession, Depends(get_async_session)]
+DBReadSession = Annotated[AsyncSession, Depends(get_async_read_session)]
+SessionFactory = Annotated[async_sessionmaker[AsyncSession], Depends(get_session_factory)]
+ReadSessionFactory = Annotated[async_sessionmaker[AsyncSession], Depends(get_read_session_factory)]
+IfNoneMatch = Annotated[Optional[str], Header(include_in_schema=False)]
+TopAuthors = Annotated[int, Query(ge=1, le=MAX_TOP_AUTHORS, description='Сколько авторов вернуть в top_authors')]
 
 
 class UnauthorizedException(HTTPException):
@@ -31,6 +116,16 @@ class UnauthorizedException(HTTPException):
         )
 
 
+class InvalidCursorException(HTTPException):
+    def __init__(self, detail: str = 'Invalid cursor'):
+        super().__init__(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+
+class InvalidFieldsException(HTTPException):
+    def __init__(self, detail: str = 'Unknown fields'):
+        super().__init__(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+
 def hash_password(password: str) -> str:
     """Возвращает хэшированный пароль."""
     return pwd_context.hash(password)
@@ -41,6 +136,64 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+class PasswordHasher:
+    """
+    Выполняет хэширование и проверку паролей в ограниченном пуле потоков.
+    bcrypt отпускает GIL, поэтому потоки действительно работают параллельно, а event loop остается свободным.
+    """
+
+    def __init__(self, max_workers: int):
+        self._max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='password-hasher')
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._started = 0
+        self._completed = 0
+
+    def _run(self, func: Callable, *args: Any) -> Any:
+        with self._lock:
+            self._started += 1
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self._completed += 1
+
+    async def _submit(self, func: Callable, *args: Any) -> Any:
+        with self._lock:
+            self._submitted += 1
+        future = self._executor.submit(self._run, func, *args)
+        try:
+            return await asyncio.wrap_future(future)
+        finally:
+            # Отмена ожидающей корутины отменяет и задачу, если пул еще не взял ее в работу:
+            # такая задача уже никогда не начнется и не должна числиться в очереди.
+            if future.cancelled():
+                with self._lock:
+                    self._submitted -= 1
+
+    async def hash(self, password: str) -> str:
+        """Возвращает хэшированный пароль, не блокируя event loop."""
+        return await self._submit(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """Проверяет пароль, не блокируя event loop."""
+        return await self._submit(verify_password, plain_password, hashed_password)
+
+    def stats(self) -> dict[str, int]:
+        """Возвращает текущую загрузку пула: сколько задач ждут в очереди и сколько выполняется."""
+        with self._lock:
+            return {
+                'workers': self._max_workers,
+                'queued': self._submitted - self._started,
+                'in_flight': self._started - self._completed,
+                'completed': self._completed,
+            }
+
+
+password_hasher = PasswordHasher(max_workers=settings.password_hasher_workers)
+
+
 def generate_token(claims: dict, expires_delta: Optional[timedelta] = None):
     """Возвращает сгенерированный jwt токен."""
     if expires_delta is None:
@@ -55,8 +208,14 @@ def generate_token(claims: dict, expires_delta: Optional[timedelta] = None):
     )
 
 
-def get_email_from_token(access_token: Annotated[str, Depends(oauth2_scheme)]) -> str:
-    """Возвращает email из токена."""
+async def get_email_from_token(access_token: Annotated[str, Depends(oauth2_scheme)]) -> str:
+    """
+    Возвращает email из токена.
+    Зависимость асинхронная: синхронную FastAPI выполнил бы в пуле потоков, а token_cache не потокобезопасен.
+    """
+    if seller_email := token_cache.get(access_token):
+        return seller_email
+
     try:
         payload = jwt.decode(
             token=access_token,
@@ -70,18 +229,330 @@ def get_email_from_token(access_token: Annotated[str, Depends(oauth2_scheme)]) -
     if not seller_email:
         raise UnauthorizedException()
 
+    if expire := payload.get('exp'):
+        token_cache.set(access_token, seller_email, ttl=expire - time.time())
     return seller_email
 
 
 async def get_current_seller(
-    db_session: DBSession,
+    session_factory: ReadSessionFactory,
     seller_email: Annotated[str, Depends(get_email_from_token)],
 ) -> Seller:
-    """Возвращает продавца из токена."""
+    """
+    Возвращает продавца из токена.
+    Продавец читается в собственной короткой сессии: ее соединение возвращается в пул до того, как обработчик
+    возьмет свое, поэтому авторизованный запрос не держит два соединения сразу.
+    """
+    if seller_data := seller_cache.get(seller_email):
+        # Объект не привязан к сессии: он нужен только для авторизации и seller.id.
+        return Seller(**seller_data)
+
     stmt = select(Seller).where(Seller.email == seller_email)
-    db_result = await db_session.execute(stmt)
-    seller = db_result.scalar_one_or_none()
+    async with session_factory() as session:
+        seller = (await session.execute(stmt)).scalar_one_or_none()
     if not seller:
         raise UnauthorizedException()
 
+    seller_cache.set(
+        seller_email,
+        {'id': seller.id, 'first_name': seller.first_name, 'last_name': seller.last_name, 'email': seller.email},
+    )
     return seller
+
+
+def invalidate_seller_cache(seller_email: str) -> None:
+    """Сбрасывает закэшированные данные продавца. Вызывается после коммита изменения или удаления продавца."""
+    seller_cache.delete(seller_email)
+
+
+def encode_cursor(*values: Any) -> str:
+    """Возвращает непрозрачный курсор, указывающий на последнюю отданную запись."""
+    return urlsafe_b64encode(orjson.dumps(values)).decode()
+
+
+def decode_cursor(cursor: str) -> list:
+    """Восстанавливает значения из курсора, полученного от клиента."""
+    try:
+        values = orjson.loads(urlsafe_b64decode(cursor.encode()))
+    except ValueError:  # в т.ч. binascii.Error и orjson.JSONDecodeError
+        raise InvalidCursorException()
+
+    if not isinstance(values, list) or not values:
+        raise InvalidCursorException()
+
+    return values
+
+
+@dataclass
+class PageParams:
+    """Параметры постраничной выдачи (keyset-пагинация по id)."""
+
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+    cursor: Optional[str] = Query(None, description='Значение next_cursor из предыдущего ответа.')
+    full_scan: bool = Query(False, description='Вернуть все записи без пагинации. Может быть медленно!')
+
+
+Page = Annotated[PageParams, Depends()]
+
+
+@dataclass
+class BookFilterParams:
+    """Фильтры списка книг. Каждому фильтру соответствует составной индекс (поле, id) на books_table."""
+
+    author: Optional[str] = Query(None, max_length=100, description='Точное совпадение с автором.')
+    year_from: Optional[int] = None
+    year_to: Optional[int] = None
+    seller_id: Optional[int] = None
+    pages_from: Optional[int] = Query(None, ge=0)
+    pages_to: Optional[int] = Query(None, ge=0)
+
+    def apply(self, query: Select) -> Select:
+        if self.author is not None:
+            query = query.where(Book.author == self.author)
+        if self.year_from is not None:
+            query = query.where(Book.year >= self.year_from)
+        if self.year_to is not None:
+            query = query.where(Book.year <= self.year_to)
+        if self.seller_id is not None:
+            query = query.where(Book.seller_id == self.seller_id)
+        if self.pages_from is not None:
+            query = query.where(Book.count_pages >= self.pages_from)
+        if self.pages_to is not None:
+            query = query.where(Book.count_pages <= self.pages_to)
+        return query
+
+    def cache_params(self) -> tuple:
+        return astuple(self)
+
+
+BookFilters = Annotated[BookFilterParams, Depends()]
+
+
+async def paginate(
+    session: AsyncSession,
+    query: Select,
+    id_column: InstrumentedAttribute,
+    page: PageParams,
+) -> tuple[list, Optional[str]]:
+    """
+    Возвращает одну страницу выборки и курсор следующей страницы (None, если страница последняя).
+    Для выборки одной ORM-сущности возвращаются объекты, для выборки колонок — строки (Row) с колонкой id.
+    """
+    query = query.order_by(id_column)
+    description = query.column_descriptions[0]
+    as_scalars = len(query.column_descriptions) == 1 and description['expr'] is description['entity']
+
+    if page.full_scan:
+        db_result = await session.execute(query)
+        return list(db_result.scalars().all() if as_scalars else db_result.all()), None
+
+    if page.cursor is not None:
+        values = decode_cursor(page.cursor)
+        if len(values) != 1 or not isinstance(values[0], int):
+            raise InvalidCursorException()
+        query = query.where(id_column > values[0])
+
+    # Запрашиваем на одну запись больше, чтобы понять, есть ли следующая страница.
+    db_result = await session.execute(query.limit(page.limit + 1))
+    items = list(db_result.scalars().all() if as_scalars else db_result.all())
+
+    if len(items) <= page.limit:
+        return items, None
+
+    items = items[: page.limit]
+    return items, encode_cursor(items[-1].id)
+
+
+def dump_response(model: type[BaseModel], content: Any) -> bytes:
+    """Сериализует ответ так же, как это делает FastAPI для response_model и ORJSONResponse."""
+    return orjson.dumps(model.model_validate(content, from_attributes=True).model_dump(mode='json', by_alias=True))
+
+
+class RowSerializer:
+    """
+    Быстрая сериализация списков: строки выборки превращаются в JSON напрямую, без моделей Pydantic.
+    Колонки выбираются в порядке и под именами полей модели ответа, поэтому результат совпадает с dump_response.
+    Подходит только для моделей из простых полей (int, str), которые orjson сериализует так же, как Pydantic.
+    """
+
+    def __init__(self, model: type[BaseModel], entity: Any, fields: Optional[Collection[str]] = None):
+        self._model = model
+        self._entity = entity
+        self._attributes = {field.alias or name: name for name, field in model.model_fields.items()}
+        self._subsets: dict[frozenset[str], RowSerializer] = {}
+        self.fields = tuple(name for name in self._attributes if fields is None or name in fields)
+        self.columns = tuple(getattr(entity, self._attributes[name]).label(name) for name in self.fields)
+        # id нужен для курсора пагинации, даже если клиент его не запросил: колонка идет после полей ответа.
+        if 'id' not in self.fields:
+            self.columns += (entity.id.label('id'),)
+
+    @property
+    def etag_parts(self) -> tuple[str, ...]:
+        """Часть ETag, отличающая неполное представление от полного."""
+        return () if len(self.fields) == len(self._attributes) else ('.'.join(self.fields),)
+
+    def only(self, fields: Collection[str]) -> 'RowSerializer':
+        """Сериализатор только перечисленных полей (sparse fieldset). Для неизвестных полей — ValueError."""
+        if unknown := set(fields) - set(self._attributes):
+            raise ValueError(f'Unknown fields: {", ".join(sorted(unknown))}')
+
+        key = frozenset(fields)
+        if (subset := self._subsets.get(key)) is None:
+            subset = self._subsets[key] = RowSerializer(self._model, self._entity, key)
+        return subset
+
+    def dump_one(self, row: Sequence[Any]) -> bytes:
+        """Сериализует одну строку. Лишние колонки в конце строки отбрасываются."""
+        return orjson.dumps(dict(zip(self.fields, row)))
+
+    def dump_page(self, key: str, rows: Sequence[Any], next_cursor: Optional[str] = None) -> bytes:
+        """Сериализует страницу {key: [...], 'next_cursor': ...}. Лишние колонки в конце строки отбрасываются."""
+        fields = self.fields
+        return orjson.dumps({key: [dict(zip(fields, row)) for row in rows], 'next_cursor': next_cursor})
+
+
+# Сериализаторы строк для списочных ручек книг и продавцов.
+book_rows = RowSerializer(ReturnedBookWithSellerId, Book)
+seller_rows = RowSerializer(ReturnedSeller, Seller)
+
+
+def sparse_fields(serializer: RowSerializer) -> Callable[..., RowSerializer]:
+    """Зависимость для параметра fields=: возвращает сериализатор, выбирающий только запрошенные поля."""
+
+    description = f'Поля ответа через запятую: {",".join(serializer.fields)}.'
+
+    # async: кэш подмножеств сериализатора меняется только из event loop, не из пула потоков.
+    async def dependency(fields: Annotated[Optional[str], Query(description=description)] = None) -> RowSerializer:
+        if fields is None:
+            return serializer
+        try:
+            return serializer.only([name.strip() for name in fields.split(',')])
+        except ValueError as e:
+            raise InvalidFieldsException(str(e))
+
+    return dependency
+
+
+BookFields = Annotated[RowSerializer, Depends(sparse_fields(book_rows))]
+SellerFields = Annotated[RowSerializer, Depends(sparse_fields(seller_rows))]
+
+
+@dataclass(frozen=True)
+class SellerWithBooksFieldset:
+    """
+    Поля ответа GET /seller/{seller_id}: колонки продавца и признак, нужны ли его книги.
+    Книги загружаются отдельным запросом, поэтому без поля books он не выполняется.
+    """
+
+    seller: RowSerializer
+    with_books: bool
+
+    @property
+    def fields(self) -> tuple[str, ...]:
+        return self.seller.fields + (('books',) if self.with_books else ())
+
+    @property
+    def etag_parts(self) -> tuple[str, ...]:
+        """Часть ETag, отличающая неполное представление от полного."""
+        return () if self.with_books and not self.seller.etag_parts else ('.'.join(self.fields),)
+
+    def dump(self, seller: Seller) -> bytes:
+        """Сериализует продавца с загруженными книгами, оставляя только запрошенные поля."""
+        content = ReturnedSellerWithBooks.model_validate(seller, from_attributes=True)
+        return orjson.dumps(content.model_dump(mode='json', by_alias=True, include=set(self.fields)))
+
+
+async def seller_with_books_fields(
+    fields: Annotated[
+        Optional[str], Query(description=f'Поля ответа через запятую: {",".join(seller_rows.fields)},books.')
+    ] = None,
+) -> SellerWithBooksFieldset:
+    if fields is None:
+        return SellerWithBooksFieldset(seller_rows, with_books=True)
+    names = [name.strip() for name in fields.split(',')]
+    try:
+        return SellerWithBooksFieldset(
+            seller_rows.only([name for name in names if name != 'books']), with_books='books' in names
+        )
+    except ValueError as e:
+        raise InvalidFieldsException(str(e))
+
+
+SellerWithBooksFields = Annotated[SellerWithBooksFieldset, Depends(seller_with_books_fields)]
+
+
+def json_response(
+    body: bytes,
+    status_code: int = status.HTTP_200_OK,
+    etag: Optional[str] = None,
+    headers: Optional[dict[str, str]] = None,
+) -> Response:
+    """Возвращает уже сериализованное тело ответа без повторной обработки FastAPI."""
+    headers = {**(headers or {}), 'ETag': etag} if etag else headers
+    return Response(content=body, status_code=status_code, media_type='application/json', headers=headers)
+
+
+def make_etag(*parts: Any) -> str:
+    """Возвращает сильный ETag из версий данных, на основе которых построен ответ."""
+    return '"' + '-'.join(map(str, parts)) + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Проверяет заголовок If-None-Match. Для него по RFC 9110 используется слабое сравнение."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return etag in (tag.strip().removeprefix('W/') for tag in if_none_match.split(','))
+
+
+def not_modified_response(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+
+def cached_json_response(cached: CachedResponse, if_none_match: Optional[str] = None) -> Response:
+    """Возвращает 304 Not Modified, если у клиента актуальная версия ответа, иначе сам ответ."""
+    if etag_matches(if_none_match, cached.etag):
+        return not_modified_response(cached.etag)
+    return json_response(cached.body, etag=cached.etag)
+
+
+async def get_collection_etag(
+    session: AsyncSession,
+    count: ColumnElement[int],
+    version_column: InstrumentedAttribute,
+    *where: Any,
+    representation: Sequence[str] = (),
+) -> str:
+    """
+    Возвращает ETag для списка по (count, max(version)) таблицы или ее части, заданной условиями where.
+    Версии берутся из общей для таблицы последовательности, поэтому любая вставка или изменение
+    увеличивает max(version), а удаление уменьшает count. representation различает варианты ответа (набор полей).
+    count — выражение над поддерживаемым счетчиком (см. src.stats), а max(version) читается по индексу с version:
+    стоимость запроса не зависит от размера таблицы.
+    """
+    query = select(count, func.coalesce(func.max(version_column), 0)).where(*where)
+    db_result = await session.execute(query)
+    count, max_version = db_result.one()
+    return make_etag(count, max_version, *representation)
+
+
+def invalidate_book_responses(seller_id: int, book_id: Optional[int] = None) -> None:
+    """
+    Сбрасывает кэш ответов, в которые могла попасть измененная книга.
+    Вызывается после коммита изменения (см. on_commit): чтение, пришедшее между сбросом и коммитом,
+    иначе закэширует старые данные до истечения TTL.
+    """
+    if book_id is not None:
+        response_cache.invalidate('book', book_id)
+    response_cache.invalidate('books')
+    # Книги продавца входят в ответы get_seller и get_seller_books.
+    response_cache.invalidate('seller', seller_id)
+    response_cache.invalidate(f'seller:{seller_id}:books')
+
+
+def invalidate_seller_responses(seller_id: Optional[int] = None) -> None:
+    """Сбрасывает кэш ответов, в которые мог попасть измененный продавец. Вызывается после коммита изменения."""
+    if seller_id is not None:
+        response_cache.invalidate('seller', seller_id)
+    response_cache.invalidate('sellers')